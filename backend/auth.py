@@ -1,10 +1,12 @@
 import logging
+import time
 from fastapi import FastAPI, APIRouter, HTTPException, Depends
 from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from jose import exceptions as jose_exceptions
 import os
 from dotenv import load_dotenv
+from backend.cache import LRUCache, MISSING
 from backend.db import users_collection, playlists_collection
 
 
@@ -12,32 +14,45 @@ from backend.db import users_collection, playlists_collection
 load_dotenv()
 
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 SECRET_KEY = os.getenv("SECRET_KEY", "$1230902_1698")  
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 720  # Token expiry time
 
+# Recently verified tokens and their payloads, each kept until the token's
+# own exp. Keyed on the whole token, so a hit skips exactly the signature
+# check that already passed for those bytes.
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 4096))
+token_cache = LRUCache(TOKEN_CACHE_SIZE, name="verified_tokens") if TOKEN_CACHE_SIZE > 0 else None
+
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
     expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-from fastapi import HTTPException
-
 def verify_access_token(token: str):
-    logger.debug(f"Verifying token: {token[:10]}...")
+    if token_cache is not None:
+        payload = token_cache.get(token)
+        if payload is not MISSING:
+            return dict(payload)
+
+    # %-style arguments: nothing is formatted unless DEBUG is enabled
+    logger.debug("Verifying token: %s...", token[:10])
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        logger.debug(f"Token valid for user: {payload.get('sub')}")
-        return payload
+        logger.debug("Token valid for user: %s", payload.get("sub"))
     except jose_exceptions.ExpiredSignatureError:
-        logger.error("Token has expired")
+        logger.info("Token has expired")
         raise HTTPException(status_code=401, detail="Token has expired")
-    except jose.exceptions.JWTError as e:
-        logger.error(f"JWT validation error: {str(e)}")
+    except JWTError as e:
+        logger.warning("JWT validation error: %s", e)
         raise HTTPException(status_code=401, detail="Could not validate credentials")
     except Exception as e:
-        logger.error(f"Unexpected error during token verification: {str(e)}")
-        raise HTTPException(status_code=401, detail="Authentication error")
\ No newline at end of file
+        logger.error("Unexpected error during token verification: %s", e)
+        raise HTTPException(status_code=401, detail="Authentication error")
+
+    remaining = payload.get("exp", 0) - time.time()
+    if token_cache is not None and remaining > 0:
+        token_cache.set(token, payload, ttl=remaining)
+    return dict(payload)
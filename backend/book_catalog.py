@@ -0,0 +1,247 @@
+"""Local book catalog with an IVF nearest-neighbour index.
+
+Book descriptions are embedded with the same encoder as song tags, so a song
+can be matched directly against books instead of going through a genre and
+a Google Books query. Build a catalog from a JSONL or CSV dump with:
+
+    python -m backend.book_catalog --input books.jsonl --output-dir catalog/
+
+Each record needs a title; author, description, categories, rating,
+cover_url and id (Google Books volume id) are used when present. Point
+BOOK_CATALOG_DIR at the output directory to enable it.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from .encoder import ENCODER_STAMP, encode_normalized
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION = 1
+BOOK_CATALOG_DIR = os.getenv("BOOK_CATALOG_DIR")
+# Inverted lists scanned per query; more lists, better recall, slower search
+BOOK_CATALOG_NPROBE = int(os.getenv("BOOK_CATALOG_NPROBE", 8))
+
+MANIFEST_FILE = "manifest.json"
+BOOKS_FILE = "books.jsonl"
+EMBEDDINGS_FILE = "embeddings.npy"
+SCALES_FILE = "scales.npy"
+CENTROIDS_FILE = "centroids.npy"
+LIST_OFFSETS_FILE = "list_offsets.npy"
+LIST_IDS_FILE = "list_ids.npy"
+
+
+def read_book_dump(path):
+    if path.endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    books = []
+    for row in rows:
+        if not row.get("title"):
+            continue
+        categories = row.get("categories") or []
+        if isinstance(categories, str):
+            categories = [c.strip() for c in categories.split("|") if c.strip()]
+        rating = row.get("rating")
+        books.append({
+            "title": row["title"],
+            "author": row.get("author") or "Unknown Author",
+            "description": row.get("description") or "No description available",
+            "cover_url": row.get("cover_url") or None,
+            "rating": float(rating) if rating not in (None, "") else None,
+            "genres": categories,
+            "google_books_id": row.get("id") or row.get("google_books_id") or None,
+        })
+    return books
+
+
+def book_text(book):
+    return " ".join(filter(None, [book["title"], ", ".join(book["genres"]), book["description"]]))
+
+
+# Spherical k-means on unit vectors; returns unit-norm centroids
+def train_centroids(vectors, nlist, iterations=10, sample_size=50000, seed=0):
+    rng = np.random.default_rng(seed)
+    sample = vectors[rng.choice(len(vectors), size=min(sample_size, len(vectors)), replace=False)]
+    centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = (sample @ centroids.T).argmax(axis=1)
+        for c in range(nlist):
+            members = sample[assignments == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids.astype(np.float32)
+
+
+def assign_lists(vectors, centroids, chunk_size=65536):
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk_size):
+        chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+        assignments[start:start + chunk_size] = (chunk @ centroids.T).argmax(axis=1)
+    return assignments
+
+
+# Store rows as float16, or int8 with one float32 scale per row
+def quantize(vectors, dtype):
+    if dtype == "float16":
+        return vectors.astype(np.float16), None
+    scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+
+def build_catalog(books, output_dir, dtype="float16", nlist=None, batch_size=256):
+    vectors = np.concatenate([
+        encode_normalized([book_text(book) for book in books[start:start + batch_size]])
+        for start in range(0, len(books), batch_size)
+    ])
+    write_catalog(books, vectors, output_dir, dtype=dtype, nlist=nlist)
+    return vectors
+
+
+# Write books and their unit-norm embeddings as a catalog directory
+def write_catalog(books, vectors, output_dir, dtype="float16", nlist=None):
+    nlist = nlist or max(1, int(np.sqrt(len(books))))
+    centroids = train_centroids(vectors, nlist)
+    assignments = assign_lists(vectors, centroids)
+
+    # Rows are stored grouped by list, so list c is the contiguous slice
+    # list_offsets[c]:list_offsets[c + 1]; list_ids maps a row back to its book
+    order = np.argsort(assignments, kind="stable").astype(np.int32)
+    counts = np.bincount(assignments, minlength=nlist)
+    offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    stored, scales = quantize(vectors[order], dtype)
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, EMBEDDINGS_FILE), stored)
+    if scales is not None:
+        np.save(os.path.join(output_dir, SCALES_FILE), scales)
+    np.save(os.path.join(output_dir, CENTROIDS_FILE), centroids)
+    np.save(os.path.join(output_dir, LIST_OFFSETS_FILE), offsets)
+    np.save(os.path.join(output_dir, LIST_IDS_FILE), order)
+    with open(os.path.join(output_dir, BOOKS_FILE), "w", encoding="utf-8") as f:
+        for book in books:
+            f.write(json.dumps(book) + "\n")
+
+    digest = hashlib.sha256(stored.tobytes()).hexdigest()[:16]
+    with open(os.path.join(output_dir, MANIFEST_FILE), "w") as f:
+        json.dump({
+            "version": CATALOG_VERSION,
+            "model": ENCODER_STAMP,
+            "dtype": dtype,
+            "count": len(books),
+            "dim": int(vectors.shape[1]),
+            "nlist": nlist,
+            # Changes whenever the catalog contents change
+            "catalog_version": f"{CATALOG_VERSION}-{digest}",
+        }, f)
+
+
+class BookCatalog:
+    def __init__(self, directory):
+        with open(os.path.join(directory, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("version") != CATALOG_VERSION or self.manifest.get("model") != ENCODER_STAMP:
+            raise ValueError("book catalog was built for a different version, model or encoder backend")
+        self.catalog_version = self.manifest["catalog_version"]
+        # The embedding matrix is memory-mapped: workers share the page cache
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        scales_path = os.path.join(directory, SCALES_FILE)
+        self.scales = np.load(scales_path) if os.path.exists(scales_path) else None
+        self.centroids = np.load(os.path.join(directory, CENTROIDS_FILE))
+        self.list_offsets = np.load(os.path.join(directory, LIST_OFFSETS_FILE))
+        self.list_ids = np.load(os.path.join(directory, LIST_IDS_FILE))
+        with open(os.path.join(directory, BOOKS_FILE), encoding="utf-8") as f:
+            self.books = [json.loads(line) for line in f]
+
+    def __len__(self):
+        return len(self.books)
+
+    def _scores(self, start, stop, query):
+        rows = np.asarray(self.embeddings[start:stop], dtype=np.float32)
+        scores = rows @ query
+        if self.scales is not None:
+            scores *= self.scales[start:stop]
+        return scores
+
+    def vector(self, book_id):
+        # Dequantized embedding of one book
+        row = int(np.flatnonzero(self.list_ids == book_id)[0])
+        vector = np.asarray(self.embeddings[row], dtype=np.float32)
+        return vector * self.scales[row] if self.scales is not None else vector
+
+    def _top_k(self, ids, scores, k):
+        if len(ids) > k:
+            keep = np.argpartition(-scores, k)[:k]
+            ids, scores = ids[keep], scores[keep]
+        order = np.argsort(-scores)
+        return ids[order], scores[order]
+
+    def search(self, query, k=5, nprobe=BOOK_CATALOG_NPROBE):
+        """Approximate top-k books for a unit-norm query vector, as
+        (book ids, cosine scores), best first."""
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe, len(self.centroids))
+        lists = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        # Each probed list is a contiguous block of rows: no gather needed
+        spans = [(self.list_offsets[c], self.list_offsets[c + 1]) for c in lists]
+        ids = np.concatenate([self.list_ids[start:stop] for start, stop in spans])
+        if not len(ids):
+            return ids, np.empty(0, dtype=np.float32)
+        scores = np.concatenate([self._scores(start, stop, query) for start, stop in spans])
+        return self._top_k(ids, scores, k)
+
+    def search_exact(self, query, k=5):
+        # Brute force over every book; the reference for recall measurements
+        scores = self._scores(0, len(self.books), np.asarray(query, dtype=np.float32))
+        return self._top_k(self.list_ids, scores, k)
+
+
+_catalog = None
+_catalog_loaded = False
+_catalog_lock = threading.Lock()
+
+
+def get_book_catalog():
+    """The catalog in BOOK_CATALOG_DIR, or None when it is not configured."""
+    global _catalog, _catalog_loaded
+    if not _catalog_loaded:
+        with _catalog_lock:
+            if not _catalog_loaded:
+                if BOOK_CATALOG_DIR:
+                    try:
+                        _catalog = BookCatalog(BOOK_CATALOG_DIR)
+                        logger.info(f"Loaded book catalog with {len(_catalog)} books from {BOOK_CATALOG_DIR}")
+                    except (OSError, ValueError, KeyError) as e:
+                        logger.error(f"Could not load book catalog from {BOOK_CATALOG_DIR}: {e}")
+                _catalog_loaded = True
+    return _catalog
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the local book catalog and its ANN index")
+    parser.add_argument("--input", required=True, help="JSONL or CSV book dump")
+    parser.add_argument("--output-dir", default=BOOK_CATALOG_DIR or "catalog")
+    parser.add_argument("--dtype", choices=("float16", "int8"), default="float16")
+    parser.add_argument("--nlist", type=int, default=None, help="number of IVF lists (default sqrt(n))")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    books = read_book_dump(args.input)
+    build_catalog(books, args.output_dir, dtype=args.dtype, nlist=args.nlist)
+    logger.info(f"Wrote catalog of {len(books)} books to {args.output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""Keeps the Google Books results for every book genre warm.
+
+Songs only ever map to a book genre the genre mapping points at, or the
+DEFAULT_BOOK_GENRE fallback, and requests ask for a few result sizes. So
+every subject search the app makes is known in advance: each of those
+genres at each of BOOK_PREFETCH_MAX_RESULTS. Book genres no music genre
+maps to are never searched, and cost no quota. The prefetcher fetches all
+of them when the app starts. It then refreshes each one on its own schedule, a jittered fraction
+of the client's freshness window, so the keys neither expire nor refresh
+all at once. Requests are answered from the client's cache and never wait
+on Google Books.
+
+A failed refresh is retried after BOOK_PREFETCH_RETRY_SECONDS. Meanwhile
+the client keeps serving the previous result, because the client's cache
+is stale-while-revalidate (see GoogleBooksClient).
+
+Prefetching is off unless BOOK_PREFETCH is set. With several workers (the
+prefork launcher, uvicorn --workers, several hosts) every worker starts a
+prefetcher, but only the holder of the "book_prefetch" lease in the
+``leases`` collection refreshes; the others check for a lapsed lease every
+BOOK_PREFETCH_LEASE_SECONDS / 3 and take over if its holder is gone. The
+refreshed results reach the other workers through the client's shared
+Mongo tier (GOOGLE_BOOKS_CACHE_MONGO, on by default with BOOK_PREFETCH).
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .db import AsyncCollection
+from .genres import DEFAULT_BOOK_GENRE, get_genre_mapping
+from .google_books import google_books_client
+
+logger = logging.getLogger(__name__)
+
+# Google Books accepts maxResults from 1 to 40
+MAX_RESULTS_LIMIT = 40
+
+
+def _parse_sizes(value):
+    try:
+        sizes = tuple(dict.fromkeys(int(n) for n in value.split(",") if n.strip()))
+    except ValueError:
+        sizes = ()
+    if not sizes or not all(1 <= n <= MAX_RESULTS_LIMIT for n in sizes):
+        logger.error(f"Invalid BOOK_PREFETCH_MAX_RESULTS {value!r}, expected sizes from 1 to "
+                     f"{MAX_RESULTS_LIMIT} separated by commas; prefetching 5 results per genre")
+        return (5,)
+    return sizes
+
+
+BOOK_PREFETCH_ENABLED = os.getenv("BOOK_PREFETCH", "false").lower() in ("1", "true", "yes")
+# Result sizes kept warm; 5 is the default max_results and what is materialized
+BOOK_PREFETCH_MAX_RESULTS = _parse_sizes(os.getenv("BOOK_PREFETCH_MAX_RESULTS", "5,10"))
+# Refresh a key after this share of the freshness window...
+BOOK_PREFETCH_REFRESH_FRACTION = float(os.getenv("BOOK_PREFETCH_REFRESH_FRACTION", 0.8))
+# ...give or take this share of it
+BOOK_PREFETCH_JITTER = float(os.getenv("BOOK_PREFETCH_JITTER", 0.1))
+# Searches in flight at once, so warming up does not burst the API quota
+BOOK_PREFETCH_CONCURRENCY = int(os.getenv("BOOK_PREFETCH_CONCURRENCY", 2))
+BOOK_PREFETCH_RETRY_SECONDS = float(os.getenv("BOOK_PREFETCH_RETRY_SECONDS", 60))
+# How long the leader's lease lasts without renewal
+BOOK_PREFETCH_LEASE_SECONDS = float(os.getenv("BOOK_PREFETCH_LEASE_SECONDS", 60))
+
+
+# The book genres a song can map to
+def reachable_book_genres():
+    return sorted(set(get_genre_mapping().values()) | {DEFAULT_BOOK_GENRE})
+
+
+def prefetch_keys(sizes=BOOK_PREFETCH_MAX_RESULTS, genres=None):
+    genres = genres if genres is not None else reachable_book_genres()
+    return [(genre, max_results) for genre in genres for max_results in sizes]
+
+
+class Lease:
+    """A named lease in a Mongo collection, held by one process at a time
+    and taken over once its holder stops renewing it."""
+
+    def __init__(self, collection, name, seconds=BOOK_PREFETCH_LEASE_SECONDS):
+        self.collection = collection
+        self.name = name
+        self.seconds = seconds
+        self.holder = None
+
+    # Takes the lease if it is free or lapsed, or renews it if ours.
+    # Returns whether this process holds it
+    async def acquire(self):
+        if self.holder is None:
+            # Set on first use, so forked workers never share a holder id
+            self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        now = datetime.utcnow()
+        try:
+            doc = await self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"holder": self.holder}, {"expires_at": {"$lt": now}}]},
+                {"$set": {"holder": self.holder, "expires_at": now + timedelta(seconds=self.seconds)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # Held by another process: the upsert collided with its document
+            return False
+        except PyMongoError as e:
+            logger.warning(f"Could not acquire the {self.name} lease: {e}")
+            return False
+        return doc is not None and doc.get("holder") == self.holder
+
+    async def release(self):
+        if self.holder is None:
+            return
+        try:
+            await self.collection.delete_one({"_id": self.name, "holder": self.holder})
+        except PyMongoError as e:
+            logger.warning(f"Could not release the {self.name} lease: {e}")
+
+
+class BookPrefetcher:
+    """Refresh scheduler for a fixed set of (genre, max_results) searches,
+    started and stopped with the app. ``keys`` defaults to prefetch_keys(),
+    worked out on start once the genre index is loaded. Without a
+    ``lease`` this process always refreshes; with one, only while it holds
+    it."""
+
+    def __init__(self, client=google_books_client, keys=None, refresh_fraction=BOOK_PREFETCH_REFRESH_FRACTION,
+                 jitter=BOOK_PREFETCH_JITTER, concurrency=BOOK_PREFETCH_CONCURRENCY,
+                 retry_seconds=BOOK_PREFETCH_RETRY_SECONDS, lease=None):
+        self.client = client
+        self.keys = keys
+        self.refresh_fraction = refresh_fraction
+        self.jitter = jitter
+        self.concurrency = concurrency
+        self.retry_seconds = retry_seconds
+        self.lease = lease
+        self.leader = False
+        self._renew_at = 0.0
+        self._due = {}
+        self._task = None
+        self.refreshes = 0
+        self.failures = 0
+
+    def _delay(self, ok):
+        interval = self.client.fresh_for * self.refresh_fraction
+        if not ok:
+            interval = min(interval, self.retry_seconds)
+        return interval * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    async def _refresh(self, key, semaphore):
+        async with semaphore:
+            try:
+                await self.client.refresh(*key)
+                self.refreshes += 1
+                ok = True
+            except Exception as e:
+                logger.warning(f"Could not prefetch Google Books results for {key[0]!r}: {e}")
+                self.failures += 1
+                ok = False
+        self._due[key] = time.monotonic() + self._delay(ok)
+
+    # Picks up the schedule on becoming leader: results a previous leader
+    # stored in the shared tier are refreshed when they would have been,
+    # anything missing right away
+    async def _schedule(self):
+        now = time.monotonic()
+        for key in self.keys:
+            try:
+                fetched_at = await self.client.fetched_at(*key)
+            except Exception:
+                fetched_at = None
+            self._due[key] = now if fetched_at is None else max(now, fetched_at + self._delay(True))
+
+    # Renews or takes the lease when it is due. Returns whether to refresh
+    async def _lead(self):
+        if self.lease is None:
+            return True
+        now = time.monotonic()
+        if now >= self._renew_at:
+            leader = await self.lease.acquire()
+            self._renew_at = now + self.lease.seconds / 3
+            if leader and not self.leader:
+                logger.info("Holding the book prefetch lease; refreshing Google Books searches")
+                await self._schedule()
+            self.leader = leader
+        return self.leader
+
+    async def _run(self):
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+        while True:
+            if not await self._lead():
+                await asyncio.sleep(max(0.0, self._renew_at - time.monotonic()))
+                continue
+            now = time.monotonic()
+            due = [key for key, at in self._due.items() if at <= now]
+            if due:
+                await asyncio.gather(*(self._refresh(key, semaphore) for key in due))
+            else:
+                wake = min(self._due.values())
+                if self.lease is not None:
+                    wake = min(wake, self._renew_at)
+                await asyncio.sleep(max(0.0, wake - now))
+
+    def start(self):
+        if self._task is not None:
+            return
+        if self.keys is None:
+            self.keys = prefetch_keys()
+        if not self.keys:
+            return
+        # Everything is due now: the first pass warms the cache. A leased
+        # prefetcher reschedules from the shared tier once it leads
+        self._due = {key: time.monotonic() for key in self.keys}
+        self._task = asyncio.ensure_future(self._run())
+        logger.info(f"Prefetching {len(self.keys)} Google Books searches"
+                    + (" whenever this process holds the lease" if self.lease is not None else ""))
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        if self.lease is not None and self.leader:
+            # Let another worker take over without waiting for expiry
+            await self.lease.release()
+            self.leader = False
+
+    def stats(self):
+        now = time.monotonic()
+        leader = self.lease is None or self.leader
+        return {
+            "keys": len(self.keys or []),
+            "leader": leader,
+            "refreshes": self.refreshes,
+            "failures": self.failures,
+            "next_refresh_in": max(0.0, min(self._due.values()) - now) if self._due and leader else None,
+        }
+
+
+book_prefetcher = BookPrefetcher(lease=Lease(AsyncCollection("leases"), "book_prefetch"))
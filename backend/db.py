@@ -1,9 +1,11 @@
 from pymongo import MongoClient
+import asyncio
 import os
+import threading
 from dotenv import load_dotenv
 import certifi
-from pymongo.errors import ConnectionFailure
 import logging
+from .metrics import span
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -11,41 +13,212 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+DATABASE_NAME = os.getenv("MONGO_DB_NAME", "music_book_db")
+
+# Pool sizing: enough connections for the threadpool plus async routes, a few
+# kept warm, and a bounded wait so an exhausted pool fails fast
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 5))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000))
+MONGO_TLS = os.getenv("MONGO_TLS", "true").lower() in ("1", "true", "yes")
+
+# "motor" routes async access through Motor; anything else wraps the
+# synchronous client in worker threads
+MONGO_ASYNC_DRIVER = os.getenv("MONGO_ASYNC_DRIVER", "threads")
+
+_client = None
+_client_pid = None
+_async_client = None
+_lock = threading.Lock()
+
+
+def _mongo_url():
+    MONGO_URL = os.getenv("MONGO_URL")
+    if not MONGO_URL:
+        raise ValueError("MONGO_URL environment variable is not set")
+    return MONGO_URL
+
+
+def _client_options():
+    options = dict(
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS,
+        waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        serverSelectionTimeoutMS=30000,  # Increase timeout to 30 seconds
+        connectTimeoutMS=30000,
+        socketTimeoutMS=45000,
+        retryWrites=True
+    )
+    if MONGO_TLS:
+        options.update(tlsCAFile=certifi.where(), tls=True, tlsAllowInvalidCertificates=True)
+    return options
+
+
+# mongomock:// URLs give an in-memory stand-in for tests and benchmarks
+# (mongomock and mongomock-motor are in requirements-dev.txt)
+def _create_client(url):
+    if url.startswith("mongomock://"):
+        import mongomock
+        return mongomock.MongoClient()
+    # connect=False: no network I/O until the first operation
+    return MongoClient(url, connect=False, **_client_options())
+
+
+def get_client():
+    """Return the process-wide MongoClient, creating it on first use.
+
+    A client must not be shared across fork(), so a forked worker that
+    inherits one builds its own instead.
+    """
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        with _lock:
+            if _client is None or _client_pid != os.getpid():
+                _client = _create_client(_mongo_url())
+                _client_pid = os.getpid()
+                logger.info("Created MongoDB client")
+    return _client
+
+
+def get_db():
+    return get_client()[DATABASE_NAME]
+
+
+# Kept for callers of the original API
 def get_database():
-    try:
-        MONGO_URL = os.getenv("MONGO_URL")
-        if not MONGO_URL:
-            raise ValueError("MONGO_URL environment variable is not set")
-
-        client = MongoClient(
-            MONGO_URL,
-            tlsCAFile=certifi.where(),
-            tls=True,
-            tlsAllowInvalidCertificates=True,
-            serverSelectionTimeoutMS=30000,  # Increase timeout to 30 seconds
-            connectTimeoutMS=30000,
-            socketTimeoutMS=45000,
-            retryWrites=True
-        )
-        
-        # Test the connection
-        client.admin.command('ping')
-        logger.info("Successfully connected to MongoDB")
-        
-        db = client["music_book_db"]
-        return db, client
-    except ConnectionFailure as e:
-        logger.error(f"Failed to connect to MongoDB: {e}")
-        raise
-    except Exception as e:
-        logger.error(f"An error occurred: {e}")
-        raise
-
-# Initialize database connection
-try:
-    db, client = get_database()
-    users_collection = db["users"]
-    playlists_collection = db["playlists"]
-except Exception as e:
-    logger.error(f"Failed to initialize database: {e}")
-    raise
\ No newline at end of file
+    return get_db(), get_client()
+
+
+def ping():
+    get_client().admin.command('ping')
+
+
+def close_client():
+    global _client, _async_client
+    with _lock:
+        if _client is not None and _client_pid == os.getpid():
+            _client.close()
+        _client = None
+        if _async_client is not None:
+            _async_client.close()
+            _async_client = None
+
+
+# A forked worker drops the clients it inherited without closing them: their
+# sockets still belong to the parent. New ones are created on first use.
+def _reset_after_fork():
+    global _client, _async_client, _lock
+    _client = None
+    _async_client = None
+    _lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_async_client():
+    global _async_client
+    if _async_client is None:
+        url = _mongo_url()
+        if url.startswith("mongomock://"):
+            from mongomock_motor import AsyncMongoMockClient
+            _async_client = AsyncMongoMockClient()
+        else:
+            try:
+                from motor.motor_asyncio import AsyncIOMotorClient
+            except ImportError:
+                raise RuntimeError("MONGO_ASYNC_DRIVER=motor requires the motor package")
+            _async_client = AsyncIOMotorClient(url, **_client_options())
+    return _async_client
+
+
+class LazyCollection:
+    """Stand-in for a pymongo Collection that resolves it on each use.
+
+    Importing this module therefore never connects, and the collection
+    always belongs to the current process's client.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def get(self):
+        return get_db()[self.name]
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+    def __repr__(self):
+        return f"LazyCollection({self.name!r})"
+
+
+class AsyncCollection:
+    """Awaitable subset of the Collection API for async routes.
+
+    Backed by Motor when MONGO_ASYNC_DRIVER=motor, otherwise by the shared
+    synchronous client running in worker threads. Either way the event loop
+    never blocks on a database round trip.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def _motor(self):
+        return get_async_client()[DATABASE_NAME][self.name]
+
+    async def _call(self, method, *args, **kwargs):
+        with span(f"mongo.{self.name}.{method}"):
+            if MONGO_ASYNC_DRIVER == "motor":
+                return await getattr(self._motor(), method)(*args, **kwargs)
+            collection = get_db()[self.name]
+            return await asyncio.to_thread(getattr(collection, method), *args, **kwargs)
+
+    async def find_one(self, *args, **kwargs):
+        return await self._call("find_one", *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._call("insert_one", *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._call("insert_many", *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._call("update_one", *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._call("delete_one", *args, **kwargs)
+
+    async def find_one_and_update(self, *args, **kwargs):
+        return await self._call("find_one_and_update", *args, **kwargs)
+
+    async def find_one_and_delete(self, *args, **kwargs):
+        return await self._call("find_one_and_delete", *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._call("update_many", *args, **kwargs)
+
+    async def count_documents(self, *args, **kwargs):
+        return await self._call("count_documents", *args, **kwargs)
+
+    async def find_list(self, filter=None, projection=None, limit=0):
+        with span(f"mongo.{self.name}.find"):
+            if MONGO_ASYNC_DRIVER == "motor":
+                cursor = self._motor().find(filter or {}, projection).limit(limit)
+                return await cursor.to_list(length=None)
+            collection = get_db()[self.name]
+            return await asyncio.to_thread(lambda: list(collection.find(filter or {}, projection).limit(limit)))
+
+
+# Collections used across the app
+users_collection = LazyCollection("users")
+playlists_collection = LazyCollection("playlists")
+tracks_collection = LazyCollection("tracks")
+tags_collection = LazyCollection("tags")
+async_users_collection = AsyncCollection("users")
+async_playlists_collection = AsyncCollection("playlists")
+async_tracks_collection = AsyncCollection("tracks")
+async_import_jobs_collection = AsyncCollection("import_jobs")
+async_tags_collection = AsyncCollection("tags")
+async_counters_collection = AsyncCollection("counters")
@@ -0,0 +1,219 @@
+"""Sentence encoder behind a pluggable inference backend.
+
+ENCODER_BACKEND selects how all-MiniLM-L6-v2 is run:
+
+- "torch" (default): SentenceTransformer on full PyTorch, the reference.
+- "torch-int8": the same model with its Linear layers dynamically
+  quantized to int8; faster on CPU, same dependencies.
+- "onnx": ONNX Runtime plus the tokenizers library. torch is never
+  imported, which is where most of a worker's RSS goes. Needs the
+  onnxruntime package (in requirements-dev.txt); ENCODER_ONNX_FILE picks the exported graph (e.g.
+  onnx/model_quint8_avx2.onnx for the int8 export) and ENCODER_ONNX_PATH
+  a local file instead of the Hugging Face hub copy.
+
+Every backend returns L2-normalized float32 rows. Check a backend against
+the reference before switching a deploy to it:
+
+    python -m backend.encoder --parity onnx
+"""
+import argparse
+import logging
+import os
+import sys
+import threading
+
+import numpy as np
+
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+MODEL_REPO = f"sentence-transformers/{MODEL_NAME}"
+# Tokens per text; longer inputs are truncated, as SentenceTransformer does
+MAX_SEQ_LENGTH = 256
+
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "torch")
+ENCODER_ONNX_FILE = os.getenv("ENCODER_ONNX_FILE", "onnx/model.onnx")
+ENCODER_ONNX_PATH = os.getenv("ENCODER_ONNX_PATH")
+ENCODER_THREADS = int(os.getenv("ENCODER_THREADS", 0))
+
+# Lowest mean cosine similarity to the reference backend a backend may have
+PARITY_THRESHOLD = 0.99
+
+
+# Identifies the vectors a backend produces, for everything stored from
+# them (genre artifact, book catalog, tag stores, materialized results).
+# The torch reference keeps the bare model name, so data stored before
+# backends existed stays valid; the others are close to it, not equal, and
+# an ONNX export's file name tells its quantization apart.
+def encoder_stamp(backend=None):
+    backend = backend or ENCODER_BACKEND
+    if backend == "torch":
+        return MODEL_NAME
+    if backend == "onnx":
+        return f"{MODEL_NAME}:onnx:{os.path.basename(ENCODER_ONNX_PATH or ENCODER_ONNX_FILE)}"
+    return f"{MODEL_NAME}:{backend}"
+
+
+ENCODER_STAMP = encoder_stamp()
+
+_encoder = None
+_encoder_lock = threading.Lock()
+
+
+def _normalize(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return np.ascontiguousarray(embeddings / np.maximum(norms, 1e-12))
+
+
+class TorchBackend:
+    name = "torch"
+
+    # Importing sentence_transformers pulls in torch, so neither happens
+    # until a tag actually needs encoding
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(MODEL_NAME, device="cpu")
+        if ENCODER_THREADS:
+            import torch
+            torch.set_num_threads(ENCODER_THREADS)
+
+    def encode(self, texts):
+        embeddings = self.model.encode(texts, normalize_embeddings=True, convert_to_numpy=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+
+class QuantizedTorchBackend(TorchBackend):
+    name = "torch-int8"
+
+    def __init__(self):
+        super().__init__()
+        import torch
+        # Weights of every Linear layer become int8; activations are
+        # quantized on the fly per batch
+        self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self):
+        try:
+            import onnxruntime
+            from tokenizers import Tokenizer
+        except ImportError:
+            raise RuntimeError("ENCODER_BACKEND=onnx requires the onnxruntime and tokenizers packages")
+
+        model_path = ENCODER_ONNX_PATH or self._download(ENCODER_ONNX_FILE)
+        self.tokenizer = Tokenizer.from_file(self._download("tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+        options = onnxruntime.SessionOptions()
+        if ENCODER_THREADS:
+            options.intra_op_num_threads = ENCODER_THREADS
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    @staticmethod
+    def _download(filename):
+        from huggingface_hub import hf_hub_download
+        return hf_hub_download(MODEL_REPO, filename)
+
+    def encode(self, texts):
+        if not texts:
+            return np.empty((0, 384), dtype=np.float32)
+        encodings = self.tokenizer.encode_batch(list(texts))
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        token_embeddings = self.session.run(None, {k: v for k, v in inputs.items() if k in self.input_names})[0]
+
+        # Mean pooling over the real (unpadded) tokens, as the model was trained
+        mask = inputs["attention_mask"][:, :, None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        return _normalize(pooled)
+
+
+BACKENDS = {
+    TorchBackend.name: TorchBackend,
+    QuantizedTorchBackend.name: QuantizedTorchBackend,
+    OnnxBackend.name: OnnxBackend,
+}
+
+
+def create_encoder(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown encoder backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    logger.info(f"Loading sentence encoder {MODEL_NAME} with the {backend} backend")
+    return BACKENDS[backend]()
+
+
+# Load the configured encoder on first use
+def get_encoder():
+    global _encoder
+    if _encoder is None:
+        with _encoder_lock:
+            if _encoder is None:
+                _encoder = create_encoder(ENCODER_BACKEND)
+    return _encoder
+
+
+# The underlying SentenceTransformer, for callers that need its full API;
+# only available with the torch backends
+def get_model():
+    encoder = get_encoder()
+    if not hasattr(encoder, "model"):
+        raise RuntimeError(f"The {encoder.name} encoder backend has no SentenceTransformer model")
+    return encoder.model
+
+
+def is_model_loaded():
+    return _encoder is not None
+
+
+# Encode a list of strings into L2-normalized float32 rows, so a plain
+# matrix product between two of these gives cosine similarities
+def encode_normalized(texts):
+    encoder = get_encoder()
+    with span("encode"):
+        return encoder.encode(texts)
+
+
+def parity(candidate, reference, texts):
+    """Row-wise cosine similarity between two backends' embeddings of
+    ``texts``, as (mean, min)."""
+    similarities = (candidate.encode(texts) * reference.encode(texts)).sum(axis=1)
+    return float(similarities.mean()), float(similarities.min())
+
+
+def parity_texts():
+    from .genres import BOOK_GENRES, MUSIC_GENRES
+    # Genre names plus the kind of free-form tags Last.fm returns
+    return MUSIC_GENRES + BOOK_GENRES + [
+        "seen live", "female vocalists", "90s", "chillout", "singer-songwriter",
+        "Get Lucky (feat. Pharrell Williams)", "melancholic late night driving music",
+        "a sweeping family saga set across three generations",
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare an encoder backend with the torch reference")
+    parser.add_argument("--parity", choices=sorted(BACKENDS), required=True)
+    parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    mean, worst = parity(create_encoder(args.parity), create_encoder("torch"), parity_texts())
+    logger.info(f"{args.parity} vs torch: mean cosine {mean:.5f}, min {worst:.5f}")
+    if mean < args.threshold:
+        logger.error(f"Mean cosine similarity below {args.threshold}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
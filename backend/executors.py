@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+from .encoder import encode_normalized
+from .metrics import gauge_lines, register_collector
+
+logger = logging.getLogger(__name__)
+
+BCRYPT_POOL_SIZE = int(os.getenv("BCRYPT_POOL_SIZE", min(4, os.cpu_count() or 1)))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", 64))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
+
+
+class CPUPool:
+    """Process pool for CPU-bound calls such as bcrypt.
+
+    Workers are spawned rather than forked, so they never inherit the
+    parent's threads or open sockets. The pool starts on first use.
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self):
+        return {
+            "max_workers": self.max_workers,
+            "started": self._executor is not None,
+            # Calls submitted but not finished; anything beyond max_workers is queued
+            "in_flight": self.in_flight,
+            "queue_depth": max(0, self.in_flight - self.max_workers),
+            "completed": self.completed,
+        }
+
+
+class EmbeddingBatcher:
+    """Single worker thread that merges concurrent encode requests.
+
+    Requests arriving within ``max_wait`` seconds of each other (up to
+    ``max_batch`` texts) go through the model as one forward pass, and each
+    caller gets back the rows for its own texts.
+    """
+
+    def __init__(self, encode, max_batch: int, max_wait: float):
+        self._encode = encode
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts_encoded = 0
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                    self._thread.start()
+
+    def submit(self, texts) -> Future:
+        future = Future()
+        self.requests += 1
+        if not texts:
+            future.set_result(np.empty((0, 0), dtype=np.float32))
+            return future
+        self._ensure_worker()
+        self._queue.put((list(texts), future))
+        return future
+
+    # Blocking helper for code that already runs off the event loop
+    def encode(self, texts):
+        return self.submit(texts).result()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        size = len(batch[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    def _run(self):
+        while True:
+            # Requests cancelled while queued are dropped before encoding
+            batch = [(texts, future) for texts, future in self._collect() if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            unique = list(dict.fromkeys(text for texts, _ in batch for text in texts))
+            try:
+                embeddings = self._encode(unique)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(unique)} texts failed: {e}")
+                self._resolve(batch, lambda texts, future: future.set_exception(e))
+                continue
+            self.batches += 1
+            self.texts_encoded += len(unique)
+            rows = {text: i for i, text in enumerate(unique)}
+            self._resolve(batch, lambda texts, future: future.set_result(embeddings[[rows[text] for text in texts]]))
+
+    # One caller's future failing to resolve must never kill the worker
+    # thread, which every other caller waits on
+    @staticmethod
+    def _resolve(batch, resolve):
+        for texts, future in batch:
+            try:
+                resolve(texts, future)
+            except Exception as e:
+                logger.error(f"Could not deliver embeddings for {len(texts)} texts: {e}")
+
+    def stats(self):
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self._queue.qsize(),
+            "requests": self.requests,
+            "batches": self.batches,
+            "texts_encoded": self.texts_encoded,
+            "avg_batch_size": self.texts_encoded / self.batches if self.batches else 0.0,
+        }
+
+
+bcrypt_pool = CPUPool(BCRYPT_POOL_SIZE)
+embedding_batcher = EmbeddingBatcher(encode_normalized, EMBEDDING_MAX_BATCH, EMBEDDING_MAX_WAIT_MS / 1000)
+
+
+def executor_stats():
+    return {
+        "bcrypt_pool": bcrypt_pool.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+    }
+
+
+@register_collector
+def _executor_lines():
+    stats = executor_stats()
+    return gauge_lines(
+        "executor_queue_depth", "Work waiting for a CPU executor", "executor",
+        {name: values["queue_depth"] for name, values in stats.items()},
+    )
+
+
+def shutdown_executors():
+    bcrypt_pool.shutdown()
@@ -0,0 +1,98 @@
+"""Build and load the precomputed genre index artifact.
+
+The artifact holds the music/book genre embedding matrices and the
+music -> book genre mapping derived from them, so workers can start without
+loading the sentence encoder. Build it as part of a deploy with:
+
+    python -m backend.genre_artifacts [--output PATH]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+
+from .encoder import ENCODER_STAMP, encode_normalized
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_VERSION = 1
+DEFAULT_ARTIFACT_PATH = os.getenv("GENRE_ARTIFACT_PATH", "artifacts/genre_index.npz")
+
+
+class ArtifactMismatch(Exception):
+    pass
+
+
+# Fingerprint of the inputs an artifact was built from; a change in the
+# genre tables, the model or its encoder backend makes an existing artifact
+# stale
+def genre_tables_fingerprint(music_genres, book_genres):
+    payload = json.dumps([ENCODER_STAMP, music_genres, book_genres]).encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+def build_artifacts(music_genres, book_genres):
+    music_embeddings = encode_normalized(music_genres)
+    book_embeddings = encode_normalized(book_genres)
+
+    # Map music genres to book genres based on highest similarity
+    similarity_matrix = music_embeddings @ book_embeddings.T
+    best_book_indices = similarity_matrix.argmax(axis=1)
+    mapping = {
+        music_genre: book_genres[best_book_indices[i]]
+        for i, music_genre in enumerate(music_genres)
+    }
+    return music_embeddings, book_embeddings, mapping
+
+
+def save_artifacts(path, music_genres, book_genres, music_embeddings, book_embeddings, mapping):
+    metadata = {
+        "version": ARTIFACT_VERSION,
+        "model": ENCODER_STAMP,
+        "fingerprint": genre_tables_fingerprint(music_genres, book_genres),
+        "music_genres": music_genres,
+        "book_genres": book_genres,
+        "mapping": mapping,
+    }
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            music_embeddings=music_embeddings,
+            book_embeddings=book_embeddings,
+            metadata=np.array(json.dumps(metadata)),
+        )
+    os.replace(tmp_path, path)
+
+
+def load_artifacts(path, music_genres, book_genres):
+    with np.load(path, allow_pickle=False) as data:
+        metadata = json.loads(str(data["metadata"]))
+        if metadata.get("version") != ARTIFACT_VERSION:
+            raise ArtifactMismatch(f"artifact version {metadata.get('version')} != {ARTIFACT_VERSION}")
+        if metadata.get("fingerprint") != genre_tables_fingerprint(music_genres, book_genres):
+            raise ArtifactMismatch("artifact was built from a different model or genre tables")
+        return data["music_embeddings"], data["book_embeddings"], metadata["mapping"]
+
+
+def main():
+    from .genres import MUSIC_GENRES, BOOK_GENRES
+
+    parser = argparse.ArgumentParser(description="Build the precomputed genre index artifact")
+    parser.add_argument("--output", default=DEFAULT_ARTIFACT_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    music_embeddings, book_embeddings, mapping = build_artifacts(MUSIC_GENRES, BOOK_GENRES)
+    save_artifacts(args.output, MUSIC_GENRES, BOOK_GENRES, music_embeddings, book_embeddings, mapping)
+    logger.info(f"Wrote genre index artifact to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
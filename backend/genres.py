@@ -0,0 +1,262 @@
+import logging
+import os
+import threading
+from typing import Dict, List, NamedTuple
+
+import numpy as np
+
+from .encoder import ENCODER_STAMP
+from .executors import embedding_batcher
+from .genre_artifacts import (
+    DEFAULT_ARTIFACT_PATH,
+    ArtifactMismatch,
+    build_artifacts,
+    load_artifacts,
+)
+from .tag_cache import TagCache, TagMatch
+
+logger = logging.getLogger(__name__)
+
+# Default fallback genre when nothing in a song's tags can be matched
+DEFAULT_BOOK_GENRE = "fiction"
+
+# Last.fm lists a track's most-applied tags first, so the tag at position i
+# counts TAG_RANK_DECAY ** i as much as the first one
+TAG_RANK_DECAY = float(os.getenv("TAG_RANK_DECAY", 0.8))
+# Softmax temperature over a tag's similarities to the music genres; lower
+# values approach "closest genre only"
+GENRE_SOFTMAX_TEMPERATURE = float(os.getenv("GENRE_SOFTMAX_TEMPERATURE", 0.05))
+# Bumped whenever the scoring changes, so results stored from an older
+# scorer are recomputed
+SCORING_VERSION = 2
+
+# Sample music genres - you could load these from a file or database
+MUSIC_GENRES = [
+    "rock", "pop", "hip hop", "rap", "electronic", "classical", "jazz",
+    "indie", "folk", "metal", "punk", "r&b", "soul", "blues", "country",
+    "alternative", "ambient", "dance", "disco", "funk", "reggae"
+]
+
+# Sample book genres - you could load these from a file or database
+BOOK_GENRES = [
+    "thriller", "mystery", "romance", "science fiction", "fantasy",
+    "historical fiction", "biography", "self-help", "horror", "adventure",
+    "literary fiction", "young adult", "dystopian", "memoir", "poetry",
+    "philosophy", "psychology", "crime", "drama", "comedy", "classic"
+]
+
+
+# The one form of a tag used everywhere: tag cache keys, genre scoring and
+# the interned tag vocabulary (see tag_vocab.py)
+def normalize_tag(tag):
+    return " ".join(tag.lower().split())
+
+
+class GenreIndex(NamedTuple):
+    music_genres: List[str]
+    book_genres: List[str]
+    # L2-normalized float32 rows, one per genre
+    music_embeddings: np.ndarray
+    book_embeddings: np.ndarray
+    mapping: Dict[str, str]
+    # One-hot (music genre x book genre) form of mapping, for scoring
+    mapping_matrix: np.ndarray
+
+
+_genre_index = None
+_genre_index_lock = threading.Lock()
+
+
+# Load the genre index from the prebuilt artifact, falling back to building
+# it with the encoder when the artifact is missing or stale
+def _load_genre_index(path):
+    try:
+        music_embeddings, book_embeddings, mapping = load_artifacts(path, MUSIC_GENRES, BOOK_GENRES)
+        logger.info(f"Loaded genre index from {path}")
+    except FileNotFoundError:
+        logger.warning(f"Genre artifact {path} not found; building it with the encoder")
+        music_embeddings, book_embeddings, mapping = build_artifacts(MUSIC_GENRES, BOOK_GENRES)
+    except (ArtifactMismatch, OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring genre artifact {path} ({e}); building it with the encoder")
+        music_embeddings, book_embeddings, mapping = build_artifacts(MUSIC_GENRES, BOOK_GENRES)
+    mapping_matrix = np.zeros((len(MUSIC_GENRES), len(BOOK_GENRES)), dtype=np.float32)
+    for i, music_genre in enumerate(MUSIC_GENRES):
+        mapping_matrix[i, BOOK_GENRES.index(mapping[music_genre])] = 1.0
+    return GenreIndex(MUSIC_GENRES, BOOK_GENRES, music_embeddings, book_embeddings, mapping, mapping_matrix)
+
+
+def get_genre_index():
+    global _genre_index
+    if _genre_index is None:
+        with _genre_index_lock:
+            if _genre_index is None:
+                index = _load_genre_index(DEFAULT_ARTIFACT_PATH)
+                _genre_index = index
+                tag_cache.load(resolve_embeddings)
+    return _genre_index
+
+
+def get_genre_mapping():
+    return get_genre_index().mapping
+
+
+# Resolve each row of a normalized tag embedding matrix to its closest music
+# genre, that genre's book genre and the similarity score
+def resolve_embeddings(tag_embeddings):
+    index = get_genre_index()
+    similarities = np.asarray(tag_embeddings, dtype=np.float32) @ index.music_embeddings.T
+    best_indices = similarities.argmax(axis=1)
+    best_scores = similarities[np.arange(len(best_indices)), best_indices]
+    return [
+        (index.music_genres[i], index.mapping[index.music_genres[i]], float(score))
+        for i, score in zip(best_indices, best_scores)
+    ]
+
+
+# Cache of tag -> embedding and resolved genres; Last.fm tags repeat heavily
+# across songs, so most lookups never reach the model
+tag_cache = TagCache(
+    maxsize=int(os.getenv("TAG_CACHE_SIZE", 10000)),
+    ttl=float(os.getenv("TAG_CACHE_TTL")) if os.getenv("TAG_CACHE_TTL") else None,
+    store_dir=os.getenv("TAG_CACHE_DIR"),
+    model_name=ENCODER_STAMP,
+)
+
+
+# Look up (or encode and cache) the TagMatch for every normalized tag (see
+# normalize_tag), in order.
+# Encoding goes through the shared batcher, so concurrent callers on other
+# threads share one forward pass; call this off the event loop.
+def resolve_tags(tags):
+    get_genre_index()
+    matches = tag_cache.get_many(tags)
+    unseen = list(dict.fromkeys(tag for tag in tags if tag not in matches))
+    if unseen:
+        embeddings = embedding_batcher.encode(unseen)
+        for tag, embedding, resolved in zip(unseen, embeddings, resolve_embeddings(embeddings)):
+            match = TagMatch(embedding, *resolved)
+            tag_cache.put(tag, match)
+            matches[tag] = match
+    return [matches[tag] for tag in tags]
+
+
+def _rank_weights(count):
+    return TAG_RANK_DECAY ** np.arange(count, dtype=np.float32)
+
+
+# Each tag's distribution over book genres, plus how close the tag is to any
+# music genre at all. The tag x music genre similarities are one matmul;
+# contracting the softmax over music genres with the mapping matrix gives
+# the tag x book genre scores.
+def _tag_book_scores(tag_embeddings, index):
+    similarities = tag_embeddings @ index.music_embeddings.T
+    logits = similarities / GENRE_SOFTMAX_TEMPERATURE
+    weights = np.exp(logits - logits.max(axis=1, keepdims=True))
+    weights /= weights.sum(axis=1, keepdims=True)
+    confidence = np.clip(similarities.max(axis=1), 0.0, None)
+    return weights @ index.mapping_matrix, confidence
+
+
+def book_genre_distributions(tag_lists):
+    """Rank book genres for many songs at once.
+
+    Returns, per song, (book genre, weight) pairs best first, with weights
+    summing to 1. A song's tags are weighted by Last.fm rank and by how
+    genre-like they are, so a tag such as "seen live" counts for little.
+    All distinct tags across the songs are scored in a single matmul; call
+    this off the event loop, as unseen tags need the encoder.
+    """
+    tag_lists = [list(dict.fromkeys(map(normalize_tag, song_tags))) if song_tags else [] for song_tags in tag_lists]
+    unique_tags = list(dict.fromkeys(tag for song_tags in tag_lists for tag in song_tags))
+    matches = dict(zip(unique_tags, resolve_tags(unique_tags))) if unique_tags else {}
+    return distributions_from_matches(tag_lists, matches)
+
+
+# The scoring behind book_genre_distributions, for songs whose tags are
+# already resolved: ``key_lists`` holds each song's distinct tag keys in
+# rank order (normalized tags, or tag vocabulary ids) and ``matches`` the
+# TagMatch of every key
+def distributions_from_matches(key_lists, matches):
+    index = get_genre_index()
+    if matches:
+        keys = list(matches)
+        embeddings = np.stack([matches[key].embedding for key in keys]).astype(np.float32)
+        tag_scores, confidence = _tag_book_scores(embeddings, index)
+        rows_by_key = {key: i for i, key in enumerate(keys)}
+
+    distributions = []
+    for song_keys in key_lists:
+        rows = [rows_by_key[key] for key in song_keys]
+        weights = _rank_weights(len(rows)) * confidence[rows] if rows else None
+        if weights is None or weights.sum() <= 0:
+            distributions.append([(DEFAULT_BOOK_GENRE, 1.0)])
+            continue
+        scores = weights @ tag_scores[rows] / weights.sum()
+        order = np.argsort(-scores, kind="stable")
+        distributions.append([(index.book_genres[i], float(scores[i])) for i in order if scores[i] > 0])
+    return distributions
+
+
+def book_genre_distribution(song_tags):
+    return book_genre_distributions([song_tags])[0]
+
+
+# Find the best matching genre from our mapping
+def find_best_matching_genre(song_tags):
+    return find_best_matching_genres([song_tags])[0]
+
+
+# Top book genre for each of many songs
+def find_best_matching_genres(tag_lists):
+    return [distribution[0][0] for distribution in book_genre_distributions(tag_lists)]
+
+
+# Direct match of a song's lowercase tags against the genre mapping
+def _direct_match(lowercase_tags, genre_mapping):
+    for tag in lowercase_tags:
+        if tag in genre_mapping:
+            return genre_mapping[tag]
+    return None
+
+
+# The original scorer: the first tag naming a music genre wins, otherwise
+# the single tag closest to any music genre. Kept as the baseline for
+# benchmarks/eval_genre_scoring.py.
+def first_match_genres(tag_lists):
+    genre_mapping = get_genre_mapping()
+    results = [DEFAULT_BOOK_GENRE] * len(tag_lists)
+    pending = {}
+
+    for i, song_tags in enumerate(tag_lists):
+        if not song_tags:
+            continue
+        # Normalize tags for better matching
+        lowercase_tags = [normalize_tag(tag) for tag in song_tags]
+        # Try direct match first
+        direct = _direct_match(lowercase_tags, genre_mapping)
+        if direct:
+            results[i] = direct
+        else:
+            pending[i] = lowercase_tags
+
+    if pending:
+        unique_tags = list(dict.fromkeys(tag for tags in pending.values() for tag in tags))
+        matches = dict(zip(unique_tags, resolve_tags(unique_tags)))
+        for i, lowercase_tags in pending.items():
+            # Pick the tag most similar to any music genre; max() keeps the
+            # earliest tag on ties
+            best = max((matches[tag] for tag in lowercase_tags), key=lambda match: match.score)
+            results[i] = best.book_genre
+    return results
+
+
+# Unit-norm query vector for a song: the rank-weighted mean of its tag
+# embeddings. Returns None for a song without tags.
+def song_query_vector(song_tags):
+    if not song_tags:
+        return None
+    matches = resolve_tags([normalize_tag(tag) for tag in song_tags])
+    embeddings = np.stack([np.asarray(match.embedding, dtype=np.float32) for match in matches])
+    query = _rank_weights(len(matches)) @ embeddings
+    norm = np.linalg.norm(query)
+    return query / norm if norm else None
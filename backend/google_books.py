@@ -0,0 +1,257 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from .cache import LRUCache, MISSING
+from .metrics import span, stale_responses, upstream_errors
+from pymongo.errors import PyMongoError
+from .resilience import AsyncSingleFlight, CircuitBreaker, CircuitOpenError
+
+logger = logging.getLogger(__name__)
+
+GOOGLE_BOOKS_API_URL = os.getenv("GOOGLE_BOOKS_API_URL", "https://www.googleapis.com/books/v1/volumes")
+
+# Upstream responses worth retrying; anything else is returned or raised as is
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# A subject search is fresh for GOOGLE_BOOKS_CACHE_TTL seconds; for
+# GOOGLE_BOOKS_STALE_SECONDS after that it is still served, while it is
+# fetched again in the background
+GOOGLE_BOOKS_CACHE_TTL = float(os.getenv("GOOGLE_BOOKS_CACHE_TTL", 3600))
+GOOGLE_BOOKS_STALE_SECONDS = float(os.getenv("GOOGLE_BOOKS_STALE_SECONDS", 24 * 3600))
+# Share subject searches between workers through MongoDB; on by default
+# when the prefetcher is, as only one process runs it
+GOOGLE_BOOKS_CACHE_MONGO = os.getenv("GOOGLE_BOOKS_CACHE_MONGO", os.getenv("BOOK_PREFETCH", "false")).lower() in ("1", "true", "yes")
+
+
+class GoogleBooksError(Exception):
+    pass
+
+
+# Raised without calling Google Books while its circuit breaker is open
+class GoogleBooksUnavailable(GoogleBooksError):
+    pass
+
+
+# Flatten one Google Books volume into the fields BookRecommendation needs
+def parse_volume(item):
+    volume_info = item.get("volumeInfo", {})
+    return {
+        "title": volume_info.get("title", "Unknown Title"),
+        "author": volume_info.get("authors", ["Unknown Author"])[0] if volume_info.get("authors") else "Unknown Author",
+        "description": volume_info.get("description", "No description available"),
+        "cover_url": volume_info.get("imageLinks", {}).get("thumbnail") if "imageLinks" in volume_info else None,
+        "rating": volume_info.get("averageRating"),
+        "genres": volume_info.get("categories", []),
+        "google_books_id": item.get("id"),
+    }
+
+
+class GoogleBooksClient:
+    """Async Google Books client with a shared connection pool.
+
+    Subject searches are cached by (genre, max_results): there are only a
+    couple of dozen genres, so the same handful of queries repeat all day.
+    A result older than ``fresh_for`` seconds is stale-while-revalidate: it
+    is returned at once and refetched in the background, and only dropped
+    ``stale_for`` seconds later. The optional ``collection`` (an
+    AsyncCollection) is a second tier shared by every worker: it is read
+    before Google Books on a miss or a revalidation, and every fetched
+    result is written to it. ``base_url`` and ``transport`` can point the
+    client at a local stand-in.
+    """
+
+    def __init__(
+        self,
+        base_url: str = GOOGLE_BOOKS_API_URL,
+        timeout: float = float(os.getenv("GOOGLE_BOOKS_TIMEOUT", 10)),
+        max_connections: int = int(os.getenv("GOOGLE_BOOKS_MAX_CONNECTIONS", 20)),
+        retries: int = int(os.getenv("GOOGLE_BOOKS_RETRIES", 2)),
+        backoff: float = 0.2,
+        cache: LRUCache = None,
+        transport: httpx.AsyncBaseTransport = None,
+        breaker: CircuitBreaker = None,
+        fresh_for: float = GOOGLE_BOOKS_CACHE_TTL,
+        stale_for: float = GOOGLE_BOOKS_STALE_SECONDS,
+        collection=None,
+    ):
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(timeout, connect=min(timeout, 5.0))
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+        self.retries = retries
+        self.backoff = backoff
+        self.fresh_for = fresh_for
+        self.stale_for = stale_for
+        self.collection = collection
+        # Cached values are (books, fetched_at); the cache's own TTL is the
+        # end of the stale window
+        self.cache = cache if cache is not None else LRUCache(
+            maxsize=int(os.getenv("GOOGLE_BOOKS_CACHE_SIZE", 256)),
+            ttl=fresh_for + stale_for,
+            name="google_books",
+        )
+        self._revalidating = {}
+        self._transport = transport
+        self._client = None
+        # Concurrent searches for the same genre share one request
+        self.flight = AsyncSingleFlight("google_books")
+        self.breaker = breaker if breaker is not None else CircuitBreaker(
+            "google_books",
+            failure_threshold=int(os.getenv("GOOGLE_BOOKS_BREAKER_FAILURES", 5)),
+            reset_timeout=float(os.getenv("GOOGLE_BOOKS_BREAKER_RESET", 30)),
+            slow_call_seconds=float(os.getenv("GOOGLE_BOOKS_SLOW_CALL_SECONDS", 5)),
+        )
+
+    # The pooled client is created on first use so it binds to the running loop
+    def _get_client(self):
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout, limits=self.limits, transport=self._transport
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _get_json(self, params):
+        client = self._get_client()
+        for attempt in range(self.retries + 1):
+            try:
+                response = await client.get(self.base_url, params=params)
+                if response.status_code >= 400:
+                    upstream_errors.inc("google_books", str(response.status_code))
+                if response.status_code in RETRY_STATUS_CODES and attempt < self.retries:
+                    logger.warning(f"Google Books returned {response.status_code}, retrying")
+                else:
+                    response.raise_for_status()
+                    return response.json()
+            except httpx.HTTPStatusError as e:
+                raise GoogleBooksError(str(e)) from e
+            except (httpx.TransportError, ValueError) as e:
+                upstream_errors.inc("google_books", type(e).__name__)
+                if attempt >= self.retries:
+                    raise GoogleBooksError(str(e)) from e
+                logger.warning(f"Google Books request failed ({e}), retrying")
+            await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def search_subject(self, genre: str, max_results: int = 5):
+        key = (genre, max_results)
+        entry = self.cache.get(key)
+        if entry is MISSING:
+            entry = await self._load_shared(genre, max_results)
+        if entry is not None and entry is not MISSING:
+            books, fetched_at = entry
+            if time.monotonic() - fetched_at >= self.fresh_for:
+                stale_responses.inc("google_books")
+                self._revalidate(genre, max_results)
+            return books
+        return await self.refresh(genre, max_results)
+
+    @staticmethod
+    def _shared_id(genre, max_results):
+        return f"{genre}\x1f{max_results}"
+
+    # The shared tier's result, promoted into the memory tier with its age
+    # kept, or None
+    async def _load_shared(self, genre, max_results):
+        if self.collection is None:
+            return None
+        try:
+            doc = await self.collection.find_one({"_id": self._shared_id(genre, max_results)})
+        except PyMongoError as e:
+            logger.warning(f"Google Books shared cache lookup failed: {e}")
+            return None
+        if doc is None:
+            return None
+        age = (datetime.utcnow() - doc["fetched_at"]).total_seconds()
+        if age >= self.fresh_for + self.stale_for:
+            return None
+        entry = (doc["books"], time.monotonic() - max(age, 0))
+        self.cache.set((genre, max_results), entry, ttl=self.fresh_for + self.stale_for - age)
+        return entry
+
+    async def _store_shared(self, genre, max_results, books):
+        if self.collection is None:
+            return
+        now = datetime.utcnow()
+        try:
+            await self.collection.update_one(
+                {"_id": self._shared_id(genre, max_results)},
+                {"$set": {"books": books, "fetched_at": now,
+                          "expires_at": now + timedelta(seconds=self.fresh_for + self.stale_for)}},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            logger.warning(f"Google Books shared cache write failed: {e}")
+
+    async def fetched_at(self, genre: str, max_results: int = 5):
+        """When the cached result for a search was fetched, on the
+        time.monotonic() clock, looking in the shared tier too; None if
+        nothing usable is cached."""
+        entry = self.cache.get((genre, max_results))
+        if entry is MISSING:
+            entry = await self._load_shared(genre, max_results)
+        return None if entry is None or entry is MISSING else entry[1]
+
+    # A newer result another worker stored, else Google Books
+    async def _revalidated(self, genre, max_results):
+        entry = await self._load_shared(genre, max_results)
+        if entry is not None and time.monotonic() - entry[1] < self.fresh_for:
+            return entry[0]
+        return await self.refresh(genre, max_results)
+
+    async def refresh(self, genre: str, max_results: int = 5):
+        """Fetch a subject search from Google Books and cache it, whatever
+        the cache holds."""
+        return await self.flight.do((genre, max_results), lambda: self._fetch_subject(genre, max_results))
+
+    # One background refetch per stale key; if it fails the stale result
+    # keeps being served and the next request past it tries again
+    def _revalidate(self, genre, max_results):
+        key = (genre, max_results)
+        if key in self._revalidating:
+            return
+        task = asyncio.ensure_future(self._revalidated(genre, max_results))
+        self._revalidating[key] = task
+
+        def done(task):
+            self._revalidating.pop(key, None)
+            if not task.cancelled() and task.exception() is not None:
+                logger.warning(f"Could not revalidate Google Books results for {genre!r}: {task.exception()}")
+        task.add_done_callback(done)
+
+    async def _fetch_subject(self, genre, max_results):
+        try:
+            # Retries happen inside; only the final outcome counts
+            with self.breaker.guard(), span("google_books_request"):
+                data = await self._get_json({
+                    "q": f"subject:{genre}",
+                    "maxResults": max_results,
+                    "orderBy": "relevance",
+                })
+        except CircuitOpenError as e:
+            raise GoogleBooksUnavailable(str(e)) from e
+        books = [parse_volume(item) for item in data.get("items", [])]
+        self.cache.set((genre, max_results), (books, time.monotonic()))
+        await self._store_shared(genre, max_results, books)
+        return books
+
+
+def _shared_collection():
+    if not GOOGLE_BOOKS_CACHE_MONGO:
+        return None
+    from .db import AsyncCollection
+    return AsyncCollection("book_searches")
+
+
+# Shared client for the whole process
+google_books_client = GoogleBooksClient(collection=_shared_collection())
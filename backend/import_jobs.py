@@ -0,0 +1,249 @@
+"""Playlist imports as background jobs persisted in Mongo.
+
+POST /songs/import stores a job document listing every submitted track and
+returns its id straight away. A pool of asyncio workers in each app process
+claims queued jobs with an atomic find_one_and_update and ingests their
+tracks chunk by chunk with ingest_songs (concurrent Last.fm lookups, batched
+inserts). After every chunk the per-track outcomes and counters are written
+back to the job, which is what GET /songs/import/{job_id}/events streams to
+the browser.
+
+Because progress lives in Mongo, a restarted or crashed worker loses at most
+the chunk it was working on: a job left "running" without a heartbeat for
+IMPORT_STALE_SECONDS is claimed again and only its still-pending tracks are
+processed. Tracks of that interrupted chunk may be inserted twice.
+"""
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from .db import async_import_jobs_collection
+from .ingest import ingest_songs
+from .recommendations import materialize_tracks
+from .routes.playlist import LASTFM_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# Concurrent jobs per app process; each fetches LASTFM_CONCURRENCY tracks at once
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", 2))
+# Tracks ingested between two progress writes
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", 25))
+# Largest playlist one job accepts; the job document holds every track
+IMPORT_MAX_TRACKS = int(os.getenv("IMPORT_MAX_TRACKS", 10000))
+# Seconds without a heartbeat after which a running job is taken over
+IMPORT_STALE_SECONDS = float(os.getenv("IMPORT_STALE_SECONDS", 120))
+# Seconds an idle worker waits before looking for jobs queued elsewhere
+IMPORT_POLL_SECONDS = float(os.getenv("IMPORT_POLL_SECONDS", 5))
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+FINISHED = (COMPLETED, FAILED)
+
+
+def _worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+WORKER_ID = _worker_id()
+
+
+# Workers forked from a preloaded parent (python -m backend.prefork) each
+# need an identity of their own to claim jobs under
+def _new_worker_id():
+    global WORKER_ID
+    WORKER_ID = _worker_id()
+
+
+os.register_at_fork(after_in_child=_new_worker_id)
+
+
+def _track(song):
+    song = song if isinstance(song, dict) else {}
+    return {"title": song.get("title"), "artist": song.get("artist"), "status": "pending"}
+
+
+async def create_job(songs):
+    now = datetime.now()
+    job = {
+        "status": QUEUED,
+        "total": len(songs),
+        "processed": 0,
+        "added": 0,
+        "failed": 0,
+        "tracks": [_track(song) for song in songs],
+        "attempts": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    result = await async_import_jobs_collection.insert_one(job)
+    job_runner.wake()
+    return str(result.inserted_id)
+
+
+async def get_job(job_id, include_tracks=True):
+    if not ObjectId.is_valid(job_id):
+        return None
+    projection = None if include_tracks else {"tracks": 0}
+    return await async_import_jobs_collection.find_one({"_id": ObjectId(job_id)}, projection)
+
+
+# The public view of a job; per-track outcomes only when they were loaded
+def job_summary(job):
+    summary = {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "total": job["total"],
+        "processed": job["processed"],
+        "added": job["added"],
+        "failed": job["failed"],
+        "created_at": job["created_at"],
+        "finished_at": job.get("finished_at"),
+        "error": job.get("error"),
+    }
+    if "tracks" in job:
+        summary["tracks"] = [{"index": index, **track} for index, track in enumerate(job["tracks"])]
+    return summary
+
+
+async def claim_job():
+    now = datetime.now()
+    return await async_import_jobs_collection.find_one_and_update(
+        {"$or": [
+            {"status": QUEUED},
+            {"status": RUNNING, "heartbeat_at": {"$lt": now - timedelta(seconds=IMPORT_STALE_SECONDS)}},
+        ]},
+        {"$set": {"status": RUNNING, "worker": WORKER_ID, "heartbeat_at": now, "updated_at": now},
+         "$inc": {"attempts": 1}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+# Record one chunk's outcomes. Returns whether this worker still owns the
+# job (another may have taken it over, in which case this one must stop)
+# and the tracks of the songs added.
+async def _record_chunk(job_id, chunk, results):
+    now = datetime.now()
+    update = {"$set": {"heartbeat_at": now, "updated_at": now}, "$inc": {"processed": len(chunk)}}
+    added_ids, track_ids = [], []
+    for (index, _), result in zip(chunk, results):
+        prefix = f"tracks.{index}"
+        update["$set"][f"{prefix}.status"] = result["status"]
+        if result["status"] == "added":
+            song = result["song"]
+            update["$set"][f"{prefix}.song_id"] = song["_id"]
+            update["$set"][f"{prefix}.name"] = song["name"]
+            update["$set"][f"{prefix}.artist"] = song["artist"]
+            added_ids.append(song["_id"])
+            track_ids.append(song["track_id"])
+        else:
+            update["$set"][f"{prefix}.error"] = result.get("error")
+    update["$inc"]["added"] = len(added_ids)
+    update["$inc"]["failed"] = len(chunk) - len(added_ids)
+
+    result = await async_import_jobs_collection.update_one({"_id": job_id, "worker": WORKER_ID}, update)
+    return result.matched_count == 1, track_ids
+
+
+async def _finish(job_id, status, error=None):
+    now = datetime.now()
+    update = {"status": status, "finished_at": now, "updated_at": now}
+    if error:
+        update["error"] = error
+    await async_import_jobs_collection.update_one({"_id": job_id, "worker": WORKER_ID}, {"$set": update})
+
+
+class ImportJobRunner:
+    """The per-process pool of import workers, started and stopped with
+    the app."""
+
+    def __init__(self, workers=IMPORT_WORKERS):
+        self.workers = workers
+        self._tasks = []
+        self._background = set()
+        self._wakeup = None
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        logger.info(f"Started {self.workers} import workers as {WORKER_ID}")
+
+    # Called on enqueue so a job queued in this process starts immediately
+    def wake(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def stop(self, timeout=10.0):
+        """Let workers finish the chunk in hand, then hand their jobs back to
+        the queue. Workers that do not stop in time are cancelled; their jobs
+        are picked up once the heartbeat goes stale."""
+        self._stopping = True
+        self.wake()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+        self._tasks = []
+
+    def _spawn(self, coro):
+        task = asyncio.create_task(coro)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _work(self):
+        while not self._stopping:
+            # Cleared before the claim, so a job queued meanwhile is not missed
+            self._wakeup.clear()
+            try:
+                job = await claim_job()
+            except Exception as e:
+                logger.error(f"Could not claim an import job: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), IMPORT_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Import worker error on job {job['_id']}: {e}")
+
+    async def _run(self, job):
+        job_id = job["_id"]
+        pending = [(index, track) for index, track in enumerate(job["tracks"]) if track["status"] == "pending"]
+        logger.info(f"Import job {job_id}: {len(pending)} of {job['total']} tracks left (attempt {job['attempts']})")
+        try:
+            for start in range(0, len(pending), IMPORT_CHUNK_SIZE):
+                if self._stopping:
+                    # Back to the queue for this or another process to resume
+                    await async_import_jobs_collection.update_one(
+                        {"_id": job_id, "worker": WORKER_ID}, {"$set": {"status": QUEUED, "worker": None}}
+                    )
+                    return
+                chunk = pending[start:start + IMPORT_CHUNK_SIZE]
+                results = await ingest_songs([track for _, track in chunk], LASTFM_CONCURRENCY)
+                owned, track_ids = await _record_chunk(job_id, chunk, results)
+                if track_ids:
+                    self._spawn(materialize_tracks(track_ids))
+                if not owned:
+                    logger.warning(f"Import job {job_id} was taken over by another worker")
+                    return
+            await _finish(job_id, COMPLETED)
+            logger.info(f"Import job {job_id} completed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Import job {job_id} failed: {e}")
+            await _finish(job_id, FAILED, str(e))
+
+
+job_runner = ImportJobRunner()
@@ -0,0 +1,134 @@
+"""Declared MongoDB indexes and query plan checks.
+
+Apply the indexes (idempotent, safe on every deploy) and fail the run if a
+hot query would scan a whole collection:
+
+    python -m backend.indexes --verify
+
+Song documents stored before the track catalog are normalized and moved
+into it by python -m backend.migrate_tracks.
+"""
+import argparse
+import logging
+import sys
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+from .db import get_db
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {
+    "users": [
+        # Every register/login looks users up by email; also enforces uniqueness
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "playlists": [
+        # Keyset pagination on GET /songs/?sort=created_at
+        IndexModel([("created_at", ASCENDING), ("_id", ASCENDING)], name="created_at_id"),
+        # Entries of a track, e.g. to count how many playlists hold it
+        IndexModel([("track_id", ASCENDING)], name="track_id"),
+    ],
+    "tracks": [
+        # Ingest resolves every submitted (artist, title) hash through this;
+        # unique so two spellings can never claim the same key
+        IndexModel([("lookup_keys", ASCENDING)], name="lookup_keys_unique", unique=True),
+        # Lookups of a track regardless of case, spacing or featured artists
+        IndexModel([("artist_norm", ASCENDING), ("name_norm", ASCENDING)], name="artist_name_norm"),
+        IndexModel([("tags", ASCENDING)], name="tags"),
+    ],
+    "tags": [
+        # Interning looks tags up by their normalized string; unique so two
+        # processes can never give one tag two ids
+        IndexModel([("tag", ASCENDING)], name="tag_unique", unique=True),
+        # Top tags for the facets endpoint
+        IndexModel([("songs", DESCENDING)], name="songs"),
+    ],
+    "book_searches": [
+        # Shared Google Books results; Mongo drops them once fully stale
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "import_jobs": [
+        # Workers claim the oldest runnable job
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created_at"),
+    ],
+}
+
+# (collection, filter, sort) for every query on a hot path; none of them may
+# be answered with a collection scan
+HOT_QUERIES = [
+    ("users", {"email": "probe@example.com"}, None),
+    ("playlists", {}, [("created_at", ASCENDING), ("_id", ASCENDING)]),
+    ("playlists", {"track_id": "probe"}, None),
+    ("tracks", {"lookup_keys": {"$in": ["probe"]}}, None),
+    ("tracks", {"artist_norm": "probe", "name_norm": "probe"}, None),
+    ("tracks", {"tags": "rock"}, None),
+    ("tags", {"tag": {"$in": ["probe"]}}, None),
+    ("tags", {"songs": {"$gt": 0}}, [("songs", DESCENDING)]),
+    ("import_jobs", {"status": "queued"}, [("created_at", ASCENDING)]),
+]
+
+
+def ensure_indexes(db=None):
+    db = db if db is not None else get_db()
+    for collection_name, models in INDEXES.items():
+        try:
+            created = db[collection_name].create_indexes(models)
+            logger.info(f"Indexes on {collection_name}: {', '.join(created)}")
+        except OperationFailure as e:
+            # e.g. an existing index with the same name but different options
+            logger.error(f"Could not create indexes on {collection_name}: {e}")
+            raise
+
+
+def _plan_stages(plan):
+    stages = set()
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.add(plan["stage"])
+        for key in ("inputStage", "queryPlan", "outerStage", "innerStage"):
+            stages |= _plan_stages(plan.get(key))
+        for child in plan.get("inputStages", []):
+            stages |= _plan_stages(child)
+    return stages
+
+
+def explain_stages(collection, query, sort=None):
+    cursor = collection.find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explanation = cursor.explain()
+    return _plan_stages(explanation["queryPlanner"]["winningPlan"])
+
+
+def verify_query_plans(db=None):
+    """Return a description of every hot query whose winning plan scans a
+    whole collection; an empty list means all of them use an index."""
+    db = db if db is not None else get_db()
+    failures = []
+    for collection_name, query, sort in HOT_QUERIES:
+        stages = explain_stages(db[collection_name], query, sort)
+        if "COLLSCAN" in stages:
+            failures.append(f"{collection_name}.find({query}, sort={sort}) -> {sorted(stages)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply MongoDB indexes and check hot query plans")
+    parser.add_argument("--verify", action="store_true", help="fail if a hot query uses a collection scan")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ensure_indexes()
+    if args.verify:
+        failures = verify_query_plans()
+        for failure in failures:
+            logger.error(f"Collection scan: {failure}")
+        if failures:
+            sys.exit(1)
+        logger.info("All hot queries use an index")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import os
+
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from .db import async_playlists_collection
+from .routes.playlist import LASTFM_CONCURRENCY, get_track_metadata
+from .tag_vocab import count_songs
+from .tracks import build_entry, build_track_doc, find_tracks, song_view, track_key, upsert_tracks
+
+logger = logging.getLogger(__name__)
+
+# Entries per insert_many round trip
+INSERT_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 500))
+
+
+def _result(index, submitted, status, **extra):
+    return {
+        "index": index,
+        "title": submitted.get("title") if isinstance(submitted, dict) else None,
+        "artist": submitted.get("artist") if isinstance(submitted, dict) else None,
+        "status": status,
+        **extra,
+    }
+
+
+def _valid(song):
+    return isinstance(song, dict) and song.get("title") and song.get("artist")
+
+
+async def _fetch_track(key, song, semaphore):
+    async with semaphore:
+        try:
+            # get_track_metadata blocks on the rate limiter and on Last.fm
+            metadata = await asyncio.to_thread(get_track_metadata, song["artist"], song["title"])
+        except HTTPException as e:
+            logger.error(f"Last.fm API error for {song['title']}: {e.detail}")
+            return f"Error fetching Last.fm data: {e.detail}", None
+        except Exception as e:
+            logger.error(f"Last.fm API error for {song['title']}: {str(e)}")
+            return f"Error fetching Last.fm data: {str(e)}", None
+    return None, build_track_doc(metadata, key)
+
+
+# The catalog track for a submitted song, fetched from Last.fm and added to
+# the catalog only when no earlier submission stored it
+async def ensure_track(artist, title):
+    key = track_key(artist, title)
+    track = (await find_tracks([key])).get(key)
+    if track is None:
+        metadata = await asyncio.to_thread(get_track_metadata, artist, title)
+        track = (await upsert_tracks([build_track_doc(metadata, key)]))[0]
+    return track
+
+
+async def _insert_batch(batch, songs, results):
+    entries = [build_entry(track["_id"]) for _, track, _ in batch]
+    failed = {}
+    try:
+        await async_playlists_collection.insert_many(entries, ordered=False)
+    except BulkWriteError as e:
+        # Unordered inserts keep going past a bad document; only the listed
+        # positions failed
+        failed = {error["index"]: error.get("errmsg", "Write error") for error in e.details.get("writeErrors", [])}
+    except PyMongoError as e:
+        logger.error(f"MongoDB error: {str(e)}")
+        failed = {position: str(e) for position in range(len(entries))}
+
+    added = []
+    for position, ((index, track, source), entry) in enumerate(zip(batch, entries)):
+        if position in failed:
+            results[index] = _result(index, songs[index], "failed", error=f"Database error: {failed[position]}")
+        else:
+            song = song_view(entry, track)
+            song["_id"] = str(song["_id"])
+            results[index] = _result(index, songs[index], "added", song=song, source=source)
+            added.append(track)
+    await count_songs(added)
+
+
+async def ingest_songs(songs, concurrency: int = LASTFM_CONCURRENCY):
+    """Resolve ``songs`` against the track catalog and store an entry for each.
+
+    Tracks already in the catalog cost one indexed lookup; Last.fm is asked
+    only about the rest, once per distinct track, concurrently. Returns one
+    result per input song, in input order, with ``status`` set to "added"
+    (with the stored ``song`` and ``source``, "catalog" or "lastfm") or
+    "failed" (with an ``error``). A failing song never aborts the rest.
+    """
+    results = [None] * len(songs)
+    keys = {}
+    for index, song in enumerate(songs):
+        if _valid(song):
+            keys[index] = track_key(song["artist"], song["title"])
+        else:
+            results[index] = _result(index, song, "failed", error="Each song must have 'title' and 'artist'")
+
+    try:
+        known = await find_tracks(set(keys.values()))
+    except PyMongoError as e:
+        logger.error(f"MongoDB error looking up tracks: {str(e)}")
+        known = {}
+
+    missing = {}
+    for index, key in keys.items():
+        if key not in known:
+            missing.setdefault(key, songs[index])
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    fetched = await asyncio.gather(*(_fetch_track(key, song, semaphore) for key, song in missing.items()))
+
+    errors, new_tracks = {}, {}
+    for key, (error, track) in zip(missing, fetched):
+        if track is None:
+            errors[key] = error
+        else:
+            new_tracks[key] = track
+    try:
+        new_tracks = dict(zip(new_tracks, await upsert_tracks(list(new_tracks.values()))))
+    except PyMongoError as e:
+        logger.error(f"MongoDB error: {str(e)}")
+        errors.update({key: f"Database error: {str(e)}" for key in new_tracks})
+        new_tracks = {}
+
+    pending = []
+    for index, key in keys.items():
+        if key in known:
+            pending.append((index, known[key], "catalog"))
+        elif key in new_tracks:
+            pending.append((index, new_tracks[key], "lastfm"))
+        else:
+            results[index] = _result(index, songs[index], "failed", error=errors[key])
+    for start in range(0, len(pending), INSERT_BATCH_SIZE):
+        await _insert_batch(pending[start:start + INSERT_BATCH_SIZE], songs, results)
+
+    added = sum(1 for result in results if result["status"] == "added")
+    logger.info(f"Bulk ingest stored {added} of {len(songs)} songs, "
+                f"{len(missing)} distinct tracks looked up on Last.fm")
+    return results
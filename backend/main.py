@@ -1,4 +1,5 @@
 from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
@@ -6,24 +7,30 @@ from pathlib import Path
 from backend.routes.auth import router as auth_router
 from backend.routes.playlist import lastfm_router
 from backend.routes.songs import router as songs_router
+from backend.routes.imports import import_router
 from backend.routes.book_recommendations import book_recommendations_router
+from backend.routes.admin import admin_router
+from backend.genres import tag_cache
+from backend.google_books import google_books_client
+from backend.executors import shutdown_executors
+from backend.import_jobs import job_runner
+from backend.book_prefetch import BOOK_PREFETCH_ENABLED, book_prefetcher
 import os
+import asyncio
 import uvicorn
-from pymongo import MongoClient
-import os
 from dotenv import load_dotenv
-import certifi
 import logging 
-from backend.db import get_database, client
+from fastapi import HTTPException
+from backend.db import close_client, ping
+from backend.indexes import ensure_indexes
+from backend.metrics import http_request_duration, render_metrics
+import time
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 load_dotenv()  # Load environment variables from .env file
 
-MONGO_URL = os.getenv("MONGO_URL")  
-client = MongoClient(MONGO_URL, tlsCAFile=certifi.where(), tls=True, tlsAllowInvalidCertificates=True)
-
 # Initialize FastAPI app
 app = FastAPI()
 
@@ -36,6 +43,22 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Latency of every request, labelled with the route template rather than
+# the raw path so /songs/{song_id} is one series
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        http_request_duration.observe(
+            time.perf_counter() - start, request.method, getattr(route, "path", "unmatched"), str(status)
+        )
+
 # Set up templates directory
 templates = Jinja2Templates(directory=Path("frontend/templates"))
 
@@ -67,11 +90,17 @@ def recommendations_page(request: Request):
 def book_recommendations_page(request: Request):
     return templates.TemplateResponse("book_recommendations.html", {"request": request})
 
+# Prometheus scrape endpoint: request and stage latency histograms, upstream
+# error counters and cache/executor gauges
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/test-db")
 async def test_db():
     try:
         # Test the connection
-        client.admin.command('ping')
+        await asyncio.to_thread(ping)
         return {"status": "Connected to MongoDB", "message": "Database connection is healthy"}
     except Exception as e:
         logger.error(f"Database connection error: {e}")
@@ -80,29 +109,77 @@ async def test_db():
 @app.on_event("startup")
 async def startup_db_client():
     try:
-        client.admin.command('ping')
+        await asyncio.to_thread(ping)
         logger.info("Connected to MongoDB at startup")
     except Exception as e:
         logger.error(f"Failed to connect to MongoDB at startup: {e}")
         raise
 
+# Index creation is idempotent; deploys can also run python -m backend.indexes
+@app.on_event("startup")
+async def create_indexes():
+    if os.getenv("MONGO_ENSURE_INDEXES", "true").lower() in ("1", "true", "yes"):
+        await asyncio.to_thread(ensure_indexes)
+
+# Background playlist import workers; they also resume jobs a previous
+# process left unfinished
+@app.on_event("startup")
+async def start_import_workers():
+    job_runner.start()
+
+@app.on_event("shutdown")
+async def stop_import_workers():
+    await job_runner.stop()
+
+# Google Books results for every book genre, fetched before anyone asks and
+# refreshed before they go stale; opt-in with BOOK_PREFETCH, and only the
+# worker holding the prefetch lease refreshes
+@app.on_event("startup")
+async def start_book_prefetch():
+    if BOOK_PREFETCH_ENABLED:
+        book_prefetcher.start()
+
+@app.on_event("shutdown")
+async def stop_book_prefetch():
+    await book_prefetcher.stop()
+
 # Shutdown event to close database connection
 @app.on_event("shutdown")
 async def shutdown_db_client():
     try:
-        client.close()
+        close_client()
         logger.info("Closed MongoDB connection")
     except Exception as e:
         logger.error(f"Error closing MongoDB connection: {e}")
 
+# Persist tag embeddings so the next start does not have to re-encode them
+@app.on_event("shutdown")
+async def save_tag_cache():
+    try:
+        tag_cache.save()
+    except Exception as e:
+        logger.error(f"Error saving tag cache: {e}")
+
+@app.on_event("shutdown")
+async def close_google_books_client():
+    await google_books_client.aclose()
+
+@app.on_event("shutdown")
+async def stop_executors():
+    shutdown_executors()
+
 
 
 # Include routers
 app.include_router(auth_router, prefix="/auth", tags=["Authentication"])
 app.include_router(lastfm_router, prefix="/lastfm", tags=["LastFM"])
+app.include_router(import_router, prefix="/songs/import", tags=["Songs"])
 app.include_router(songs_router, prefix="/songs", tags=["Songs"])
 app.include_router(book_recommendations_router, prefix="/api/books", tags=["Book Recommendations"])
+app.include_router(admin_router, prefix="/admin", tags=["Admin"])
 
+# Single process; python -m backend.prefork runs several workers that
+# share the loaded model
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))  # Default to 8000 if PORT is not set
     uvicorn.run(app, host="0.0.0.0", port=port)
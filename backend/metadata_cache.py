@@ -0,0 +1,111 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+from .cache import LRUCache, MISSING, register_cache
+from .utils import normalize_track_key
+
+logger = logging.getLogger(__name__)
+
+# Returned by MetadataCache.get for tracks Last.fm does not know about
+NOT_FOUND = object()
+
+
+class MetadataCache:
+    """Two-tier cache of Last.fm track metadata keyed on (artist, track).
+
+    Keys are normalized, so "Get Lucky (feat. Pharrell Williams)" and
+    "get lucky" share an entry. The first tier is an in-process LRU; the
+    optional second tier is a MongoDB collection with a TTL index, which
+    survives restarts and is shared by every worker. "Track not found"
+    results are cached too, for ``negative_ttl`` seconds.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float, collection=None):
+        self.memory = LRUCache(maxsize, ttl=ttl)
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.collection = collection
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self._indexed = False
+        register_cache("lastfm_metadata", self)
+
+    @staticmethod
+    def key(artist, track):
+        return "\x1f".join(normalize_track_key(artist, track))
+
+    def _ensure_index(self):
+        if not self._indexed:
+            # Mongo's TTL monitor removes entries once expires_at has passed
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexed = True
+
+    def get(self, artist, track):
+        key = self.key(artist, track)
+        value = self.memory.get(key)
+        if value is not MISSING or self.collection is None:
+            return NOT_FOUND if value is None else value
+
+        try:
+            doc = self.collection.find_one({"_id": key, "expires_at": {"$gt": datetime.utcnow()}})
+        except PyMongoError as e:
+            logger.warning(f"Metadata cache lookup failed: {e}")
+            return MISSING
+        if doc is None:
+            self.shared_misses += 1
+            return MISSING
+        self.shared_hits += 1
+
+        # Promote into the memory tier for whatever lifetime remains
+        remaining = (doc["expires_at"] - datetime.utcnow()).total_seconds()
+        value = doc.get("metadata")
+        self.memory.set(key, value, ttl=max(remaining, 1))
+        return NOT_FOUND if value is None else value
+
+    def _store(self, artist, track, value, ttl):
+        key = self.key(artist, track)
+        self.memory.set(key, value, ttl=ttl)
+        if self.collection is None:
+            return
+        try:
+            self._ensure_index()
+            self.collection.replace_one(
+                {"_id": key},
+                {"metadata": value, "expires_at": datetime.utcnow() + timedelta(seconds=ttl)},
+                upsert=True,
+            )
+        except PyMongoError as e:
+            logger.warning(f"Metadata cache write failed: {e}")
+
+    def set(self, artist, track, metadata: dict):
+        self._store(artist, track, metadata, self.ttl)
+
+    def set_not_found(self, artist, track):
+        self._store(artist, track, None, self.negative_ttl)
+
+    def stats(self):
+        return {
+            **self.memory.stats(),
+            "negative_ttl": self.negative_ttl,
+            "shared_tier": self.collection is not None,
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+        }
+
+
+def _shared_collection():
+    if os.getenv("LASTFM_CACHE_MONGO", "").lower() not in ("1", "true", "yes"):
+        return None
+    from .db import LazyCollection
+    return LazyCollection("lastfm_cache")
+
+
+lastfm_metadata_cache = MetadataCache(
+    maxsize=int(os.getenv("LASTFM_CACHE_SIZE", 5000)),
+    ttl=float(os.getenv("LASTFM_CACHE_TTL", 24 * 3600)),
+    negative_ttl=float(os.getenv("LASTFM_CACHE_NEGATIVE_TTL", 3600)),
+    collection=_shared_collection(),
+)
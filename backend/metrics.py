@@ -0,0 +1,182 @@
+"""In-process metrics in the Prometheus text exposition format.
+
+Histograms and counters are plain thread-safe objects registered here and
+rendered by GET /metrics; no client library is needed. Time a stage of a
+request with
+
+    with span("google_books"):
+        ...
+
+or decorate a function with @timed("encode").
+"""
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from .cache import cache_stats
+
+# Seconds; covers a cached lookup up to a slow upstream call
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metrics = []
+# Functions returning extra exposition lines, called at scrape time
+_collectors = []
+
+
+def _labels_text(labelnames, values, extra=()):
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f"{self.name}{_labels_text(self.labelnames, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts (non-cumulative, last is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value, *labels):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][position] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((labels, (list(counts), total)) for labels, (counts, total) in self._series.items())
+        for labels, (counts, total) in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                bucket_labels = _labels_text(self.labelnames, labels, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _labels_text(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_number(total)}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "Time to handle an HTTP request", ("method", "route", "status")
+)
+stage_duration = Histogram(
+    "stage_duration_seconds", "Time spent in one stage of a request", ("stage",)
+)
+upstream_errors = Counter(
+    "upstream_errors_total", "Failed calls to external services, retried ones included", ("service", "reason")
+)
+stale_responses = Counter(
+    "stale_responses_total", "Lookups answered from a stale cache entry while it is refetched", ("cache",)
+)
+
+
+@contextmanager
+def span(stage):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_duration.observe(time.perf_counter() - start, stage)
+
+
+def timed(stage):
+    """Decorator recording every call of a function (sync or async) as
+    ``stage``."""
+    def decorate(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with span(stage):
+                    return await fn(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def register_collector(collect):
+    _collectors.append(collect)
+    return collect
+
+
+def gauge_lines(name, documentation, labelname, values, kind="gauge"):
+    """Exposition lines for a gauge (or a counter kept elsewhere) with one
+    label, from {label: value}."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for label, value in sorted(values.items()):
+        lines.append(f"{name}{_labels_text((labelname,), (label,))} {_number(value)}")
+    return lines
+
+
+# Counters of the named in-process caches, read at scrape time
+@register_collector
+def _cache_lines():
+    stats = cache_stats()
+    lines = []
+    for metric, key, kind, documentation in (
+        ("cache_hits_total", "hits", "counter", "Cache lookups answered from the cache"),
+        ("cache_misses_total", "misses", "counter", "Cache lookups that missed"),
+        ("cache_evictions_total", "evictions", "counter", "Entries evicted to respect maxsize"),
+        ("cache_hit_ratio", "hit_rate", "gauge", "Share of lookups that hit since start"),
+        ("cache_entries", "size", "gauge", "Entries currently held"),
+    ):
+        lines += [f"# HELP {metric} {documentation}", f"# TYPE {metric} {kind}"]
+        for name, values in sorted(stats.items()):
+            if key in values:
+                lines.append(f"{metric}{_labels_text(('cache',), (name,))} {_number(values[key])}")
+    return lines
+
+
+def render_metrics():
+    lines = []
+    for metric in _metrics:
+        lines += metric.render()
+    for collect in _collectors:
+        lines += collect()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,191 @@
+"""Move song documents stored before the track catalog into it.
+
+Each legacy document in ``playlists`` holds a full copy of its track's
+Last.fm metadata. The migration streams them in _id order, upserts one
+catalog track per distinct normalized (artist, title), and rewrites each
+document in place into an entry referencing that track, so song ids and
+the URLs built from them keep working. A document whose metadata differs
+from the catalog track it lands on (say its tags were edited) gets a
+private copy of the track instead (see tracks.fork_track), so no edit is
+lost or shown to anyone else. It only touches documents without a
+``track_id``, so it can be stopped and rerun at any point, and the app
+serves both shapes while it runs.
+
+    python -m backend.migrate_tracks --dry-run
+    python -m backend.migrate_tracks
+
+Migrated tracks have no tag vocabulary ids yet; run python -m
+backend.tag_vocab afterwards to add them and recount the tag facets.
+"""
+import argparse
+import logging
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from .db import get_db
+from .indexes import ensure_indexes
+from .tracks import TRACK_FIELDS, fork_track, private_track_id, track_key, upsert_operation
+from .utils import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Indexes the playlists collection had while it held the track fields
+LEGACY_PLAYLIST_INDEXES = ("artist_name_norm", "tags")
+
+DUPLICATE_KEY = 11000
+
+# Fields a song's edit can change; listeners and playcount differ between
+# copies fetched at different times and are not compared
+EDITABLE_FIELDS = ("name", "artist", "album", "url", "tags")
+
+
+def track_from_song(song):
+    _id = track_key(song.get("artist"), song.get("name"))
+    track = {field: song.get(field) for field in ("name", "artist", "album", "listeners", "playcount", "url")}
+    track.update({
+        "_id": _id,
+        "tags": song.get("tags") or [],
+        "artist_norm": normalize_text(song.get("artist")),
+        "name_norm": normalize_text(song.get("name")),
+        "lookup_keys": [_id],
+        "created_at": song.get("created_at") or datetime.now(),
+        "updated_at": datetime.now(),
+    })
+    # Recommendations are a function of the tags, so the first copy's carry
+    # over; stale ones are recomputed by python -m backend.recommendations
+    if song.get("recommendations"):
+        track["recommendations"] = song["recommendations"]
+    return track
+
+
+def _legacy_batches(playlists, batch_size):
+    last_id = None
+    while True:
+        query = {"track_id": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(playlists.find(query).sort("_id", 1).limit(batch_size))
+        if not batch:
+            return
+        last_id = batch[-1]["_id"]
+        yield batch
+
+
+# Two writers upserting the same new track: one insert wins, and the track
+# the loser wanted exists either way
+def duplicate_only(error):
+    return all(e.get("code") == DUPLICATE_KEY for e in error.details.get("writeErrors", []))
+
+
+# The stored tracks for a batch, by every lookup key they hold. An upsert
+# that hit the unique lookup_keys index left its track uninserted, and the
+# entry must point at the track holding the key instead
+def _stored_tracks(tracks, catalog):
+    keys = list({key for track in catalog for key in track["lookup_keys"]})
+    return {key: track for track in tracks.find({"lookup_keys": {"$in": keys}}) for key in track["lookup_keys"]}
+
+
+# The song's editable fields that differ from the track it lands on
+def _edits(song, track):
+    edits = {}
+    for field in EDITABLE_FIELDS:
+        value = (song.get(field) or []) if field == "tags" else song.get(field)
+        if value != track.get(field):
+            edits[field] = value
+    if "name" in edits or "artist" in edits:
+        edits["artist_norm"] = normalize_text(song.get("artist"))
+        edits["name_norm"] = normalize_text(song.get("name"))
+    if "tags" in edits:
+        # Vocabulary ids only when the song's own tags were interned; python
+        # -m backend.tag_vocab adds the rest
+        edits["tag_ids"] = song.get("tag_ids")
+    return edits
+
+
+def _migrate_batch(playlists, tracks, songs, catalog):
+    try:
+        result = tracks.bulk_write([upsert_operation(track) for track in catalog], ordered=False)
+        created = result.upserted_count
+    except BulkWriteError as e:
+        if not duplicate_only(e):
+            raise
+        created = e.details.get("nUpserted", 0)
+    stored = _stored_tracks(tracks, catalog)
+
+    unset = {field: "" for field in TRACK_FIELDS}
+    updates, forked = [], 0
+    for song, track in zip(songs, catalog):
+        track = stored.get(track["_id"])
+        if track is None:
+            logger.error(f"No catalog track for legacy song {song['_id']}; left unmigrated")
+            continue
+        edits = _edits(song, track)
+        if edits:
+            private = fork_track(track, song["_id"], edits)
+            if private.get("tag_ids") is None:
+                private.pop("tag_ids", None)
+            tracks.update_one({"_id": private_track_id(song["_id"])}, {"$set": private}, upsert=True)
+            track, forked = private, forked + 1
+        updates.append(UpdateOne({"_id": song["_id"], "track_id": {"$exists": False}},
+                                 {"$set": {"track_id": track["_id"]}, "$unset": unset}))
+    if updates:
+        playlists.bulk_write(updates, ordered=False)
+    if forked:
+        logger.info(f"{forked} edited songs got a private track")
+    return created
+
+
+def migrate(db=None, batch_size=500, dry_run=False):
+    """Convert every legacy song document; returns (songs, new_tracks).
+    With dry_run nothing is written and new_tracks counts the distinct
+    tracks among the legacy songs."""
+    db = db if db is not None else get_db()
+    playlists, tracks = db["playlists"], db["tracks"]
+    songs_seen, new_tracks = 0, 0
+    distinct = set()
+    for songs in _legacy_batches(playlists, batch_size):
+        catalog = [track_from_song(song) for song in songs]
+        if dry_run:
+            distinct.update(track["_id"] for track in catalog)
+        else:
+            new_tracks += _migrate_batch(playlists, tracks, songs, catalog)
+        songs_seen += len(songs)
+        logger.info(f"Processed {songs_seen} legacy songs")
+    return songs_seen, len(distinct) if dry_run else new_tracks
+
+
+def drop_legacy_indexes(db=None):
+    db = db if db is not None else get_db()
+    existing = db["playlists"].index_information()
+    for name in LEGACY_PLAYLIST_INDEXES:
+        if name in existing:
+            try:
+                db["playlists"].drop_index(name)
+                logger.info(f"Dropped index playlists.{name}")
+            except OperationFailure as e:
+                logger.error(f"Could not drop index playlists.{name}: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move legacy song documents into the track catalog")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true", help="count songs and distinct tracks, write nothing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if not args.dry_run:
+        # The unique lookup_keys index must exist before tracks are upserted
+        ensure_indexes()
+    songs, tracks = migrate(batch_size=args.batch_size, dry_run=args.dry_run)
+    if args.dry_run:
+        logger.info(f"{songs} legacy songs would collapse into {tracks} distinct tracks")
+        return
+    logger.info(f"Migrated {songs} songs; {tracks} new catalog tracks, "
+                f"{songs - tracks} duplicates now share a track")
+    drop_legacy_indexes()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import base64
+import json
+import re
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .serialization import dumps
+
+# Documents fetched per cursor round trip and emitted per response chunk
+STREAM_BATCH_SIZE = 500
+
+# Sort orders usable with keyset pagination; each ends on _id so the order
+# is total even when created_at values collide
+SORT_KEYS = {
+    "_id": [("_id", 1)],
+    "created_at": [("created_at", 1), ("_id", 1)],
+}
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_.]*$")
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(doc, sort):
+    position = {"i": str(doc["_id"])}
+    if sort == "created_at":
+        position["c"] = doc["created_at"].isoformat()
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        last_id = ObjectId(position["i"])
+        if sort == "created_at":
+            return datetime.fromisoformat(position["c"]), last_id
+        return None, last_id
+    except (ValueError, KeyError, TypeError, InvalidId) as e:
+        raise CursorError(f"Invalid cursor: {e}")
+
+
+# Query filter selecting everything strictly after the cursor position
+def keyset_filter(cursor, sort):
+    if not cursor:
+        return {}
+    created_at, last_id = decode_cursor(cursor, sort)
+    if sort == "created_at":
+        return {"$or": [
+            {"created_at": {"$gt": created_at}},
+            {"created_at": created_at, "_id": {"$gt": last_id}},
+        ]}
+    return {"_id": {"$gt": last_id}}
+
+
+# Turn "name,artist,tags" into a Mongo projection; the sort keys are always
+# included so the next cursor can be built from the last document
+def parse_projection(fields, sort):
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    for name in names:
+        if not _FIELD_NAME.match(name):
+            raise ValueError(f"Invalid field name: {name!r}")
+    projection = {name: 1 for name in names}
+    for key, _ in SORT_KEYS[sort]:
+        projection[key] = 1
+    return projection
+
+
+# Serialize a Mongo cursor as {"<key>": [...]} in chunks of documents
+def stream_json_array(cursor, key):
+    yield b'{"' + key.encode() + b'":['
+    first = True
+    batch = []
+    for doc in cursor:
+        batch.append(dumps(doc))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield (b"" if first else b",") + b",".join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield (b"" if first else b",") + b",".join(batch)
+    yield b"]}"
+
+
+# Serialize a Mongo cursor as newline-delimited JSON in chunks of documents
+def stream_ndjson(cursor):
+    batch = []
+    for doc in cursor:
+        batch.append(dumps(doc))
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield b"\n".join(batch) + b"\n"
+            batch = []
+    if batch:
+        yield b"\n".join(batch) + b"\n"
@@ -0,0 +1,240 @@
+"""Production launcher that shares read-only artifacts between workers.
+
+    python -m backend.prefork --workers 4 --port 8000
+
+``uvicorn --workers`` spawns fresh interpreters, so every worker imports the
+app and loads its own sentence encoder (about 90 MB of weights on torch),
+genre index and tag cache. Here the parent binds the socket, imports the
+app, loads those artifacts once and then forks the workers. The large
+structures are numpy and torch buffers that are never written after
+loading, so their pages stay shared copy-on-write; gc.freeze() keeps the
+cyclic collector from writing to the headers of everything loaded before
+the fork. The book catalog embeddings and the tag cache store are
+memory-mapped files and are shared through the page cache in any mode.
+
+Fork safety:
+
+- torch is limited to one thread in the parent, so no OpenMP pool exists
+  at fork time; each worker then runs with ENCODER_THREADS threads, or its
+  share of the CPUs.
+- An ONNX Runtime session owns thread pools from the moment it is created,
+  so with ENCODER_BACKEND=onnx the encoder is still loaded in each worker.
+  The parent must then not encode either: the genre index has to come
+  from its artifact (python -m backend.genre_artifacts), or the launcher
+  refuses to start.
+- Mongo clients and import-job worker ids are reset in every child (see
+  the os.register_at_fork hooks in db.py and import_jobs.py); HTTP clients
+  are only created on first use, inside the worker.
+
+--no-preload loads the same artifacts in each worker after the fork, which
+is what an ordinary multi-worker deploy costs.
+benchmarks/bench_prefork_memory.py reports per-worker RSS and PSS for both.
+"""
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+PREFORK_WORKERS = int(os.getenv("PREFORK_WORKERS", os.cpu_count() or 1))
+# Seconds workers get to finish in-flight requests once asked to stop
+PREFORK_GRACEFUL_TIMEOUT = float(os.getenv("PREFORK_GRACEFUL_TIMEOUT", 30))
+# Encoder backends whose loaded model can safely cross a fork
+FORK_SAFE_BACKENDS = ("torch", "torch-int8")
+
+
+def preload(load_encoder=True):
+    """Load every read-only artifact the workers need into this process."""
+    from . import encoder
+    from .book_catalog import get_book_catalog
+    from .genres import get_genre_index
+
+    if load_encoder:
+        encoder.get_encoder()
+    # Also seeds the tag cache from its on-disk store
+    get_genre_index()
+    get_book_catalog()
+
+
+def require_genre_artifact():
+    """Raise RuntimeError unless the genre index can load from its prebuilt
+    artifact, i.e. without running the encoder."""
+    from .genre_artifacts import DEFAULT_ARTIFACT_PATH, ArtifactMismatch, load_artifacts
+    from .genres import BOOK_GENRES, MUSIC_GENRES
+
+    try:
+        load_artifacts(DEFAULT_ARTIFACT_PATH, MUSIC_GENRES, BOOK_GENRES)
+    except (ArtifactMismatch, OSError, ValueError, KeyError) as e:
+        raise RuntimeError(
+            f"Genre artifact {DEFAULT_ARTIFACT_PATH} is unusable ({e}); building it would load the encoder "
+            f"in the parent. Run python -m backend.genre_artifacts first, or start with --no-preload"
+        )
+
+
+def _set_encoder_threads(threads):
+    from . import encoder
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    # Read when an ONNX session is created in the worker
+    encoder.ENCODER_THREADS = threads
+
+
+def memory_usage(pid):
+    """Resident memory of a process in bytes, from /proc/<pid>/smaps_rollup:
+    ``rss``, ``pss`` (shared pages split between the processes mapping
+    them), ``shared`` and ``private``. Linux only."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) * 1024
+    return {
+        "rss": fields.get("Rss", 0),
+        "pss": fields.get("Pss", 0),
+        "shared": fields.get("Shared_Clean", 0) + fields.get("Shared_Dirty", 0),
+        "private": fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0),
+    }
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+# A worker whose parent died stops instead of serving on unsupervised
+def _exit_with_parent(server, parent_pid):
+    while not server.should_exit:
+        if os.getppid() != parent_pid:
+            server.should_exit = True
+        time.sleep(1)
+
+
+def run_worker(app, sock, threads, load_artifacts, load_encoder, parent_pid):
+    # Own process group: a Ctrl-C reaches only the parent, which then stops
+    # every worker exactly once
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    if load_artifacts:
+        preload(load_encoder)
+    _set_encoder_threads(threads)
+
+    server = uvicorn.Server(uvicorn.Config(app, log_level=os.getenv("LOG_LEVEL", "info")))
+    threading.Thread(target=_exit_with_parent, args=(server, parent_pid), daemon=True).start()
+    server.run(sockets=[sock])
+
+
+def _fork_worker(*args):
+    pid = os.fork()
+    if pid:
+        return pid
+    code = 0
+    try:
+        run_worker(*args)
+    except BaseException:
+        logger.exception("Worker failed")
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def serve(host="0.0.0.0", port=8000, workers=PREFORK_WORKERS, preload_artifacts=True):
+    sock = bind_socket(host, port)
+    from . import encoder
+    from .main import app
+
+    share_encoder = encoder.ENCODER_BACKEND in FORK_SAFE_BACKENDS
+    if preload_artifacts:
+        if share_encoder:
+            import torch
+            torch.set_num_threads(1)
+        else:
+            require_genre_artifact()
+        start = time.perf_counter()
+        preload(load_encoder=share_encoder)
+        # Everything alive now is shared with the workers; keep the GC off it
+        gc.collect()
+        gc.freeze()
+        logger.info(f"Preloaded artifacts in {time.perf_counter() - start:.1f}s"
+                    + ("" if share_encoder else f"; the {encoder.ENCODER_BACKEND} encoder loads per worker"))
+
+    threads = encoder.ENCODER_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    worker_args = (app, sock, threads, not preload_artifacts, True, os.getpid())
+    children = {}
+    for slot in range(workers):
+        children[_fork_worker(*worker_args)] = slot
+    logger.info(f"Serving on {host}:{port} with {workers} workers ({'preloaded' if preload_artifacts else 'no preload'})")
+
+    stopping = False
+
+    def kill_remaining():
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum, frame):
+        nonlocal stopping
+        if stopping:
+            return
+        stopping = True
+        logger.info("Stopping workers")
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        timer = threading.Timer(PREFORK_GRACEFUL_TIMEOUT, kill_remaining)
+        timer.daemon = True
+        timer.start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        slot = children.pop(pid, None)
+        if slot is None or stopping:
+            continue
+        logger.warning(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting")
+        # Do not spin if workers die on startup
+        time.sleep(1)
+        children[_fork_worker(*worker_args)] = slot
+    sock.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the app from workers forked after preloading artifacts")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", 8000)))
+    parser.add_argument("--workers", type=int, default=PREFORK_WORKERS)
+    parser.add_argument("--no-preload", action="store_true", help="load artifacts in each worker instead")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        serve(args.host, args.port, args.workers, preload_artifacts=not args.no_preload)
+    except RuntimeError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
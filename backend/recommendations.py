@@ -0,0 +1,262 @@
+"""Per-track book recommendations, materialized on the catalog track.
+
+A track's tags do not change once it is stored, so its mapped genre and
+book list are computed in the background when the track enters the catalog
+or its tags are updated, and kept on the track under ``recommendations``;
+every playlist entry of the track shares them. Each entry records the
+version of everything it was derived from (encoder model and backend,
+genre tables, book catalog); an entry from an older version is ignored on
+read and recomputed. Recompute every stale entry after a deploy with:
+
+    python -m backend.recommendations
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+
+from .book_catalog import get_book_catalog
+from .db import async_tracks_collection
+from .encoder import ENCODER_STAMP
+from .genre_artifacts import genre_tables_fingerprint
+from .genres import (
+    BOOK_GENRES,
+    MUSIC_GENRES,
+    SCORING_VERSION,
+    get_genre_mapping,
+    song_query_vector,
+)
+from .google_books import google_books_client
+from .metrics import span
+from .serialization import dumps
+from .tag_vocab import song_genre_distributions
+
+logger = logging.getLogger(__name__)
+
+# Books stored per track; requests for more than this are computed live
+MATERIALIZED_RESULTS = int(os.getenv("MATERIALIZED_RESULTS", 5))
+# Google Books results drift, so even a current entry is refreshed eventually
+MATERIALIZED_MAX_AGE = float(os.getenv("MATERIALIZED_MAX_AGE", 7 * 24 * 3600))
+# Tracks materialized at once by a background job
+MATERIALIZE_CONCURRENCY = int(os.getenv("MATERIALIZE_CONCURRENCY", 4))
+# Google Books results are blended across up to this many of a song's top
+# book genres, each holding at least GENRE_BLEND_MIN_WEIGHT of the score
+GENRE_BLEND_TOP = int(os.getenv("GENRE_BLEND_TOP", 3))
+GENRE_BLEND_MIN_WEIGHT = float(os.getenv("GENRE_BLEND_MIN_WEIGHT", 0.2))
+# Genres reported with each recommendation
+GENRE_DISTRIBUTION_SIZE = 5
+
+GENRE_TABLES_FINGERPRINT = genre_tables_fingerprint(MUSIC_GENRES, BOOK_GENRES)[:16]
+
+
+def recommendations_version(catalog=None):
+    books = catalog.catalog_version if catalog is not None else "google-books"
+    return f"{ENCODER_STAMP}:{GENRE_TABLES_FINGERPRINT}:s{SCORING_VERSION}:{books}"
+
+
+# Nearest books in the local catalog to the song's tag embeddings, or None
+# when the song has no tags to search with
+def catalog_recommendations(catalog, song_tags, max_results: int = 5):
+    query = song_query_vector(song_tags)
+    if query is None:
+        return None
+    ids, _ = catalog.search(query, k=max_results)
+    return [catalog.books[i] for i in ids]
+
+
+# Get the music genre that mapped to this book genre, falling back to the
+# song's first tag when none of its tags is a known music genre
+def source_music_genre(song_tags, book_genre):
+    music_genre = next((m_genre for m_genre, b_genre in get_genre_mapping().items()
+                        if b_genre == book_genre and m_genre in song_tags), "Unknown")
+    if music_genre == "Unknown" and song_tags:
+        music_genre = song_tags[0]
+    return music_genre
+
+
+# Split max_results between the song's top genres in proportion to their
+# weights (largest remainder), as [(genre, slots)]
+def blend_allocation(distribution, max_results: int):
+    top = [(genre, weight) for genre, weight in distribution[:GENRE_BLEND_TOP] if weight >= GENRE_BLEND_MIN_WEIGHT]
+    top = top or distribution[:1]
+    total = sum(weight for _, weight in top)
+    shares = [max_results * weight / total for _, weight in top]
+    slots = [int(share) for share in shares]
+    for i in sorted(range(len(top)), key=lambda i: slots[i] - shares[i])[:max_results - sum(slots)]:
+        slots[i] += 1
+    return [(genre, n) for (genre, _), n in zip(top, slots) if n]
+
+
+async def blended_books(distribution, max_results: int):
+    allocation = blend_allocation(distribution, max_results)
+    # Each genre is fetched at the full size so the requests share cache
+    # entries with single-genre lookups; the spare books fill any shortfall
+    fetched = await asyncio.gather(
+        *(google_books_client.search_subject(genre, max_results) for genre, _ in allocation)
+    )
+    books, seen = [], set()
+
+    def take(candidates, n):
+        for book in candidates:
+            if n <= 0 or len(books) >= max_results:
+                break
+            key = book.get("google_books_id") or book["title"]
+            if key not in seen:
+                seen.add(key)
+                books.append(book)
+                n -= 1
+
+    for (_, slots), candidates in zip(allocation, fetched):
+        take(candidates, slots)
+    for candidates in fetched:
+        take(candidates, max_results - len(books))
+    return books
+
+
+async def compute_recommendations(song_tags, max_results: int = MATERIALIZED_RESULTS, catalog=None, tag_ids=None):
+    """Mapped genres and book list for a song, as a plain dict. Uses the
+    local catalog when given one, otherwise Google Books blended across the
+    song's top genres (whose errors propagate as GoogleBooksError). Genres
+    are scored from the song's tag vocabulary ids when it has them."""
+    # Off the event loop: a cold tag means a model forward pass
+    with span("genre_scoring"):
+        song = {"tags": song_tags, "tag_ids": tag_ids}
+        distribution = (await asyncio.to_thread(song_genre_distributions, [song]))[0]
+    book_genre = distribution[0][0]
+    books = None
+    if catalog is not None:
+        with span("catalog_search"):
+            books = await asyncio.to_thread(catalog_recommendations, catalog, song_tags, max_results)
+    if books is None:
+        with span("google_books"):
+            books = await blended_books(distribution, max_results)
+    return {
+        "music_genre": source_music_genre(song_tags, book_genre),
+        "mapped_book_genre": book_genre,
+        "recommendations": books,
+        "genre_distribution": [
+            {"book_genre": genre, "weight": round(weight, 4)}
+            for genre, weight in distribution[:GENRE_DISTRIBUTION_SIZE]
+        ],
+    }
+
+
+def _current_entry(song, max_results: int, catalog=None):
+    entry = song.get("recommendations")
+    if not entry or entry.get("version") != recommendations_version(catalog):
+        return None
+    if max_results > entry["max_results"]:
+        return None
+    if datetime.now() - entry["computed_at"] > timedelta(seconds=MATERIALIZED_MAX_AGE):
+        return None
+    return entry
+
+
+def response_fields(result, max_results: int):
+    return {
+        "music_genre": result["music_genre"],
+        "mapped_book_genre": result["mapped_book_genre"],
+        "recommendations": result["recommendations"][:max_results],
+        "genre_distribution": result.get("genre_distribution", []),
+    }
+
+
+def materialized_payload(song, max_results: int, catalog=None):
+    """The song's stored recommendations as response JSON bytes when they
+    are current and cover ``max_results`` books, else None.
+    The full-size response is stored pre-encoded; a smaller one is encoded
+    from the stored books without any model validation."""
+    entry = _current_entry(song, max_results, catalog)
+    if entry is None:
+        return None
+    if max_results == entry["max_results"] and entry.get("payload"):
+        return bytes(entry["payload"])
+    return dumps(response_fields(entry, max_results))
+
+
+async def store_recommendations(track_id, song_tags, result, max_results: int, catalog=None):
+    # Matching on the tags as well means a result computed from tags that
+    # have since been updated is dropped instead of overwriting newer data
+    await async_tracks_collection.update_one(
+        {"_id": track_id, "tags": song_tags},
+        {"$set": {"recommendations": {
+            **result,
+            "payload": dumps(response_fields(result, max_results)),
+            "max_results": max_results,
+            "version": recommendations_version(catalog),
+            "computed_at": datetime.now(),
+        }}}
+    )
+
+
+async def materialize_track(track_id):
+    track = await async_tracks_collection.find_one({"_id": track_id}, {"tags": 1, "tag_ids": 1})
+    if track is None:
+        return False
+    catalog = get_book_catalog()
+    try:
+        result = await compute_recommendations(track.get("tags") or [], MATERIALIZED_RESULTS, catalog, track.get("tag_ids"))
+        await store_recommendations(track_id, track.get("tags"), result, MATERIALIZED_RESULTS, catalog)
+    except Exception as e:
+        # The track stays unmaterialized; reads fall back to computing live
+        logger.warning(f"Could not materialize recommendations for track {track_id}: {e}")
+        return False
+    return True
+
+
+async def materialize_tracks(track_ids):
+    """Compute and store recommendations for those of ``track_ids`` without
+    a current entry; run as a background task after songs are added or
+    their tags change. A track already in the catalog costs one query."""
+    catalog = get_book_catalog()
+    stale = await async_tracks_collection.find_list(
+        {"_id": {"$in": list(dict.fromkeys(track_ids))}, **stale_filter(catalog)}, {"_id": 1}
+    )
+    semaphore = asyncio.Semaphore(max(1, MATERIALIZE_CONCURRENCY))
+
+    async def run(track_id):
+        async with semaphore:
+            return await materialize_track(track_id)
+
+    done = await asyncio.gather(*(run(track["_id"]) for track in stale))
+    logger.info(f"Materialized recommendations for {sum(done)} of {len(stale)} stale tracks")
+    return sum(done)
+
+
+# Every track without a current entry: never materialized, computed for
+# another model/genre table/catalog version, or past MATERIALIZED_MAX_AGE
+def stale_filter(catalog=None):
+    return {"$or": [
+        {"recommendations.version": {"$ne": recommendations_version(catalog)}},
+        {"recommendations.computed_at": {"$lt": datetime.now() - timedelta(seconds=MATERIALIZED_MAX_AGE)}},
+    ]}
+
+
+async def refresh_stale(batch_size: int = 500):
+    stale = await async_tracks_collection.find_list(stale_filter(get_book_catalog()), {"_id": 1})
+    refreshed = 0
+    for start in range(0, len(stale), batch_size):
+        refreshed += await materialize_tracks([track["_id"] for track in stale[start:start + batch_size]])
+    return refreshed, len(stale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute stale materialized book recommendations")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    async def run():
+        try:
+            return await refresh_stale(args.batch_size)
+        finally:
+            await google_books_client.aclose()
+
+    refreshed, stale = asyncio.run(run())
+    logger.info(f"Refreshed {refreshed} of {stale} stale tracks")
+
+
+if __name__ == "__main__":
+    main()
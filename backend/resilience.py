@@ -0,0 +1,216 @@
+"""Request coalescing and circuit breaking for upstream APIs.
+
+SingleFlight (threads) and AsyncSingleFlight (asyncio) let concurrent
+identical requests share one in-flight call and its result or error.
+CircuitBreaker fails calls fast once an upstream looks unhealthy. Every
+instance is registered by name and reported on /metrics and
+/admin/metrics.
+"""
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+from .metrics import gauge_lines, register_collector
+
+_flights = {}
+_breakers = {}
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls with the same key across threads: the
+    first caller runs the function, the rest block until it finishes and
+    get the same result or exception."""
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.shared = 0
+        _flights[name] = self
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.shared += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines on one event loop. The shared call runs
+    as its own task, so a caller that is cancelled does not cancel it for
+    the others."""
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+        self.calls = 0
+        self.shared = 0
+        _flights[name] = self
+
+    async def do(self, key, factory):
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._tasks[key] = task
+            self.calls += 1
+            task.add_done_callback(lambda done: self._tasks.pop(key, None) if self._tasks.get(key) is done else None)
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._tasks)}
+
+
+class CircuitBreaker:
+    """Fails calls to an upstream fast once it looks unhealthy.
+
+    After ``failure_threshold`` consecutive failures (exceptions, or calls
+    slower than ``slow_call_seconds``) the breaker opens and rejects calls
+    with CircuitOpenError for ``reset_timeout`` seconds. Then one trial call
+    is let through; its outcome closes or reopens the breaker.
+    ``max_concurrent`` caps calls in flight, so a hanging upstream cannot
+    tie up every worker thread while the failures accumulate.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, slow_call_seconds=None, max_concurrent=None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.slow_call_seconds = slow_call_seconds
+        self.max_concurrent = max_concurrent
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.in_flight = 0
+        self.opened = 0
+        self.rejected = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        _breakers[name] = self
+
+    def _reject(self, reason):
+        self.rejected += 1
+        raise CircuitOpenError(f"{self.name} {reason}")
+
+    def _acquire(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    self._reject("circuit is open")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                if self._trial_in_flight:
+                    self._reject("circuit is half-open with a trial call in flight")
+                self._trial_in_flight = True
+            elif self.max_concurrent and self.in_flight >= self.max_concurrent:
+                self._reject(f"has {self.in_flight} calls in flight")
+            self.in_flight += 1
+        return time.monotonic()
+
+    def _open(self):
+        self.state = self.OPEN
+        self._opened_at = time.monotonic()
+        self.opened += 1
+
+    # failed=None records no verdict, e.g. for a cancelled call
+    def _release(self, started, failed):
+        if failed is False and self.slow_call_seconds and time.monotonic() - started > self.slow_call_seconds:
+            failed = True
+        with self._lock:
+            self.in_flight -= 1
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+                if failed:
+                    self._open()
+                elif failed is False:
+                    self.state = self.CLOSED
+                    self.consecutive_failures = 0
+            elif failed:
+                self.consecutive_failures += 1
+                if self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold:
+                    self._open()
+            elif failed is False:
+                self.consecutive_failures = 0
+
+    @contextmanager
+    def guard(self):
+        """Run the body as one call through the breaker; any exception from
+        it counts as a failure. Works around awaits too."""
+        started = self._acquire()
+        try:
+            yield
+        except Exception:
+            self._release(started, True)
+            raise
+        except BaseException:
+            self._release(started, None)
+            raise
+        self._release(started, False)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "in_flight": self.in_flight,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
+
+
+def resilience_stats():
+    return {
+        "single_flight": {name: flight.stats() for name, flight in _flights.items()},
+        "circuit_breakers": {name: breaker.stats() for name, breaker in _breakers.items()},
+    }
+
+
+@register_collector
+def _resilience_lines():
+    states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    return (
+        gauge_lines("circuit_breaker_state", "0 closed, 1 half-open, 2 open", "upstream",
+                    {name: states[breaker.state] for name, breaker in _breakers.items()})
+        + gauge_lines("circuit_breaker_rejected_total", "Calls rejected without reaching the upstream", "upstream",
+                      {name: breaker.rejected for name, breaker in _breakers.items()}, kind="counter")
+        + gauge_lines("single_flight_shared_total", "Calls answered by joining an identical in-flight call",
+                      "upstream", {name: flight.shared for name, flight in _flights.items()}, kind="counter")
+    )
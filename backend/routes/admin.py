@@ -0,0 +1,17 @@
+from fastapi import APIRouter
+
+from ..book_prefetch import book_prefetcher
+from ..cache import cache_stats
+from ..executors import executor_stats
+from ..resilience import resilience_stats
+
+admin_router = APIRouter()
+
+
+# Hit/miss counters and sizes for every named in-process cache, pool sizes
+# and queue depths of the CPU executors, upstream breaker states and the
+# Google Books prefetcher
+@admin_router.get("/metrics")
+async def get_metrics():
+    return {"caches": cache_stats(), "executors": executor_stats(), **resilience_stats(),
+            "book_prefetch": book_prefetcher.stats()}
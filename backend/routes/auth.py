@@ -6,9 +6,10 @@ from backend.db import  playlists_collection
 
 
 from fastapi.security import OAuth2PasswordBearer
+from pymongo.errors import DuplicateKeyError
 from backend.models import UserCreate, UserLogin
-from backend.db import users_collection
-from backend.utils import hash_password, verify_password
+from backend.db import async_users_collection
+from backend.utils import hash_password_async, verify_password_async
 from backend.auth import create_access_token
 from datetime import timedelta
 from backend.auth import verify_access_token
@@ -16,7 +17,6 @@ from backend.auth import verify_access_token
 
 # Set up logger
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
 
 
 router = APIRouter()
@@ -24,34 +24,35 @@ router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 @router.post("/register")
-def register_user(user: UserCreate):
-    logger.debug(f"Registering user: {user}")  # Debugging
-    existing_user = users_collection.find_one({"email": user.email})
+async def register_user(user: UserCreate):
+    logger.debug("Registering user: %s", user.email)  # Debugging
+    existing_user = await async_users_collection.find_one({"email": user.email})
     if existing_user:
         raise HTTPException(status_code=400, detail="Email already registered")
 
-    hashed_password = hash_password(user.password)
-    users_collection.insert_one({
-        "username": user.username,
-        "email": user.email,
-        "password": hashed_password
-    })
+    hashed_password = await hash_password_async(user.password)
+    try:
+        await async_users_collection.insert_one({
+            "username": user.username,
+            "email": user.email,
+            "password": hashed_password
+        })
+    except DuplicateKeyError:
+        # Lost a race with a concurrent registration; the unique index wins
+        raise HTTPException(status_code=400, detail="Email already registered")
     logger.debug("User registered successfully")  # Debugging
     return {"message": "User registered successfully"}
 
 @router.post("/login")
-def login_user(request: Request, user: UserLogin):
-    existing_user = users_collection.find_one({"email": user.email})
-    print(f"Received login data: {user.email}, {user.password}")
+async def login_user(request: Request, user: UserLogin):
+    existing_user = await async_users_collection.find_one({"email": user.email})
+    logger.debug("Received login for: %s", user.email)
 
     if not existing_user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
-    
-    # Debugging: Check the stored password hash
-    print(f"Stored hashed password: {existing_user['password']}")
 
-    is_valid_password = verify_password(user.password, existing_user["password"])
-    print(f"Password valid: {is_valid_password}")  # Debugging
+    is_valid_password = await verify_password_async(user.password, existing_user["password"])
+    logger.debug("Password valid: %s", is_valid_password)  # Debugging
     if not is_valid_password:
         raise HTTPException(status_code=401, detail="Invalid email or password")
 
@@ -78,7 +79,7 @@ def get_current_user(token: str = Depends(oauth2_scheme)):
             )
         return payload
     except Exception as e:
-        logger.error(f"Authentication error: {str(e)}")
+        logger.info("Authentication error: %s", e)
         raise HTTPException(
             status_code=401,
             detail="Authentication failed",
@@ -90,3 +91,4 @@ def read_protected_route(current_user: dict = Depends(get_current_user)):
 
 
 
+
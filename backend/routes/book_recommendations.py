@@ -1,39 +1,29 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException
 from pydantic import BaseModel
-from typing import List, Optional
-import requests
+from typing import Dict, List, Optional
+import asyncio
 import os
-from sentence_transformers import SentenceTransformer
-from sentence_transformers import util
-import pandas as pd
-from ..db import playlists_collection
+from ..db import async_playlists_collection
+from ..tracks import get_song_track, resolve_songs_async
+from ..tag_vocab import song_genre_distributions
+from ..book_catalog import get_book_catalog
+from ..recommendations import (
+    MATERIALIZED_RESULTS,
+    compute_recommendations,
+    materialized_payload,
+    response_fields,
+    source_music_genre,
+    store_recommendations,
+)
+from ..models import SongIds
+from ..google_books import GoogleBooksError, GoogleBooksUnavailable, google_books_client
+from ..metrics import span, timed
+from ..serialization import MongoJSONResponse
 from bson import ObjectId
 
 # Create router
 book_recommendations_router = APIRouter()
 
-# Load model - this should be done once when the application starts
-model = SentenceTransformer('all-MiniLM-L6-v2')
-
-# Sample music genres - you could load these from a file or database
-music_genres_df = pd.DataFrame({
-    "music_genre": [
-        "rock", "pop", "hip hop", "rap", "electronic", "classical", "jazz", 
-        "indie", "folk", "metal", "punk", "r&b", "soul", "blues", "country",
-        "alternative", "ambient", "dance", "disco", "funk", "reggae"
-    ]
-})
-
-# Sample book genres - you could load these from a file or database
-book_genres_df = pd.DataFrame({
-    "book_genre": [
-        "thriller", "mystery", "romance", "science fiction", "fantasy", 
-        "historical fiction", "biography", "self-help", "horror", "adventure",
-        "literary fiction", "young adult", "dystopian", "memoir", "poetry",
-        "philosophy", "psychology", "crime", "drama", "comedy", "classic"
-    ]
-})
-
 # Pydantic models for responses
 class BookRecommendation(BaseModel):
     title: str
@@ -44,140 +34,160 @@ class BookRecommendation(BaseModel):
     genres: List[str] = []
     google_books_id: Optional[str] = None
 
+class GenreWeight(BaseModel):
+    book_genre: str
+    weight: float
+
 class BookRecommendationsResponse(BaseModel):
     music_genre: str
     mapped_book_genre: str
     recommendations: List[BookRecommendation]
+    # The song's top book genres; weights sum to at most 1
+    genre_distribution: List[GenreWeight] = []
+
+class SongGenreMatch(BaseModel):
+    song_id: str
+    music_genre: str
+    mapped_book_genre: str
+
+class BatchRecommendationsResponse(BaseModel):
+    songs: List[SongGenreMatch]
+    # Books are listed once per mapped genre rather than once per song
+    books_by_genre: Dict[str, List[BookRecommendation]]
+    missing_song_ids: List[str] = []
+    errors: Dict[str, str] = {}
 
-# Create genre mapping
-def create_genre_mapping():
-    # Extract music and book genres
-    music_genres = music_genres_df["music_genre"].tolist()
-    book_genres = book_genres_df["book_genre"].tolist()
-    
-    # Encode music and book genres into embeddings
-    music_embeddings = model.encode(music_genres)
-    book_embeddings = model.encode(book_genres)
-    
-    # Calculate similarity matrix
-    similarity_matrix = util.cos_sim(music_embeddings, book_embeddings)
-    
-    # Map music genres to book genres based on highest similarity
-    mapping = {}
-    for i, music_genre in enumerate(music_genres):
-        max_sim_index = similarity_matrix[i].argmax()
-        mapping[music_genre] = book_genres[max_sim_index]
-    
-    return mapping
-
-# Initialize genre mapping
-GENRE_MAPPING = create_genre_mapping()
+# Largest number of songs a single batch request may cover
+MAX_BATCH_SONGS = 500
+
+# Serialize a response inside a span, instead of leaving it to FastAPI after
+# the handler returns, so its cost shows up in /metrics. Books already have
+# the BookRecommendation shape (the Google Books and catalog loaders build
+# them that way), so they are encoded as they are; the models above
+# document the responses.
+def json_response(content):
+    with span("serialize"):
+        return MongoJSONResponse(content)
 
 # Function to get book recommendations from Google Books API
-def get_book_recommendations(genre: str, max_results: int = 5):
-    google_books_api_url = "https://www.googleapis.com/books/v1/volumes"
-    
-    params = {
-        "q": f"subject:{genre}",
-        "maxResults": max_results,
-        "orderBy": "relevance"
-    }
-    
+@timed("get_book_recommendations")
+async def get_book_recommendations(genre: str, max_results: int = 5):
     try:
-        response = requests.get(google_books_api_url, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        books = []
-        for item in data.get("items", []):
-            volume_info = item.get("volumeInfo", {})
-            
-            # Extract book details
-            book = BookRecommendation(
-                title=volume_info.get("title", "Unknown Title"),
-                author=volume_info.get("authors", ["Unknown Author"])[0] if volume_info.get("authors") else "Unknown Author",
-                description=volume_info.get("description", "No description available"),
-                cover_url=volume_info.get("imageLinks", {}).get("thumbnail") if "imageLinks" in volume_info else None,
-                rating=volume_info.get("averageRating"),
-                genres=volume_info.get("categories", []),
-                google_books_id=item.get("id")
-            )
-            books.append(book)
-        
-        return books
-    
-    except requests.exceptions.RequestException as e:
+        return await google_books_client.search_subject(genre, max_results)
+    except GoogleBooksUnavailable as e:
+        raise HTTPException(status_code=503, detail=f"Google Books is unavailable: {str(e)}")
+    except GoogleBooksError as e:
         raise HTTPException(status_code=500, detail=f"Error contacting Google Books API: {str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Unexpected error occurred: {str(e)}")
 
-# Find the best matching genre from our mapping
-def find_best_matching_genre(song_tags):
-    if not song_tags:
-        return "fiction"  # Default fallback genre
-    
-    # Convert tags to lowercase for better matching
-    lowercase_tags = [tag.lower() for tag in song_tags]
-    
-    # Try direct match first
-    for tag in lowercase_tags:
-        if tag in GENRE_MAPPING:
-            return GENRE_MAPPING[tag]
-    
-    # If no direct match, use embedding similarity
-    tag_embeddings = model.encode(lowercase_tags)
-    music_genres = list(GENRE_MAPPING.keys())
-    music_genre_embeddings = model.encode(music_genres)
-    
-    # Find the most similar music genre for each tag
-    max_similarity = -1
-    best_music_genre = None
-    
-    for i, tag_embedding in enumerate(tag_embeddings):
-        similarities = util.cos_sim(tag_embedding.reshape(1, -1), music_genre_embeddings)[0]
-        max_index = similarities.argmax()
-        
-        if similarities[max_index] > max_similarity:
-            max_similarity = similarities[max_index]
-            best_music_genre = music_genres[max_index]
-    
-    # Return the corresponding book genre
-    if best_music_genre:
-        return GENRE_MAPPING[best_music_genre]
-    else:
-        return "fiction"  # Default fallback
-
 # API Route to get book recommendations for a specific song
 @book_recommendations_router.get("/recommendations/{song_id}", response_model=BookRecommendationsResponse)
-async def get_recommendations_for_song(song_id: str, max_results: int = 5):
+async def get_recommendations_for_song(
+    song_id: str, background_tasks: BackgroundTasks, max_results: int = 5, source: str = "auto"
+):
+    # source: "catalog" searches the local book catalog, "google" queries
+    # Google Books by genre, "auto" uses the catalog when one is configured
+    if source not in ("auto", "catalog", "google"):
+        raise HTTPException(status_code=400, detail="source must be auto, catalog or google")
+    catalog = get_book_catalog() if source != "google" else None
+    if source == "catalog" and catalog is None:
+        raise HTTPException(status_code=400, detail="Local book catalog is not configured")
+
     try:
         # Retrieve song from MongoDB
-        song = playlists_collection.find_one({"_id": ObjectId(song_id)})
+        song = await get_song_track(ObjectId(song_id), {"tags": 1, "tag_ids": 1, "recommendations": 1})
         if not song:
             raise HTTPException(status_code=404, detail="Song not found")
-        
+
+        # Materialized on ingest: served as the stored, already-encoded bytes
+        # when the entry is current
+        if source == "auto":
+            with span("serialize"):
+                payload = materialized_payload(song, max_results, catalog)
+            if payload is not None:
+                return MongoJSONResponse(payload)
+
         # Get song tags/genres
         song_tags = song.get("tags", [])
-        
-        # Find the best matching book genre
-        book_genre = find_best_matching_genre(song_tags)
-        
-        # Get the music genre that mapped to this book genre
-        music_genre = next((m_genre for m_genre, b_genre in GENRE_MAPPING.items() 
-                           if b_genre == book_genre and m_genre in song_tags), "Unknown")
-        
-        # If we couldn't find the original music genre in the song tags, just pick the first tag
-        if music_genre == "Unknown" and song_tags:
-            music_genre = song_tags[0]
-        
-        # Get book recommendations
-        books = get_book_recommendations(book_genre, max_results)
-        
-        return BookRecommendationsResponse(
-            music_genre=music_genre,
-            mapped_book_genre=book_genre,
-            recommendations=books
+
+        try:
+            result = await compute_recommendations(song_tags, max_results, catalog, song.get("tag_ids"))
+        except GoogleBooksUnavailable as e:
+            raise HTTPException(status_code=503, detail=f"Google Books is unavailable: {str(e)}")
+        except GoogleBooksError as e:
+            raise HTTPException(status_code=500, detail=f"Error contacting Google Books API: {str(e)}")
+
+        # Missing or stale entry: store the fresh one on the track once the
+        # response is sent
+        if source == "auto" and max_results >= MATERIALIZED_RESULTS and "track_id" in song:
+            background_tasks.add_task(store_recommendations, song["track_id"], song.get("tags"), result, max_results, catalog)
+
+        return json_response(response_fields(result, max_results))
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# API Route to get book recommendations for many songs at once. Without
+# song_ids the whole library (up to MAX_BATCH_SONGS) is covered. Songs are
+# fetched with one $in query, all tags are resolved in one batched encode,
+# and Google Books is queried once per distinct mapped genre.
+@book_recommendations_router.post("/recommendations/batch", response_model=BatchRecommendationsResponse)
+async def get_recommendations_for_songs(request: SongIds, max_results: int = 5):
+    song_ids = request.song_ids
+    if song_ids is not None and len(song_ids) > MAX_BATCH_SONGS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SONGS} songs per batch")
+
+    try:
+        projection = {"tags": 1, "tag_ids": 1}
+        if song_ids is None:
+            entries = await async_playlists_collection.find_list({}, limit=MAX_BATCH_SONGS)
+            songs = await resolve_songs_async(entries, projection)
+            missing = []
+        else:
+            ordered_ids = list(dict.fromkeys(song_ids))
+            object_ids = [ObjectId(song_id) for song_id in ordered_ids if ObjectId.is_valid(song_id)]
+            entries = await async_playlists_collection.find_list({"_id": {"$in": object_ids}})
+            found = {str(song["_id"]): song for song in await resolve_songs_async(entries, projection)}
+            songs = [found[song_id] for song_id in ordered_ids if song_id in found]
+            missing = [song_id for song_id in ordered_ids if song_id not in found]
+
+        tag_lists = [song.get("tags", []) for song in songs]
+        distributions = await asyncio.to_thread(song_genre_distributions, songs)
+        book_genres = [distribution[0][0] for distribution in distributions]
+
+        # One upstream call per distinct genre, all in flight together
+        distinct_genres = list(dict.fromkeys(book_genres))
+        fetched = await asyncio.gather(
+            *(get_book_recommendations(genre, max_results) for genre in distinct_genres),
+            return_exceptions=True
         )
-        
+        books_by_genre = {}
+        errors = {}
+        for genre, books in zip(distinct_genres, fetched):
+            if isinstance(books, Exception):
+                errors[genre] = books.detail if isinstance(books, HTTPException) else str(books)
+                books_by_genre[genre] = []
+            else:
+                books_by_genre[genre] = books
+
+        return json_response({
+            "songs": [
+                {
+                    "song_id": song["_id"],
+                    "music_genre": source_music_genre(song_tags, book_genre),
+                    "mapped_book_genre": book_genre,
+                }
+                for song, song_tags, book_genre in zip(songs, tag_lists, book_genres)
+            ],
+            "books_by_genre": books_by_genre,
+            "missing_song_ids": missing,
+            "errors": errors,
+        })
+
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
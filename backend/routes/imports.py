@@ -0,0 +1,81 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from typing import List
+import asyncio
+import logging
+import os
+
+from ..import_jobs import FINISHED, IMPORT_MAX_TRACKS, create_job, get_job, job_summary
+from ..serialization import MongoJSONResponse, dumps
+
+logger = logging.getLogger(__name__)
+
+import_router = APIRouter()
+
+# Seconds between two reads of a job while streaming its progress
+IMPORT_PROGRESS_INTERVAL = float(os.getenv("IMPORT_PROGRESS_INTERVAL", 0.5))
+# Send a comment at least this often so proxies keep an idle stream open
+SSE_KEEPALIVE_SECONDS = 15.0
+
+
+def _event(name, data):
+    return b"event: " + name.encode() + b"\ndata: " + dumps(data) + b"\n\n"
+
+
+# Queue a playlist import and return at once; the tracks are fetched and
+# stored by the background import workers
+@import_router.post("/", status_code=202)
+async def start_import(songs: List[dict]):
+    if not songs:
+        raise HTTPException(status_code=400, detail="No songs provided")
+    if len(songs) > IMPORT_MAX_TRACKS:
+        raise HTTPException(status_code=400, detail=f"At most {IMPORT_MAX_TRACKS} songs per import")
+
+    job_id = await create_job(songs)
+    logger.info(f"Queued import job {job_id} with {len(songs)} songs")
+    return {
+        "job_id": job_id,
+        "status": "queued",
+        "total": len(songs),
+        "events_url": f"/songs/import/{job_id}/events",
+    }
+
+
+@import_router.get("/{job_id}")
+async def get_import(job_id: str, tracks: bool = True):
+    job = await get_job(job_id, include_tracks=tracks)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+    return MongoJSONResponse(job_summary(job))
+
+
+# Server-Sent Events: a "progress" event whenever the counters change and a
+# final "done" event with every track's outcome. The job is read from Mongo,
+# so progress streams from any app process, whichever one runs the job.
+@import_router.get("/{job_id}/events")
+async def import_events(job_id: str, request: Request):
+    if await get_job(job_id, include_tracks=False) is None:
+        raise HTTPException(status_code=404, detail="Import job not found")
+
+    async def events():
+        last, idle = None, 0.0
+        while not await request.is_disconnected():
+            job = await get_job(job_id, include_tracks=False)
+            if job is None:
+                yield _event("error", {"detail": "Import job not found"})
+                return
+            progress = job_summary(job)
+            if job["status"] in FINISHED:
+                yield _event("done", job_summary(await get_job(job_id)))
+                return
+            if progress != last:
+                last, idle = progress, 0.0
+                yield _event("progress", progress)
+            elif idle >= SSE_KEEPALIVE_SECONDS:
+                idle = 0.0
+                yield b": keep-alive\n\n"
+            await asyncio.sleep(IMPORT_PROGRESS_INTERVAL)
+            idle += IMPORT_PROGRESS_INTERVAL
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
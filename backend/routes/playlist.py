@@ -3,12 +3,43 @@ import requests
 import os
 from pydantic import BaseModel
 from typing import Optional, List
+from requests.adapters import HTTPAdapter
+from ..ratelimit import RateLimiter
+from ..cache import MISSING
+from ..metadata_cache import NOT_FOUND, lastfm_metadata_cache
+from ..metrics import timed, upstream_errors
+from ..resilience import CircuitBreaker, CircuitOpenError, SingleFlight
 
 lastfm_router = APIRouter()
 
 # Load Last.fm API key from environment variable
 LASTFM_API_KEY = os.getenv("LASTFM_API_KEY", "514ea2a2dfd55e40eedd9fbbe80a6a74")  # Dev fallback
-LASTFM_API_URL = "http://ws.audioscrobbler.com/2.0/"
+LASTFM_API_URL = os.getenv("LASTFM_API_URL", "http://ws.audioscrobbler.com/2.0/")
+
+# Maximum number of Last.fm requests in flight during a bulk import
+LASTFM_CONCURRENCY = int(os.getenv("LASTFM_CONCURRENCY", 8))
+
+# Last.fm asks clients to stay around 5 requests per second; the limiter is
+# shared by every caller in the process
+lastfm_rate_limiter = RateLimiter(float(os.getenv("LASTFM_RATE_LIMIT", 5)))
+
+# Concurrent lookups of the same track share one upstream call
+lastfm_flight = SingleFlight("lastfm")
+
+# Stop calling Last.fm for a while once it keeps failing or hanging, and
+# never let more than LASTFM_MAX_IN_FLIGHT calls block worker threads on it
+lastfm_breaker = CircuitBreaker(
+    "lastfm",
+    failure_threshold=int(os.getenv("LASTFM_BREAKER_FAILURES", 5)),
+    reset_timeout=float(os.getenv("LASTFM_BREAKER_RESET", 30)),
+    slow_call_seconds=float(os.getenv("LASTFM_SLOW_CALL_SECONDS", 5)),
+    max_concurrent=int(os.getenv("LASTFM_MAX_IN_FLIGHT", 4 * LASTFM_CONCURRENCY)),
+)
+
+# Pooled session so concurrent metadata fetches reuse connections
+lastfm_session = requests.Session()
+lastfm_session.mount("http://", HTTPAdapter(pool_maxsize=LASTFM_CONCURRENCY))
+lastfm_session.mount("https://", HTTPAdapter(pool_maxsize=LASTFM_CONCURRENCY))
 
 # Pydantic model for response
 class TrackMetadata(BaseModel):
@@ -21,7 +52,17 @@ class TrackMetadata(BaseModel):
     url: Optional[str] = None
 
 # Function to fetch track metadata
+@timed("lastfm_track_metadata")
 def get_track_metadata(artist: str, track: str) -> TrackMetadata:
+    # Serve repeat lookups (including known misses) from the metadata cache
+    cached = lastfm_metadata_cache.get(artist, track)
+    if cached is NOT_FOUND:
+        raise HTTPException(status_code=404, detail="Track not found")
+    if cached is not MISSING:
+        return TrackMetadata(**cached)
+    return lastfm_flight.do(lastfm_metadata_cache.key(artist, track), lambda: fetch_track_metadata(artist, track))
+
+def fetch_track_metadata(artist: str, track: str) -> TrackMetadata:
     params = {
         "method": "track.getInfo",
         "api_key": LASTFM_API_KEY,
@@ -30,15 +71,21 @@ def get_track_metadata(artist: str, track: str) -> TrackMetadata:
         "format": "json"
     }
     try:
-        response = requests.get(LASTFM_API_URL, params=params)
+        lastfm_rate_limiter.acquire()
+        # Only server-side trouble counts against the breaker, not a 4xx
+        with lastfm_breaker.guard():
+            response = lastfm_session.get(LASTFM_API_URL, params=params, timeout=10)
+            if response.status_code >= 500:
+                response.raise_for_status()
         response.raise_for_status()
         data = response.json()
 
         track_info = data.get("track", {})
         if not track_info:
+            lastfm_metadata_cache.set_not_found(artist, track)
             raise HTTPException(status_code=404, detail="Track not found")
 
-        return TrackMetadata(
+        metadata = TrackMetadata(
             name=track_info.get("name", "Unknown"),
             artist=track_info.get("artist", {}).get("name", "Unknown"),
             album=track_info.get("album", {}).get("title"),
@@ -47,12 +94,22 @@ def get_track_metadata(artist: str, track: str) -> TrackMetadata:
             tags=[tag["name"] for tag in track_info.get("toptags", {}).get("tag", [])] if "toptags" in track_info else [],
             url=track_info.get("url")
         )
-    except requests.exceptions.RequestException:
+        lastfm_metadata_cache.set(artist, track, metadata.model_dump())
+        return metadata
+    except HTTPException:
+        raise
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Last.fm is unavailable: {e}")
+    except requests.exceptions.RequestException as e:
+        status = getattr(e.response, "status_code", None)
+        upstream_errors.inc("lastfm", str(status) if status else type(e).__name__)
         raise HTTPException(status_code=500, detail="Error contacting Last.fm API")
     except Exception:
         raise HTTPException(status_code=500, detail="Unexpected error occurred")
 
 # API Route to fetch metadata
+# Plain def so FastAPI runs it in the threadpool: the call blocks on the
+# rate limiter and on Last.fm
 @lastfm_router.get("/track_metadata/", response_model=TrackMetadata)
-async def track_metadata(artist: str, track: str):
+def track_metadata(artist: str, track: str):
     return get_track_metadata(artist, track)
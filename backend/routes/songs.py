@@ -1,10 +1,11 @@
-from fastapi import APIRouter, HTTPException, Request
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from ..models import SongMetadata
 from fastapi.templating import Jinja2Templates
 from bson.errors import InvalidId
 import os
+import asyncio
 import logging
 
 
@@ -12,11 +13,36 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-from ..db import playlists_collection
-from .playlist import get_track_metadata
+from ..db import async_playlists_collection, async_tracks_collection, playlists_collection
+from .playlist import LASTFM_CONCURRENCY
+from ..ingest import ensure_track, ingest_songs
+from ..recommendations import materialize_tracks
+from ..serialization import MongoJSONResponse
+from ..tag_vocab import attach_tag_ids, count_songs, retag_counts, tag_facets
+from ..tracks import (
+    DERIVED_TRACK_FIELDS,
+    TRACK_FIELDS,
+    build_entry,
+    edited_track_fields,
+    fork_track,
+    get_song as get_song_view,
+    iter_songs,
+    resolve_songs,
+    song_view,
+)
+from pymongo.errors import PyMongoError
 from bson import ObjectId
 from datetime import datetime
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, Response, StreamingResponse
+from ..pagination import (
+    SORT_KEYS,
+    STREAM_BATCH_SIZE,
+    encode_cursor,
+    keyset_filter,
+    parse_projection,
+    stream_json_array,
+    stream_ndjson,
+)
 
 templates = Jinja2Templates(directory=os.path.abspath("frontend/templates"))
 
@@ -29,6 +55,9 @@ print("Template directory exists:", os.path.exists(template_dir))
 
 router = APIRouter()
 
+# Largest page GET /songs/ returns when a limit is given
+MAX_PAGE_SIZE = 1000
+
 # Pydantic model for song submission
 class Song(BaseModel):
     title: str
@@ -45,7 +74,7 @@ class SongResponse(BaseModel):
 
 
 @router.post("/")
-async def add_songs(songs: List[dict]):
+async def add_songs(songs: List[dict], background_tasks: BackgroundTasks):
     try:
         # Validate input
         if not songs:
@@ -65,9 +94,15 @@ async def add_songs(songs: List[dict]):
                 
                 logger.info(f"Fetching metadata for: {song['title']} by {song['artist']}")
                 
-                # Fetch metadata from Last.fm with error handling
+                # Find the track in the catalog, or fetch it from Last.fm
                 try:
-                    metadata = get_track_metadata(song["artist"], song["title"])
+                    track = await ensure_track(song["artist"], song["title"])
+                except PyMongoError as e:
+                    logger.error(f"MongoDB error: {str(e)}")
+                    raise HTTPException(
+                        status_code=500, 
+                        detail=f"Database error: {str(e)}"
+                    )
                 except Exception as e:
                     logger.error(f"Last.fm API error for {song['title']}: {str(e)}")
                     raise HTTPException(
@@ -75,22 +110,13 @@ async def add_songs(songs: List[dict]):
                         detail=f"Error fetching Last.fm data: {str(e)}"
                     )
                 
-                # Prepare song document
-                song_doc = {
-                    "name": metadata.name,
-                    "artist": metadata.artist,
-                    "album": metadata.album,
-                    "listeners": metadata.listeners,
-                    "playcount": metadata.playcount,
-                    "tags": metadata.tags,
-                    "url": metadata.url,
-                    "created_at": datetime.now()
-                }
-                
-                # Insert into MongoDB with error handling
+                # Insert the playlist entry with error handling
                 try:
-                    result = playlists_collection.insert_one(song_doc)
-                    song_doc["_id"] = str(result.inserted_id)
+                    entry = build_entry(track["_id"])
+                    await async_playlists_collection.insert_one(entry)
+                    await count_songs([track])
+                    song_doc = song_view(entry, track)
+                    song_doc["_id"] = str(song_doc["_id"])
                     added_songs.append(song_doc)
                     logger.info(f"Successfully added song: {song['title']}")
                 except Exception as e:
@@ -111,12 +137,15 @@ async def add_songs(songs: List[dict]):
                 status_code=500, 
                 detail="Failed to add any songs"
             )
+
+        # Recommendations are computed after the response is sent
+        background_tasks.add_task(materialize_tracks, [song["track_id"] for song in added_songs])
             
-        return {
+        return MongoJSONResponse({
             "message": "Song(s) added successfully!",
             "count": len(added_songs),
             "songs": added_songs
-        }
+        })
         
     except HTTPException:
         raise
@@ -128,17 +157,91 @@ async def add_songs(songs: List[dict]):
         )
 
 
+# Bulk import: metadata is fetched concurrently and documents are written
+# with batched unordered inserts. Failures are reported per song instead of
+# aborting the whole request.
+@router.post("/bulk")
+async def add_songs_bulk(songs: List[dict], background_tasks: BackgroundTasks, concurrency: int = LASTFM_CONCURRENCY):
+    if not songs:
+        raise HTTPException(status_code=400, detail="No songs provided")
+    if concurrency < 1 or concurrency > 4 * LASTFM_CONCURRENCY:
+        raise HTTPException(status_code=400, detail=f"concurrency must be between 1 and {4 * LASTFM_CONCURRENCY}")
+
+    logger.info(f"Received bulk request to add {len(songs)} songs")
+    results = await ingest_songs(songs, concurrency)
+    added_songs = []
+    for result in results:
+        if result["status"] == "added":
+            song = result.pop("song")
+            result["song_id"] = song["_id"]
+            added_songs.append(song)
+    if added_songs:
+        background_tasks.add_task(materialize_tracks, [song["track_id"] for song in added_songs])
+
+    return MongoJSONResponse({
+        "message": f"Added {len(added_songs)} of {len(songs)} song(s)",
+        "count": len(added_songs),
+        "failed": len(songs) - len(added_songs),
+        "songs": added_songs,
+        "results": results
+    })
+
+
+# List songs. Without a limit the whole collection is streamed straight from
+# the Mongo cursor; with a limit a single keyset page is returned together
+# with the cursor for the next one. format=ndjson emits one song per line.
 @router.get("/")
-async def get_all_songs():
+def get_all_songs(
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    fields: Optional[str] = None,
+    sort: str = "_id",
+    format: str = "json",
+):
+    if sort not in SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of {', '.join(SORT_KEYS)}")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if limit is not None and not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
     try:
-        songs = list(playlists_collection.find())
-        # Convert ObjectId to string for JSON serialization
-        for song in songs:
-            song["_id"] = str(song["_id"])
-        return {"songs": songs}
+        query = keyset_filter(after, sort)
+        projection = parse_projection(fields, sort)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Entries are small, so they are read whole and the projection is
+        # applied to the songs they resolve to
+        cursor = playlists_collection.find(query).sort(SORT_KEYS[sort])
+        if limit is None:
+            songs = iter_songs(cursor.batch_size(STREAM_BATCH_SIZE), STREAM_BATCH_SIZE, projection)
+            if format == "ndjson":
+                return StreamingResponse(stream_ndjson(songs), media_type="application/x-ndjson")
+            return StreamingResponse(stream_json_array(songs, "songs"), media_type="application/json")
+
+        # A page is bounded by MAX_PAGE_SIZE, so it is fine to hold in memory
+        songs = resolve_songs(list(cursor.limit(limit)), projection)
+        next_cursor = encode_cursor(songs[-1], sort) if len(songs) == limit else None
+        if format == "ndjson":
+            headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+            return Response(b"".join(stream_ndjson(songs)), media_type="application/x-ndjson", headers=headers)
+        return MongoJSONResponse({"songs": songs, "next_cursor": next_cursor})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# Tag and book genre facets across the library, from the counters kept on
+# the tag vocabulary
+@router.get("/facets/tags")
+def get_tag_facets(limit: int = 50, book_genre: Optional[str] = None):
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_PAGE_SIZE}")
+    try:
+        return MongoJSONResponse(tag_facets(limit, book_genre))
+    except PyMongoError as e:
+        raise HTTPException(status_code=500, detail=f"Database error: {str(e)}")
+
 @router.get("/view/{song_id}", response_class=HTMLResponse)
 async def view_song_recommendations(request: Request, song_id: str):
     """Render the book recommendations page for a specific song"""
@@ -154,10 +257,9 @@ async def get_song(song_id: str):
         if not ObjectId.is_valid(song_id):
             raise HTTPException(status_code=400, detail="Invalid song ID")
         
-        song = playlists_collection.find_one({"_id": ObjectId(song_id)})
+        song = await get_song_view(ObjectId(song_id))
         if song:
-            song["_id"] = str(song["_id"])
-            return song
+            return MongoJSONResponse(song)
         raise HTTPException(status_code=404, detail="Song not found")
     except InvalidId:
         raise HTTPException(status_code=400, detail="Invalid song ID")
@@ -167,23 +269,79 @@ async def get_song(song_id: str):
 @router.delete("/{song_id}")
 async def delete_song(song_id: str):
     try:
-        result = playlists_collection.delete_one({"_id": ObjectId(song_id)})
-        if result.deleted_count:
+        entry = await async_playlists_collection.find_one_and_delete({"_id": ObjectId(song_id)}, {"track_id": 1, "tag_ids": 1})
+        if entry:
+            if "track_id" in entry:
+                track = await async_tracks_collection.find_one({"_id": entry["track_id"]}, {"tag_ids": 1, "entry_id": 1})
+                await count_songs([track or {}], -1)
+                if track and track.get("entry_id") == entry["_id"]:
+                    # A private track goes with its entry
+                    await async_tracks_collection.delete_one({"_id": track["_id"]})
+            else:
+                await count_songs([entry], -1)
             return {"message": "Song deleted successfully"}
         raise HTTPException(status_code=404, detail="Song not found")
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# The catalog track is shared by every entry submitted as the same song, so
+# a PUT never writes to it: the first edit of a track field (tags included)
+# moves the entry to a private copy of its track, and later edits update
+# that copy. Any other field is stored on the entry
 @router.put("/{song_id}")
-async def update_song(song_id: str, song: dict):
+async def update_song(song_id: str, song: dict, background_tasks: BackgroundTasks):
     try:
-        result = playlists_collection.update_one(
-            {"_id": ObjectId(song_id)},
-            {"$set": {**song, "updated_at": datetime.now()}}
-        )
-        if result.modified_count:
+        entry = await async_playlists_collection.find_one({"_id": ObjectId(song_id)}, {"track_id": 1, "tag_ids": 1})
+        if entry is None:
+            raise HTTPException(status_code=404, detail="Song not found")
+
+        now = datetime.now()
+        fields = {key: value for key, value in song.items()
+                  if key not in ("_id", "track_id", "recommendations", *DERIVED_TRACK_FIELDS)}
+        track_fields = edited_track_fields(fields)
+        entry_fields = {key: value for key, value in fields.items() if key not in TRACK_FIELDS}
+        retag = "tags" in track_fields
+        if retag:
+            track_fields["tag_ids"] = (await attach_tag_ids([{"tags": track_fields["tags"]}]))[0]["tag_ids"]
+
+        if "track_id" not in entry:
+            # Entries stored before the catalog split still hold the track fields
+            update = {"$set": {**entry_fields, **track_fields, "updated_at": now}}
+            if retag:
+                # Recommendations derived from the old tags are dropped and recomputed
+                update["$unset"] = {"recommendations": ""}
+            await async_playlists_collection.update_one({"_id": entry["_id"]}, update)
+            if retag:
+                await count_songs([entry], -1)
+                await count_songs([track_fields])
             return {"message": "Song updated successfully"}
-        raise HTTPException(status_code=404, detail="Song not found")
+
+        if entry_fields or not track_fields:
+            await async_playlists_collection.update_one({"_id": entry["_id"]}, {"$set": {**entry_fields, "updated_at": now}})
+        if track_fields:
+            track = await async_tracks_collection.find_one({"_id": entry["track_id"]})
+            if track is None:
+                raise HTTPException(status_code=404, detail="Track not found")
+            if track.get("entry_id") == entry["_id"]:
+                update = {"$set": {**track_fields, "updated_at": now}}
+                if retag:
+                    update["$unset"] = {"recommendations": ""}
+                await async_tracks_collection.update_one({"_id": track["_id"]}, update)
+                track_id = track["_id"]
+            else:
+                private = fork_track(track, entry["_id"], track_fields)
+                await async_tracks_collection.update_one({"_id": private["_id"]}, {"$set": private}, upsert=True)
+                await async_playlists_collection.update_one(
+                    {"_id": entry["_id"]}, {"$set": {"track_id": private["_id"], "updated_at": now}}
+                )
+                track_id = private["_id"]
+            if retag:
+                # Only this entry's song moves to the new tags
+                await retag_counts(track.get("tag_ids"), track_fields["tag_ids"], 1)
+            background_tasks.add_task(materialize_tracks, [track_id])
+        return {"message": "Song updated successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
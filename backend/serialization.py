@@ -0,0 +1,42 @@
+"""JSON encoding for Mongo documents and API payloads, via orjson.
+
+orjson serializes datetimes, UUIDs and numpy arrays natively; ObjectId is
+the one BSON type it needs help with. Routes that return documents as they
+come from Mongo hand them to MongoJSONResponse, which skips FastAPI's
+generic jsonable_encoder pass and the ``_id`` string conversion loops:
+
+    return MongoJSONResponse({"songs": songs})
+
+Payloads that are served many times (materialized recommendations) are
+encoded once with dumps() and stored as bytes.
+"""
+from bson import ObjectId
+from starlette.responses import Response
+import orjson
+
+OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+
+def bson_default(value):
+    # BSON types orjson does not know about
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(doc) -> bytes:
+    return orjson.dumps(doc, default=bson_default, option=OPTIONS)
+
+
+def loads(data):
+    return orjson.loads(data)
+
+
+class MongoJSONResponse(Response):
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        # Already-encoded payloads are sent as they are
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            return bytes(content)
+        return dumps(content)
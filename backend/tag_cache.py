@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import NamedTuple
+
+import numpy as np
+
+from .cache import LRUCache, MISSING
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are only serialized within the process
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+EMBEDDINGS_FILE = "tag_embeddings.npy"
+INDEX_FILE = "tag_index.json"
+LOCK_FILE = ".lock"
+STORE_VERSION = 1
+
+
+class TagMatch(NamedTuple):
+    embedding: np.ndarray
+    music_genre: str
+    book_genre: str
+    score: float
+
+
+class TagCache:
+    """Maps lowercase tag strings to their embedding and resolved genres.
+
+    Entries live in a bounded LRU. When ``store_dir`` is set, the embeddings
+    are also persisted as a ``.npy`` matrix plus a JSON index of tag names,
+    and reloaded memory-mapped on startup so a restart does not have to run
+    the encoder for tags it has already seen.
+    """
+
+    def __init__(self, maxsize: int, ttl: float = None, store_dir: str = None, model_name: str = None):
+        self.entries = LRUCache(maxsize, ttl=ttl, name="tag_cache")
+        self.store_dir = store_dir
+        self.model_name = model_name
+        self._store_lock = threading.Lock()
+
+    def get_many(self, tags):
+        found = {}
+        for tag in tags:
+            match = self.entries.get(tag)
+            if match is not MISSING:
+                found[tag] = match
+        return found
+
+    def put(self, tag, match: TagMatch):
+        self.entries.set(tag, match)
+
+    def stats(self):
+        return {**self.entries.stats(), "store_dir": self.store_dir}
+
+    def _paths(self):
+        return (
+            os.path.join(self.store_dir, EMBEDDINGS_FILE),
+            os.path.join(self.store_dir, INDEX_FILE),
+        )
+
+    def load(self, resolve):
+        """Seed the cache from the on-disk store.
+
+        ``resolve`` takes an (n, dim) embedding matrix and returns one
+        (music_genre, book_genre, score) tuple per row; genres are resolved
+        again on load so the store stays valid if the genre tables change.
+        """
+        if not self.store_dir:
+            return 0
+        embeddings_path, index_path = self._paths()
+        if not (os.path.exists(embeddings_path) and os.path.exists(index_path)):
+            return 0
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            if index.get("version") != STORE_VERSION or index.get("model") != self.model_name:
+                logger.info("Ignoring tag cache store built for a different model or version")
+                return 0
+            embeddings = np.load(embeddings_path, mmap_mode="r")
+            tags = index["tags"]
+            if len(tags) != embeddings.shape[0]:
+                logger.warning("Tag cache index and embeddings disagree; ignoring store")
+                return 0
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load tag cache store: {e}")
+            return 0
+
+        # The store is written least recently used first, so keep the tail
+        start = max(0, len(tags) - self.entries.maxsize)
+        rows = embeddings[start:]
+        for offset, (music_genre, book_genre, score) in enumerate(resolve(rows)):
+            self.put(tags[start + offset], TagMatch(rows[offset], music_genre, book_genre, score))
+        logger.info(f"Loaded {len(tags) - start} tag embeddings from {self.store_dir}")
+        return len(tags) - start
+
+    # Workers of a prefork deploy share the store; holding an flock for the
+    # whole save keeps one process's embeddings from being paired with
+    # another's index
+    @contextmanager
+    def _process_lock(self):
+        os.makedirs(self.store_dir, exist_ok=True)
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.store_dir, LOCK_FILE), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save(self):
+        """Write the current entries to the on-disk store, atomically."""
+        if not self.store_dir:
+            return 0
+        items = self.entries.items()
+        if not items:
+            return 0
+        embeddings_path, index_path = self._paths()
+        with self._store_lock, self._process_lock():
+            matrix = np.stack([match.embedding for _, match in items]).astype(np.float32)
+            tmp_embeddings = f"{embeddings_path}.{os.getpid()}.tmp"
+            tmp_index = f"{index_path}.{os.getpid()}.tmp"
+            with open(tmp_embeddings, "wb") as f:
+                np.save(f, matrix)
+            with open(tmp_index, "w") as f:
+                json.dump({
+                    "version": STORE_VERSION,
+                    "model": self.model_name,
+                    "dim": int(matrix.shape[1]),
+                    "tags": [tag for tag, _ in items],
+                }, f)
+            # Each replace is atomic, so readers never see a half-written file
+            os.replace(tmp_embeddings, embeddings_path)
+            os.replace(tmp_index, index_path)
+        logger.info(f"Saved {len(items)} tag embeddings to {self.store_dir}")
+        return len(items)
@@ -0,0 +1,323 @@
+"""Interned tag vocabulary: one integer id per distinct normalized tag.
+
+The ``tags`` collection holds a document per tag Last.fm has ever returned,
+``{_id: int, tag, songs, embedding, model, music_genre, book_genre,
+score}``. Catalog tracks keep their display ``tags`` and store the same
+tags, in rank order, as ``tag_ids``. Genre scoring for a track reads its
+ids straight from the vocabulary: no lowercasing, and a tag any process
+has encoded before is served from its stored embedding instead of the
+encoder. Ingest only allocates ids; a new tag's embedding and genres are
+filled in the first time it is scored (right after ingest, by the
+background materialization).
+
+``songs`` counts the playlist entries whose track carries the tag. It is
+kept up to date with $inc as entries are added, deleted and retagged, so
+the tag facets are read from the vocabulary rather than by scanning the
+library. Tracks stored before the vocabulary get their ids, every counter
+is recomputed from scratch, and every tag's embedding and genres are
+stored or brought up to date (after a genre table change too), with:
+
+    python -m backend.tag_vocab
+"""
+import argparse
+import asyncio
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+
+import numpy as np
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from .db import async_counters_collection, async_tags_collection, get_db, tags_collection
+from .encoder import ENCODER_STAMP
+from .genres import (
+    book_genre_distributions,
+    distributions_from_matches,
+    normalize_tag,
+    resolve_embeddings,
+    resolve_tags,
+    tag_cache,
+)
+from .indexes import ensure_indexes
+from .tag_cache import TagMatch
+
+logger = logging.getLogger(__name__)
+
+# Counter document ids are allocated from
+TAG_ID_COUNTER = "tag_ids"
+
+# Vocabulary ids are never reused, so both maps only grow; a few bytes per
+# distinct Last.fm tag
+_ids = {}
+_tags = {}
+# Ids whose vocabulary doc this process has brought up to date
+_checked = set()
+_vocab_lock = threading.Lock()
+
+
+def _remember(docs):
+    with _vocab_lock:
+        for doc in docs:
+            _ids[doc["tag"]] = doc["_id"]
+            _tags[doc["_id"]] = doc["tag"]
+
+
+async def _insert_tag(doc):
+    try:
+        await async_tags_collection.insert_one(doc)
+    except DuplicateKeyError:
+        # Interned by another process first; its id wins
+        pass
+
+
+async def intern_tags(tags):
+    """Vocabulary ids for ``tags``, as {normalized tag: id}, allocating ids
+    for tags not seen before."""
+    normalized = list(dict.fromkeys(tag for tag in map(normalize_tag, tags) if tag))
+    unknown = [tag for tag in normalized if tag not in _ids]
+    if unknown:
+        _remember(await async_tags_collection.find_list({"tag": {"$in": unknown}}, {"tag": 1}))
+        new = [tag for tag in unknown if tag not in _ids]
+        if new:
+            counter = await async_counters_collection.find_one_and_update(
+                {"_id": TAG_ID_COUNTER}, {"$inc": {"seq": len(new)}},
+                upsert=True, return_document=ReturnDocument.AFTER,
+            )
+            first = counter["seq"] - len(new) + 1
+            now = datetime.now()
+            await asyncio.gather(*(
+                _insert_tag({"_id": first + i, "tag": tag, "songs": 0, "created_at": now})
+                for i, tag in enumerate(new)
+            ))
+            _remember(await async_tags_collection.find_list({"tag": {"$in": new}}, {"tag": 1}))
+    return {tag: _ids[tag] for tag in normalized}
+
+
+def tag_ids_for(tags, ids):
+    return list(dict.fromkeys(ids[tag] for tag in map(normalize_tag, tags or []) if tag in ids))
+
+
+async def attach_tag_ids(tracks):
+    """Set ``tag_ids`` on each of ``tracks`` from its ``tags``, with one
+    vocabulary round trip for all of them."""
+    ids = await intern_tags(tag for track in tracks for tag in track.get("tags") or [])
+    for track in tracks:
+        track["tag_ids"] = tag_ids_for(track.get("tags"), ids)
+    return tracks
+
+
+def _store_matches(docs, matches):
+    for doc, match in zip(docs, matches):
+        tags_collection.update_one({"_id": doc["_id"]}, {"$set": {
+            "embedding": match.embedding.astype(np.float32).tobytes(),
+            "model": ENCODER_STAMP,
+            "music_genre": match.music_genre,
+            "book_genre": match.book_genre,
+            "score": match.score,
+        }})
+
+
+# A stored match is out of date when it lacks an embedding from the current
+# encoder or its genres differ from those just resolved (the genre tables
+# changed)
+def _outdated(doc, match):
+    return (not doc.get("embedding") or doc.get("model") != ENCODER_STAMP
+            or doc.get("music_genre") != match.music_genre or doc.get("book_genre") != match.book_genre)
+
+
+def tag_matches(tag_ids):
+    """TagMatch for each vocabulary id, None for unknown ids. Served from
+    the tag cache, then from embeddings stored in the vocabulary; tags
+    without a stored embedding are encoded once. Whatever a tag's match
+    came from, its vocabulary doc is brought up to date the first time this
+    process scores it, so the facets see every tag's current genre. Call
+    this off the event loop."""
+    unique = list(dict.fromkeys(tag_ids))
+    cached = tag_cache.get_many([_tags[tag_id] for tag_id in unique if tag_id in _tags])
+    matches = {tag_id: cached[_tags[tag_id]] for tag_id in unique if _tags.get(tag_id) in cached}
+    needed = [tag_id for tag_id in unique if tag_id not in matches or tag_id not in _checked]
+    if needed:
+        docs = list(tags_collection.find(
+            {"_id": {"$in": needed}}, {"tag": 1, "embedding": 1, "model": 1, "music_genre": 1, "book_genre": 1}
+        ))
+        _remember(docs)
+        stored = [doc for doc in docs if doc["_id"] not in matches
+                  and doc.get("embedding") and doc.get("model") == ENCODER_STAMP]
+        if stored:
+            embeddings = np.stack([np.frombuffer(doc["embedding"], dtype=np.float32) for doc in stored])
+            # Genres are resolved again so a changed genre table applies at once
+            for doc, embedding, resolved in zip(stored, embeddings, resolve_embeddings(embeddings)):
+                matches[doc["_id"]] = TagMatch(embedding, *resolved)
+                tag_cache.put(doc["tag"], matches[doc["_id"]])
+        unresolved = [doc for doc in docs if doc["_id"] not in matches]
+        if unresolved:
+            matches.update((doc["_id"], match) for doc, match in zip(unresolved, resolve_tags([doc["tag"] for doc in unresolved])))
+        outdated = [doc for doc in docs if _outdated(doc, matches[doc["_id"]])]
+        _store_matches(outdated, [matches[doc["_id"]] for doc in outdated])
+        with _vocab_lock:
+            _checked.update(doc["_id"] for doc in docs)
+    return [matches.get(tag_id) for tag_id in tag_ids]
+
+
+def book_genre_distributions_by_id(id_lists):
+    """book_genre_distributions for songs given as tag vocabulary ids."""
+    id_lists = [list(dict.fromkeys(tag_ids or [])) for tag_ids in id_lists]
+    unique = list(dict.fromkeys(tag_id for tag_ids in id_lists for tag_id in tag_ids))
+    matches = {tag_id: match for tag_id, match in zip(unique, tag_matches(unique)) if match is not None}
+    return distributions_from_matches([[tag_id for tag_id in tag_ids if tag_id in matches] for tag_ids in id_lists], matches)
+
+
+def song_genre_distributions(songs):
+    """Book genre distribution for each song, scored by tag ids when the
+    song has them and by its tag strings otherwise."""
+    distributions = [None] * len(songs)
+    by_id = [i for i, song in enumerate(songs) if song.get("tag_ids") is not None]
+    by_tags = [i for i, song in enumerate(songs) if song.get("tag_ids") is None]
+    if by_id:
+        for i, distribution in zip(by_id, book_genre_distributions_by_id([songs[i]["tag_ids"] for i in by_id])):
+            distributions[i] = distribution
+    if by_tags:
+        for i, distribution in zip(by_tags, book_genre_distributions([songs[i].get("tags") or [] for i in by_tags])):
+            distributions[i] = distribution
+    return distributions
+
+
+# Apply {tag id: increment}, one update_many per distinct increment
+async def _apply_counts(increments):
+    by_increment = {}
+    for tag_id, increment in increments.items():
+        if increment:
+            by_increment.setdefault(increment, []).append(tag_id)
+    await asyncio.gather(*(
+        async_tags_collection.update_many({"_id": {"$in": tag_ids}}, {"$inc": {"songs": increment}})
+        for increment, tag_ids in by_increment.items()
+    ))
+
+
+async def count_songs(tracks, delta=1):
+    """Add ``delta`` to the song count of every tag of ``tracks``, once per
+    listed track (a track added twice counts twice). A failed update is
+    logged rather than failing the write it follows; python -m
+    backend.tag_vocab recounts."""
+    increments = Counter()
+    for track in tracks:
+        for tag_id in track.get("tag_ids") or []:
+            increments[tag_id] += delta
+    try:
+        await _apply_counts(increments)
+    except PyMongoError as e:
+        logger.error(f"Could not update tag counts: {e}")
+
+
+async def retag_counts(old_tag_ids, new_tag_ids, entries):
+    """Move the counts of a track held by ``entries`` playlist entries from
+    its old tags to its new ones."""
+    increments = Counter()
+    for tag_id in old_tag_ids or []:
+        increments[tag_id] -= entries
+    for tag_id in new_tag_ids or []:
+        increments[tag_id] += entries
+    try:
+        await _apply_counts(increments)
+    except PyMongoError as e:
+        logger.error(f"Could not update tag counts: {e}")
+
+
+def tag_facets(limit=50, book_genre=None):
+    """The most common tags in the library with their song counts, and the
+    number of (song, tag) pairs per book genre, read from the counters."""
+    query = {"songs": {"$gt": 0}}
+    if book_genre:
+        query["book_genre"] = book_genre
+    tags = [
+        {"id": doc["_id"], "tag": doc["tag"], "book_genre": doc.get("book_genre"), "songs": doc["songs"]}
+        for doc in tags_collection.find(query, {"tag": 1, "book_genre": 1, "songs": 1}).sort("songs", -1).limit(limit)
+    ]
+    genres = [
+        {"book_genre": doc["_id"], "songs": doc["songs"], "tags": doc["tags"]}
+        for doc in tags_collection.aggregate([
+            {"$match": query},
+            {"$group": {"_id": "$book_genre", "songs": {"$sum": "$songs"}, "tags": {"$sum": 1}}},
+            {"$sort": {"songs": -1}},
+        ])
+    ]
+    return {"tags": tags, "genres": genres}
+
+
+async def backfill(db=None, batch_size=500):
+    """Give tag_ids to every catalog track without them; returns the
+    number of tracks updated."""
+    db = db if db is not None else get_db()
+    updated = 0
+    while True:
+        tracks = list(db["tracks"].find({"tag_ids": {"$exists": False}}, {"tags": 1}).limit(batch_size))
+        if not tracks:
+            return updated
+        await attach_tag_ids(tracks)
+        for track in tracks:
+            db["tracks"].update_one({"_id": track["_id"]}, {"$set": {"tag_ids": track["tag_ids"]}})
+        updated += len(tracks)
+        logger.info(f"Interned the tags of {updated} tracks")
+
+
+def recount(db=None):
+    """Recompute every tag's song count from the library; returns the
+    number of tags in use. Entries written while it runs may be counted
+    twice or not at all, so run it when ingest is quiet."""
+    db = db if db is not None else get_db()
+    entries = {doc["_id"]: doc["entries"] for doc in db["playlists"].aggregate([
+        {"$match": {"track_id": {"$exists": True}}},
+        {"$group": {"_id": "$track_id", "entries": {"$sum": 1}}},
+    ])}
+    counts = Counter()
+    for track in db["tracks"].find({"_id": {"$in": list(entries)}}, {"tag_ids": 1}):
+        for tag_id in track.get("tag_ids") or []:
+            counts[tag_id] += entries[track["_id"]]
+    # Entries from before the catalog split carry tag_ids once retagged
+    for entry in db["playlists"].find({"track_id": {"$exists": False}, "tag_ids": {"$exists": True}}, {"tag_ids": 1}):
+        for tag_id in entry["tag_ids"]:
+            counts[tag_id] += 1
+    by_count = {}
+    for tag_id, count in counts.items():
+        by_count.setdefault(count, []).append(tag_id)
+    for count, tag_ids in by_count.items():
+        db["tags"].update_many({"_id": {"$in": tag_ids}}, {"$set": {"songs": count}})
+    db["tags"].update_many({"_id": {"$nin": list(counts)}}, {"$set": {"songs": 0}})
+    return len(counts)
+
+
+def resolve_vocabulary(batch_size=500):
+    """Score every vocabulary tag, storing embeddings and genres for those
+    without them and rewriting genres that changed with the genre tables;
+    returns the number of tags checked. Needs the encoder only for tags
+    no process has encoded yet."""
+    checked, last_id = 0, None
+    while True:
+        query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        tag_ids = [doc["_id"] for doc in tags_collection.find(query, {"_id": 1}).sort("_id", 1).limit(batch_size)]
+        if not tag_ids:
+            return checked
+        tag_matches(tag_ids)
+        checked += len(tag_ids)
+        last_id = tag_ids[-1]
+        logger.info(f"Resolved genres of {checked} tags")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Intern the tags of existing tracks, recount and resolve tag facets")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # The unique tag index must exist before ids are allocated
+    ensure_indexes()
+    tracks = asyncio.run(backfill(batch_size=args.batch_size))
+    tags = recount()
+    resolved = resolve_vocabulary(args.batch_size)
+    logger.info(f"Interned the tags of {tracks} tracks; {tags} tags in use, {resolved} resolved")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+"""Deduplicated track catalog and the playlist entries that reference it.
+
+A track's Last.fm metadata, tags and materialized book recommendations are
+stored once, in the ``tracks`` collection, under a content-addressed id: a
+hash of the normalized artist and title Last.fm returned. ``lookup_keys``
+holds the same hash for every spelling a track has been submitted under, so
+a repeat submission finds the track with one indexed query and never
+reaches Last.fm.
+
+Tags are also stored as ``tag_ids``, ids in the interned tag vocabulary
+(see tag_vocab.py), which genre scoring and the tag facets work from.
+
+A document in ``playlists`` is a lightweight entry, ``{_id, track_id,
+created_at}``. Its _id is the song id the API exposes; reads merge the
+entry with its track into the same song shape as before. Editing a song's
+track fields never changes the shared track: the entry gets a private copy
+(see fork_track), which later edits update in place. Entries stored
+before the split still hold the full song and are served as they are until
+``python -m backend.migrate_tracks`` converts them.
+"""
+import asyncio
+import hashlib
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from .db import async_playlists_collection, async_tracks_collection, tracks_collection
+from .tag_vocab import attach_tag_ids
+from .utils import normalize_text
+
+# Fields owned by the track; everything else on a song belongs to the entry
+TRACK_FIELDS = ("name", "artist", "album", "listeners", "playcount", "tags", "tag_ids", "url",
+                "artist_norm", "name_norm", "recommendations")
+# Computed from other track fields, never taken from a client
+DERIVED_TRACK_FIELDS = ("tag_ids", "artist_norm", "name_norm")
+# Catalog bookkeeping never shown on a song
+HIDDEN_TRACK_FIELDS = ("lookup_keys", "entry_id", "created_at", "updated_at")
+
+
+def track_key(artist, title):
+    normalized = f"{normalize_text(artist)}\x1f{normalize_text(title)}"
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+# Catalog document for a track's Last.fm metadata, findable under the key it
+# was submitted as as well as its canonical one
+def build_track_doc(metadata, lookup_key=None):
+    now = datetime.now()
+    _id = track_key(metadata.artist, metadata.name)
+    return {
+        "_id": _id,
+        "name": metadata.name,
+        "artist": metadata.artist,
+        "album": metadata.album,
+        "listeners": metadata.listeners,
+        "playcount": metadata.playcount,
+        "tags": metadata.tags,
+        "url": metadata.url,
+        "artist_norm": normalize_text(metadata.artist),
+        "name_norm": normalize_text(metadata.name),
+        "lookup_keys": list(dict.fromkeys([_id, lookup_key or _id])),
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+# Track fields a client edit sets, with the normalized name and artist
+# following the edited ones
+def edited_track_fields(fields):
+    edited = {key: value for key, value in fields.items() if key in TRACK_FIELDS and key not in DERIVED_TRACK_FIELDS}
+    for field in ("artist", "name"):
+        if field in edited:
+            edited[f"{field}_norm"] = normalize_text(edited[field])
+    return edited
+
+
+def private_track_id(entry_id):
+    return f"entry:{entry_id}"
+
+
+def fork_track(track, entry_id, fields):
+    """A copy of ``track`` owned by one entry, with ``fields`` applied. Its
+    only lookup key is its own id, so no submission ever resolves to it."""
+    now = datetime.now()
+    _id = private_track_id(entry_id)
+    doc = {key: value for key, value in track.items() if key in TRACK_FIELDS}
+    doc.update(fields)
+    if "tags" in fields:
+        # Recommendations derived from the old tags
+        doc.pop("recommendations", None)
+    doc.update({"_id": _id, "entry_id": entry_id, "lookup_keys": [_id], "created_at": now, "updated_at": now})
+    return doc
+
+
+def build_entry(track_id):
+    return {"track_id": track_id, "created_at": datetime.now()}
+
+
+# Insert the track unless it exists, and make it findable under its lookup keys
+def upsert_update(track):
+    fields = {key: value for key, value in track.items() if key != "lookup_keys"}
+    return {"$setOnInsert": fields, "$addToSet": {"lookup_keys": {"$each": track["lookup_keys"]}}}
+
+
+def upsert_operation(track):
+    return UpdateOne({"_id": track["_id"]}, upsert_update(track), upsert=True)
+
+
+async def find_tracks(keys):
+    """Catalog tracks submitted under any of ``keys``, as {key: track}."""
+    keys = list(keys)
+    if not keys:
+        return {}
+    found = {}
+    for track in await async_tracks_collection.find_list({"lookup_keys": {"$in": keys}}):
+        for key in track["lookup_keys"]:
+            found[key] = track
+    return {key: found[key] for key in keys if key in found}
+
+
+# The track as stored. A DuplicateKeyError means another track already
+# holds one of the lookup keys (or a concurrent upsert inserted this one
+# first), so the entry must point at that track instead
+async def _upsert_track(track):
+    try:
+        await async_tracks_collection.update_one({"_id": track["_id"]}, upsert_update(track), upsert=True)
+        return track
+    except DuplicateKeyError:
+        found = await find_tracks(track["lookup_keys"])
+        if not found:
+            raise
+        return next(iter(found.values()))
+
+
+# New tracks arrive at the Last.fm rate limit, a handful per batch, so the
+# upserts simply run side by side. Returns the stored tracks in order, which
+# callers must use in place of the ones passed in
+async def upsert_tracks(tracks):
+    await attach_tag_ids(tracks)
+    return list(await asyncio.gather(*(_upsert_track(track) for track in tracks)))
+
+
+def song_view(entry, track):
+    """The song as the API returns it: the entry's id and timestamps over
+    the track's metadata. Entries not yet migrated are already songs."""
+    if track is None:
+        return entry
+    song = {key: value for key, value in track.items() if key not in HIDDEN_TRACK_FIELDS}
+    if "payload" in song.get("recommendations", {}):
+        # The pre-encoded response is only for the recommendations route
+        song["recommendations"] = {k: v for k, v in song["recommendations"].items() if k != "payload"}
+    song.update(entry)
+    song["track_id"] = track["_id"]
+    return song
+
+
+# Keep the requested fields (and the entry's keys, which the sort needs)
+def _project(song, projection):
+    if not projection:
+        return song
+    wanted = {name.split(".")[0] for name in projection}
+    return {key: value for key, value in song.items() if key in wanted or key == "_id"}
+
+
+def _track_projection(projection):
+    if not projection:
+        return None
+    names = [name for name in projection if name.split(".")[0] in TRACK_FIELDS]
+    return {name: 1 for name in names + ["_id"]}
+
+
+def _merge(entries, tracks, projection):
+    by_id = {track["_id"]: track for track in tracks}
+    return [
+        _project(song_view(entry, by_id.get(entry.get("track_id"))), projection)
+        for entry in entries
+    ]
+
+
+def resolve_songs(entries, projection=None):
+    """Songs for a batch of entries, with one $in query for their tracks."""
+    track_ids = list({entry["track_id"] for entry in entries if "track_id" in entry})
+    tracks = list(tracks_collection.find({"_id": {"$in": track_ids}}, _track_projection(projection))) if track_ids else []
+    return _merge(entries, tracks, projection)
+
+
+async def resolve_songs_async(entries, projection=None):
+    track_ids = list({entry["track_id"] for entry in entries if "track_id" in entry})
+    tracks = await async_tracks_collection.find_list({"_id": {"$in": track_ids}}, _track_projection(projection)) if track_ids else []
+    return _merge(entries, tracks, projection)
+
+
+# Songs from a cursor over entries, resolved a batch at a time
+def iter_songs(cursor, batch_size, projection=None):
+    batch = []
+    for entry in cursor:
+        batch.append(entry)
+        if len(batch) >= batch_size:
+            yield from resolve_songs(batch, projection)
+            batch = []
+    if batch:
+        yield from resolve_songs(batch, projection)
+
+
+async def get_song(song_id, projection=None):
+    entry = await async_playlists_collection.find_one({"_id": song_id})
+    if entry is None:
+        return None
+    return (await resolve_songs_async([entry], projection))[0]
+
+
+# The document holding a song's track fields, unmerged: its catalog track
+# (with track_id set), or the entry itself when it predates the catalog
+async def get_song_track(song_id, projection=None):
+    entry_projection = {**projection, "track_id": 1} if projection else None
+    entry = await async_playlists_collection.find_one({"_id": song_id}, entry_projection)
+    if entry is None or "track_id" not in entry:
+        return entry
+    track = await async_tracks_collection.find_one({"_id": entry["track_id"]}, projection)
+    if track is not None:
+        track["track_id"] = track["_id"]
+    return track
@@ -1,4 +1,6 @@
 import bcrypt
+import re
+from .executors import bcrypt_pool
 
 def hash_password(password: str) -> str:
     # Hash the password using bcrypt
@@ -8,3 +10,26 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     # Verify the password using bcrypt
     return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+# bcrypt costs tens of milliseconds per call, so async routes hand it to the
+# process pool instead of running it on the event loop
+async def hash_password_async(password: str) -> str:
+    return await bcrypt_pool.run(hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await bcrypt_pool.run(verify_password, plain_password, hashed_password)
+
+# "feat. X" / "ft. X" / "featuring X", either bracketed or trailing
+_FEATURING = re.compile(
+    r"[\(\[]\s*(?:feat\.?|ft\.?|featuring)\s[^\)\]]*[\)\]]|\s(?:feat\.?|ft\.?|featuring)\s.*$",
+    re.IGNORECASE,
+)
+
+def normalize_text(value: str) -> str:
+    # Fold case and whitespace and drop featured artists, so trivially
+    # different spellings of the same track share one key
+    value = _FEATURING.sub("", value or "")
+    return " ".join(value.casefold().split())
+
+def normalize_track_key(artist: str, track: str) -> tuple:
+    return normalize_text(artist), normalize_text(track)
@@ -0,0 +1,46 @@
+"""Per-request cost of authentication.
+
+Times token verification with and without the verified-token cache, and
+the get_current_user dependency. Everything runs in process; no server or
+network is involved.
+
+Run from the repository root, with requirements-dev.txt installed:
+
+    python -m benchmarks.bench_auth --iterations 20000
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault("MONGO_URL", "mongomock://bench")
+
+from backend import auth
+from backend.auth import create_access_token, verify_access_token
+from backend.routes.auth import get_current_user
+
+
+def per_call_us(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Authentication overhead per request")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+
+    token = create_access_token({"sub": "bench@example.com"})
+
+    token_cache = auth.token_cache
+    auth.token_cache = None
+    print(f"verify, no cache           {per_call_us(lambda: verify_access_token(token), args.iterations):8.2f}us")
+    print(f"get_current_user, no cache {per_call_us(lambda: get_current_user(token), args.iterations):8.2f}us")
+    auth.token_cache = token_cache
+    print(f"verify, cached             {per_call_us(lambda: verify_access_token(token), args.iterations):8.2f}us")
+    print(f"get_current_user, cached   {per_call_us(lambda: get_current_user(token), args.iterations):8.2f}us")
+
+
+if __name__ == "__main__":
+    main()
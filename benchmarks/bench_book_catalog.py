@@ -0,0 +1,91 @@
+"""Recall and latency of the book catalog IVF index against brute force.
+
+By default a synthetic clustered catalog is generated (no model needed);
+--catalog points at a real catalog directory built by backend.book_catalog,
+in which case the queries are perturbed copies of catalog rows.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_book_catalog --books 200000 --queries 200
+"""
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from backend.book_catalog import BookCatalog, write_catalog
+
+
+def unit(rows):
+    return rows / np.linalg.norm(rows, axis=-1, keepdims=True)
+
+
+def synthetic_catalog(directory, n_books, dim, dtype, seed=0):
+    rng = np.random.default_rng(seed)
+    # Books scattered around a few hundred topic directions, like real
+    # embeddings that cluster by subject
+    topics = unit(rng.standard_normal((max(8, n_books // 500), dim)))
+    noise = rng.standard_normal((n_books, dim)) / np.sqrt(dim)
+    vectors = unit(topics[rng.integers(len(topics), size=n_books)] + 0.8 * noise)
+    books = [{"title": f"Book {i}", "author": "Bench", "genres": []} for i in range(n_books)]
+    write_catalog(books, vectors.astype(np.float32), directory, dtype=dtype)
+
+
+def make_queries(catalog, n_queries, seed=1):
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(len(catalog), size=n_queries)
+    base = np.stack([catalog.vector(book_id) for book_id in ids])
+    noise = rng.standard_normal(base.shape) / np.sqrt(base.shape[1])
+    return unit(base + 0.5 * noise).astype(np.float32)
+
+
+def timed(search, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        ids, _ = search(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+        results.append(set(ids.tolist()))
+    latencies.sort()
+    return results, latencies
+
+
+def report(name, latencies, recall=None):
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    recall_text = f" recall@k={recall:.3f}" if recall is not None else ""
+    print(f"{name:18s} p50={p50:.3f}ms p99={p99:.3f}ms{recall_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Book catalog recall vs latency")
+    parser.add_argument("--catalog", help="existing catalog directory")
+    parser.add_argument("--books", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--dtype", choices=("float16", "int8"), default="float16")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = args.catalog
+        if not directory:
+            print(f"Building synthetic catalog: {args.books} books, dim {args.dim}, {args.dtype}")
+            synthetic_catalog(tmp, args.books, args.dim, args.dtype)
+            directory = tmp
+        catalog = BookCatalog(directory)
+        queries = make_queries(catalog, args.queries)
+        print(f"{len(catalog)} books, {len(catalog.centroids)} lists, k={args.k}")
+
+        exact, latencies = timed(lambda q: catalog.search_exact(q, k=args.k), queries)
+        report("brute force", latencies)
+        for nprobe in args.nprobe:
+            approx, latencies = timed(lambda q: catalog.search(q, k=args.k, nprobe=nprobe), queries)
+            recall = np.mean([len(a & e) / len(e) for a, e in zip(approx, exact)])
+            report(f"ivf nprobe={nprobe}", latencies, recall)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""Google Books lookup latency with a plain TTL cache, with
+stale-while-revalidate, and with SWR plus the genre prefetcher.
+
+Lookups for random (genre, max_results) keys, every book genre at each
+prefetched size, arrive at a steady rate for --duration seconds. They go
+through a GoogleBooksClient whose transport answers after --latency-ms,
+with one response in --tail-every taking --tail-ms instead. The freshness
+window is shortened to --fresh seconds so results expire many times during
+the run. Reports p50/p99/max lookup latency and the upstream calls made.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_book_prefetch --duration 10 --fresh 1
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+
+from backend.book_prefetch import BookPrefetcher, prefetch_keys
+from backend.genres import BOOK_GENRES
+from backend.google_books import GoogleBooksClient
+from backend.resilience import CircuitBreaker
+
+
+# Every book genre, an upper bound on the reachable ones, so the run needs no
+# genre index or encoder
+def bench_keys():
+    return prefetch_keys(genres=BOOK_GENRES)
+
+
+def slow_transport(latency, tail_latency, tail_every, calls):
+    async def handle(request):
+        calls.append(request.url.params["q"])
+        await asyncio.sleep(tail_latency if len(calls) % tail_every == 0 else latency)
+        return httpx.Response(200, json={"items": [{"id": "1", "volumeInfo": {"title": request.url.params["q"]}}]})
+    return httpx.MockTransport(handle)
+
+
+async def run(mode, args):
+    calls = []
+    client = GoogleBooksClient(
+        transport=slow_transport(args.latency_ms / 1000, args.tail_ms / 1000, args.tail_every, calls),
+        breaker=CircuitBreaker(f"bench_{mode}"),
+        fresh_for=args.fresh,
+        stale_for=0 if mode == "ttl" else 3600,
+    )
+    keys = bench_keys()
+    prefetcher = BookPrefetcher(client, keys, concurrency=4)
+    if mode == "prefetch":
+        prefetcher.start()
+        # Lookups start once the first pass has warmed every key
+        while prefetcher.refreshes < len(keys):
+            await asyncio.sleep(0.01)
+
+    rng = random.Random(0)
+    latencies = []
+
+    async def lookup(key):
+        start = time.perf_counter()
+        await client.search_subject(*key)
+        latencies.append(time.perf_counter() - start)
+
+    tasks = []
+    interval = 1 / args.rate
+    end = time.monotonic() + args.duration
+    while time.monotonic() < end:
+        tasks.append(asyncio.ensure_future(lookup(rng.choice(keys))))
+        await asyncio.sleep(interval)
+    await asyncio.gather(*tasks)
+    await prefetcher.stop()
+    await client.aclose()
+    return np.array(latencies) * 1000, len(calls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Google Books lookup latency with and without prefetching")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--rate", type=float, default=200, help="lookups per second")
+    parser.add_argument("--fresh", type=float, default=1, help="freshness window, seconds")
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--tail-ms", type=float, default=1500)
+    parser.add_argument("--tail-every", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{len(bench_keys())} keys, {args.rate:.0f} lookups/s for {args.duration:.0f}s, "
+          f"upstream {args.latency_ms:.0f}ms (1 in {args.tail_every} takes {args.tail_ms:.0f}ms)")
+    for mode, name in (("ttl", "TTL cache"), ("swr", "stale-while-revalidate"), ("prefetch", "SWR + prefetcher")):
+        latencies, calls = asyncio.run(run(mode, args))
+        print(f"  {name:24s} p50 {np.percentile(latencies, 50):8.2f}ms  p99 {np.percentile(latencies, 99):8.2f}ms  "
+              f"max {latencies.max():8.2f}ms  {calls} upstream calls")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Latency, throughput, memory and parity of each sentence encoder backend.
+
+Each backend runs in its own fresh interpreter, so the reported RSS is what
+one worker pays for it. Parity is the cosine similarity of each backend's
+embeddings to the torch reference over the genre names and sample tags.
+
+Run from the repository root, with requirements-dev.txt installed (for
+onnxruntime):
+
+    python -m benchmarks.bench_encoder --backends torch torch-int8 onnx
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+PROBE = """
+import json, resource, sys, time
+import numpy as np
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+backend, calls, batch_size, output = sys.argv[1], int(sys.argv[2]), int(sys.argv[3]), sys.argv[4]
+baseline = rss_mb()
+from backend.encoder import create_encoder, parity_texts
+texts = parity_texts()
+start = time.perf_counter()
+encoder = create_encoder(backend)
+encoder.encode(["warm up"])
+load_s = time.perf_counter() - start
+loaded = rss_mb()
+
+latencies = []
+for i in range(calls):
+    start = time.perf_counter()
+    encoder.encode([texts[i % len(texts)]])
+    latencies.append((time.perf_counter() - start) * 1000)
+latencies.sort()
+
+batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+start = time.perf_counter()
+for _ in range(5):
+    encoder.encode(batch)
+throughput = 5 * batch_size / (time.perf_counter() - start)
+
+np.save(output, encoder.encode(texts))
+print(json.dumps({
+    "load_s": load_s,
+    "p50_ms": latencies[len(latencies) // 2],
+    "p99_ms": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+    "texts_per_s": throughput,
+    "rss_loaded_mb": loaded - baseline,
+    "rss_peak_mb": rss_mb(),
+}))
+"""
+
+
+def run_backend(backend, calls, batch_size, output):
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE, backend, str(calls), str(batch_size), output],
+        capture_output=True, text=True, env={**os.environ, "ENCODER_BACKEND": backend},
+    )
+    if result.returncode != 0:
+        print(f"{backend:11s} failed: {result.stderr.strip().splitlines()[-1]}")
+        return None
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare sentence encoder backends")
+    parser.add_argument("--backends", nargs="+", default=["torch", "torch-int8", "onnx"])
+    parser.add_argument("--calls", type=int, default=200, help="single-text calls for latency")
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+    embeddings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in backends:
+            output = os.path.join(tmp, f"{backend}.npy")
+            stats = run_backend(backend, args.calls, args.batch_size, output)
+            if stats is None:
+                continue
+            embeddings[backend] = np.load(output)
+            parity_text = ""
+            if "torch" in embeddings:
+                similarities = (embeddings[backend] * embeddings["torch"]).sum(axis=1)
+                parity_text = f" parity mean={similarities.mean():.4f} min={similarities.min():.4f}"
+            print(f"{backend:11s} load={stats['load_s']:.2f}s p50={stats['p50_ms']:.2f}ms "
+                  f"p99={stats['p99_ms']:.2f}ms {stats['texts_per_s']:.0f} texts/s "
+                  f"rss +{stats['rss_loaded_mb']:.0f}MB (peak {stats['rss_peak_mb']:.0f}MB){parity_text}")
+
+
+if __name__ == "__main__":
+    main()
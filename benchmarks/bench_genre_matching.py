@@ -0,0 +1,90 @@
+"""Per-request latency of find_best_matching_genre, before and after the
+precomputed genre embedding index.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_genre_matching
+"""
+import argparse
+import statistics
+import time
+
+from sentence_transformers import util
+
+from backend import genres
+from backend.encoder import get_model
+
+# Tags that never hit GENRE_MAPPING directly, so every call takes the
+# embedding path
+SAMPLE_TAGS = [
+    ["seen live", "female vocalists", "singer-songwriter"],
+    ["90s", "grunge", "british"],
+    ["chillout", "lounge", "downtempo", "trip-hop"],
+    ["post-rock", "instrumental", "experimental"],
+    ["hardcore", "emo", "screamo", "post-hardcore", "american"],
+]
+
+
+# The original implementation: re-encodes every music genre on each call and
+# compares tags one at a time
+def legacy_find_best_matching_genre(song_tags):
+    lowercase_tags = [tag.lower() for tag in song_tags]
+    tag_embeddings = get_model().encode(lowercase_tags)
+    music_genres = list(genres.get_genre_mapping().keys())
+    music_genre_embeddings = get_model().encode(music_genres)
+
+    max_similarity = -1
+    best_music_genre = None
+    for tag_embedding in tag_embeddings:
+        similarities = util.cos_sim(tag_embedding.reshape(1, -1), music_genre_embeddings)[0]
+        max_index = similarities.argmax()
+        if similarities[max_index] > max_similarity:
+            max_similarity = similarities[max_index]
+            best_music_genre = music_genres[max_index]
+    return genres.get_genre_mapping()[best_music_genre]
+
+
+def run(func, rounds, before=None):
+    timings = []
+    for _ in range(rounds):
+        for tags in SAMPLE_TAGS:
+            if before:
+                before()
+            start = time.perf_counter()
+            func(tags)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        "mean_ms": statistics.mean(timings),
+        "p50_ms": timings[len(timings) // 2],
+        "p95_ms": timings[int(len(timings) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+
+    # Both implementations should agree before their timings mean anything
+    for tags in SAMPLE_TAGS:
+        legacy = legacy_find_best_matching_genre(tags)
+        indexed = genres.find_best_matching_genre(tags)
+        if legacy != indexed:
+            print(f"WARNING: {tags} -> legacy={legacy!r} indexed={indexed!r}")
+
+    # Warm up the model once so neither side pays first-call overhead
+    run(genres.find_best_matching_genre, 1)
+
+    for name, func, before in (
+        ("legacy (re-encode genres, per-tag loop)", legacy_find_best_matching_genre, None),
+        ("indexed, cold tag cache", genres.find_best_matching_genre, genres.tag_cache.entries.clear),
+        ("indexed, warm tag cache", genres.find_best_matching_genre, None),
+    ):
+        stats = run(func, args.rounds, before)
+        print(f"{name:45s} mean={stats['mean_ms']:.2f}ms "
+              f"p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
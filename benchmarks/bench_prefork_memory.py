@@ -0,0 +1,106 @@
+"""Per-worker memory of the prefork launcher with and without preloading.
+
+Starts ``python -m backend.prefork`` once with --no-preload (each worker
+loads the encoder, genre index and tag cache itself, as with uvicorn
+--workers) and once preloaded (loaded in the parent, shared copy-on-write),
+waits for the workers to settle, and reads /proc/<pid>/smaps_rollup for the
+parent and every worker. RSS counts shared pages in every process that maps
+them; PSS splits them between those processes, so the PSS total is the
+memory the deployment actually uses. Linux only.
+
+Run from the repository root, with the encoder and genre artifact the
+deployment uses:
+
+    python -m benchmarks.bench_prefork_memory --workers 4
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+from backend.prefork import memory_usage
+
+MB = 1024 * 1024
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def children(pid):
+    with open(f"/proc/{pid}/task/{pid}/children") as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_ready(proc, port, workers, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"launcher exited with status {proc.returncode}")
+        try:
+            # Workers only accept once their own loading is done
+            if len(children(proc.pid)) == workers and httpx.get(f"http://127.0.0.1:{port}/metrics", timeout=1).status_code == 200:
+                return
+        except (httpx.HTTPError, FileNotFoundError):
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"workers not ready after {timeout}s")
+
+
+def measure(workers, preload, settle, timeout):
+    port = free_port()
+    command = [sys.executable, "-m", "backend.prefork", "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers)]
+    if not preload:
+        command.append("--no-preload")
+    env = {**os.environ, "LOG_LEVEL": "warning"}
+    proc = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(proc, port, workers, timeout)
+        # Every worker must have finished loading, not just the first to answer
+        time.sleep(settle)
+        return memory_usage(proc.pid), [memory_usage(pid) for pid in children(proc.pid)]
+    finally:
+        proc.send_signal(signal.SIGTERM)
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def report(name, parent, workers):
+    print(name)
+    print(f"  {'process':10s} {'RSS MB':>9s} {'PSS MB':>9s} {'shared MB':>10s} {'private MB':>11s}")
+    for label, usage in [("parent", parent)] + [(f"worker {i}", usage) for i, usage in enumerate(workers)]:
+        print(f"  {label:10s} {usage['rss'] / MB:9.1f} {usage['pss'] / MB:9.1f} "
+              f"{usage['shared'] / MB:10.1f} {usage['private'] / MB:11.1f}")
+    processes = [parent] + workers
+    rss = sum(usage["rss"] for usage in processes)
+    pss = sum(usage["pss"] for usage in processes)
+    print(f"  {'total':10s} {rss / MB:9.1f} {pss / MB:9.1f}")
+    return pss
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefork per-worker RSS and PSS with and without preloading")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--settle", type=float, default=5, help="seconds to wait after the first worker answers")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the workers to start")
+    args = parser.parse_args()
+
+    totals = {}
+    for name, preload in (("no preload (per-worker loading)", False), ("preloaded in the parent", True)):
+        parent, workers = measure(args.workers, preload, args.settle, args.timeout)
+        totals[preload] = report(name, parent, workers)
+    saved = totals[False] - totals[True]
+    print(f"preloading saves {saved / MB:.1f} MB PSS in total, {saved / args.workers / MB:.1f} MB per worker")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Cost of encoding song and recommendation payloads.
+
+Songs: a list of synthetic song documents as Mongo returns them (ObjectId
+ids, datetimes, tags, materialized recommendations) encoded the way the
+routes used to (``_id`` string loop, jsonable_encoder, JSONResponse), with
+the stdlib json streaming encoder, and with MongoJSONResponse.
+
+Recommendations: one materialized response built and validated through
+BookRecommendationsResponse, encoded from the stored dict with orjson, and
+served from the stored pre-encoded bytes.
+
+Run from the repository root, with requirements-dev.txt installed:
+
+    python -m benchmarks.bench_serialization --songs 10000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("MONGO_URL", "mongomock://bench")
+
+from bson import ObjectId
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from backend.routes.book_recommendations import BookRecommendationsResponse
+from backend.serialization import MongoJSONResponse, dumps
+
+TAGS = ["rock", "indie", "seen live", "female vocalists", "90s", "chillout", "electronic", "jazz", "folk", "soul"]
+
+
+def make_books(rng, n):
+    return [{
+        "title": f"Book {i} of the {rng.choice(TAGS)} shelf",
+        "author": f"Author {rng.randrange(1000)}",
+        "description": "A sweeping story across three generations. " * 4,
+        "cover_url": f"https://books.example.com/covers/{rng.randrange(10 ** 6)}.jpg",
+        "rating": round(rng.uniform(3, 5), 1),
+        "genres": ["Fiction", "Literary Fiction"],
+        "google_books_id": f"{rng.randrange(16 ** 12):012x}",
+    } for i in range(n)]
+
+
+def make_recommendations(rng, n=5):
+    return {
+        "music_genre": "rock",
+        "mapped_book_genre": "literary fiction",
+        "recommendations": make_books(rng, n),
+        "genre_distribution": [{"book_genre": "literary fiction", "weight": 0.61},
+                               {"book_genre": "thriller", "weight": 0.22}],
+    }
+
+
+def make_songs(n, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 1)
+    songs = []
+    for i in range(n):
+        song = {
+            "_id": ObjectId(),
+            "track_id": f"{rng.randrange(16 ** 40):040x}",
+            "name": f"Song {i}",
+            "artist": f"Artist {i % 500}",
+            "album": f"Album {i % 900}",
+            "listeners": rng.randrange(10 ** 6),
+            "playcount": rng.randrange(10 ** 8),
+            "tags": rng.sample(TAGS, 5),
+            "url": f"https://www.last.fm/music/Artist+{i % 500}/_/Song+{i}",
+            "created_at": start + timedelta(seconds=i),
+        }
+        # Most stored songs carry their materialized recommendations
+        if i % 4:
+            song["recommendations"] = {**make_recommendations(rng), "max_results": 5, "version": "v",
+                                       "computed_at": start + timedelta(seconds=i)}
+        songs.append(song)
+    return songs
+
+
+def best_ms(fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def fastapi_default(songs):
+    # What GET /songs/ used to do with a page of documents
+    copies = [dict(song) for song in songs]
+    for song in copies:
+        song["_id"] = str(song["_id"])
+    return JSONResponse(jsonable_encoder({"songs": copies})).body
+
+
+def stdlib_stream(songs):
+    def default(value):
+        if isinstance(value, ObjectId):
+            return str(value)
+        if isinstance(value, datetime):
+            return value.isoformat()
+        raise TypeError
+    return b'{"songs":[' + ",".join(json.dumps(song, default=default, separators=(",", ":")) for song in songs).encode() + b"]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Song and recommendation payload encoding cost")
+    parser.add_argument("--songs", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=20000, help="recommendation responses per timing")
+    args = parser.parse_args()
+
+    songs = make_songs(args.songs)
+    size = len(MongoJSONResponse({"songs": songs}).body)
+    print(f"{args.songs} songs, {size / 1e6:.1f} MB of JSON")
+    for name, fn in (
+        ("jsonable_encoder + JSONResponse", lambda: fastapi_default(songs)),
+        ("stdlib json, BSON default", lambda: stdlib_stream(songs)),
+        ("MongoJSONResponse (orjson)", lambda: MongoJSONResponse({"songs": songs}).body),
+    ):
+        ms = best_ms(fn, args.repeat)
+        print(f"  {name:34s} {ms:9.1f}ms {size / ms / 1e3:8.1f} MB/s")
+
+    stored = make_recommendations(random.Random(1))
+    payload = dumps(stored)
+    print(f"materialized recommendations, {len(payload)} bytes")
+    for name, fn in (
+        ("validate via model + dump", lambda: BookRecommendationsResponse(**stored).model_dump_json()),
+        ("orjson from stored dict", lambda: MongoJSONResponse(stored).body),
+        ("pre-encoded bytes", lambda: MongoJSONResponse(payload).body),
+    ):
+        ms = best_ms(lambda: [fn() for _ in range(args.iterations)], args.repeat)
+        print(f"  {name:34s} {ms / args.iterations * 1000:9.2f}us per response")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Time `import backend.main` in fresh interpreters.
+
+"cold" runs without the genre artifact, so the first genre lookup has to load
+the encoder and build the index; "warm" runs with the artifact built by
+`python -m backend.genre_artifacts`. Each sample is a new process, and also
+times the first call to get_genre_index() to show where the cost moved.
+
+The MongoDB client is created on first use and connects lazily, so
+importing the app needs neither MONGO_URL nor a reachable server.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --runs 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+PROBE = """
+import json, time
+start = time.perf_counter()
+import backend.main
+imported = time.perf_counter()
+from backend.genres import get_genre_index
+get_genre_index()
+indexed = time.perf_counter()
+print(json.dumps({"import_s": imported - start, "first_index_s": indexed - imported}))
+"""
+
+
+def sample(artifact_path, runs):
+    env = {**os.environ, "GENRE_ARTIFACT_PATH": artifact_path}
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", PROBE], env=env, check=True, capture_output=True, text=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+
+def report(name, results):
+    for key in ("import_s", "first_index_s"):
+        values = [result[key] for result in results]
+        print(f"{name:6s} {key:14s} median={statistics.median(values):.3f}s "
+              f"min={min(values):.3f}s max={max(values):.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time import backend.main cold and warm")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        artifact_path = os.path.join(tmp, "genre_index.npz")
+        report("cold", sample(artifact_path, args.runs))
+
+        subprocess.run(
+            [sys.executable, "-m", "backend.genre_artifacts", "--output", artifact_path], check=True
+        )
+        report("warm", sample(artifact_path, args.runs))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Offline evaluation of the genre scorers over a labeled sample.
+
+Each line of the labels file is a song's Last.fm tags plus the book genres
+a reader judged fitting, best first. The weighted multi-tag scorer and the
+original first-match scorer are compared on top-1 accuracy (top genre is
+one of the labels), hit@3 and mean reciprocal rank of the first labeled
+genre, plus time per song. Needs the encoder (or a warm TAG_CACHE_DIR).
+
+Run from the repository root:
+
+    python -m benchmarks.eval_genre_scoring [--labels FILE] [--show-misses]
+"""
+import argparse
+import json
+import os
+import time
+
+from backend.genres import book_genre_distributions, first_match_genres, get_genre_index
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(__file__), "data", "genre_labels.jsonl")
+
+
+def load_labels(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def score(rankings, samples):
+    top1 = hit3 = reciprocal = 0.0
+    for ranking, sample in zip(rankings, samples):
+        labels = set(sample["book_genres"])
+        top1 += ranking[0] in labels
+        hit3 += any(genre in labels for genre in ranking[:3])
+        rank = next((i for i, genre in enumerate(ranking) if genre in labels), None)
+        reciprocal += 1 / (rank + 1) if rank is not None else 0
+    n = len(samples)
+    return {"top1": top1 / n, "hit@3": hit3 / n, "mrr": reciprocal / n}
+
+
+def timed(scorer, tag_lists, repeats=5):
+    scorer(tag_lists)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        result = scorer(tag_lists)
+    return result, (time.perf_counter() - start) / repeats / len(tag_lists) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate genre scoring against labeled songs")
+    parser.add_argument("--labels", default=DEFAULT_LABELS)
+    parser.add_argument("--show-misses", action="store_true")
+    args = parser.parse_args()
+
+    samples = load_labels(args.labels)
+    tag_lists = [sample["tags"] for sample in samples]
+    get_genre_index()
+
+    # The first-match scorer only yields one genre, so its ranking has length 1
+    baseline, baseline_us = timed(first_match_genres, tag_lists)
+    weighted, weighted_us = timed(book_genre_distributions, tag_lists)
+    rankings = {
+        "first-match": [[genre] for genre in baseline],
+        "weighted": [[genre for genre, _ in distribution] for distribution in weighted],
+    }
+
+    print(f"{len(samples)} labeled songs")
+    for name, us in (("first-match", baseline_us), ("weighted", weighted_us)):
+        metrics = score(rankings[name], samples)
+        print(f"{name:12s} top1={metrics['top1']:.3f} hit@3={metrics['hit@3']:.3f} "
+              f"mrr={metrics['mrr']:.3f} {us:.1f}us/song")
+
+    if args.show_misses:
+        for sample, ranking in zip(samples, rankings["weighted"]):
+            if ranking[0] not in sample["book_genres"]:
+                print(f"  {sample.get('track', sample['tags'])}: got {ranking[:3]}, labeled {sample['book_genres']}")
+
+
+if __name__ == "__main__":
+    main()
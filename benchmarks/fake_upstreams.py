@@ -0,0 +1,86 @@
+"""Local stand-ins for the Last.fm and Google Books APIs.
+
+Both answer from deterministic data after a configurable delay, so load
+tests run offline and repeatably. Start them on free ports with
+start_fake_upstreams(); point LASTFM_API_URL and GOOGLE_BOOKS_API_URL at
+the returned URLs before importing the app.
+"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+TAG_POOL = [
+    "rock", "pop", "indie", "electronic", "jazz", "hip hop", "folk", "metal",
+    "soul", "ambient", "seen live", "female vocalists", "90s", "chillout",
+    "alternative", "dance", "classic rock", "singer-songwriter", "punk", "blues",
+]
+
+
+def _pick(key, pool, count):
+    digest = hashlib.sha256(key.encode("utf-8")).digest()
+    return list(dict.fromkeys(pool[b % len(pool)] for b in digest[:count]))
+
+
+def lastfm_track(artist, track):
+    return {"track": {
+        "name": track,
+        "artist": {"name": artist},
+        "album": {"title": f"{artist} Greatest Hits"},
+        "listeners": "12345",
+        "playcount": "67890",
+        "toptags": {"tag": [{"name": tag} for tag in _pick(f"{artist}/{track}", TAG_POOL, 5)]},
+        "url": f"https://www.last.fm/music/{artist}/_/{track}",
+    }}
+
+
+def google_volumes(query, max_results):
+    subject = query.removeprefix("subject:")
+    return {"items": [{
+        "id": hashlib.sha256(f"{subject}/{i}".encode("utf-8")).hexdigest()[:12],
+        "volumeInfo": {
+            "title": f"{subject.title()} Book {i + 1}",
+            "authors": [f"Author {i + 1}"],
+            "description": f"A {subject} novel.",
+            "averageRating": 3.5 + (i % 3) / 2,
+            "categories": [subject],
+        },
+    } for i in range(max_results)]}
+
+
+class FakeUpstreamHandler(BaseHTTPRequestHandler):
+    # Set on the server: seconds to wait before every response
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if url.path.startswith("/lastfm"):
+            body = lastfm_track(params.get("artist", ""), params.get("track", ""))
+        elif url.path.startswith("/books"):
+            body = google_volumes(params.get("q", ""), int(params.get("maxResults", 5)))
+        else:
+            self.send_error(404)
+            return
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_upstreams(latency=0.05):
+    """Serve both fake APIs from one threaded server on a free port.
+    Returns (lastfm_url, google_books_url, server); call
+    server.shutdown() when done."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeUpstreamHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    return f"{base}/lastfm/2.0/", f"{base}/books/v1/volumes", server
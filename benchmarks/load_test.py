@@ -0,0 +1,217 @@
+"""Offline load test of the HTTP API.
+
+Starts the app under uvicorn against an in-memory mongomock database and
+local fake Last.fm / Google Books servers (benchmarks/fake_upstreams.py),
+seeds a user and a library of songs, then drives each scenario at each
+concurrency level and reports p50/p95/p99 latency and throughput.
+
+By default the sentence encoder is replaced with a deterministic stub, so
+no model download is needed and the numbers show the service's own
+overhead; --real-encoder loads the configured backend instead.
+
+Run from the repository root, with requirements-dev.txt installed:
+
+    python -m benchmarks.load_test --concurrency 1 8 32 --requests 500
+
+Save a run with --json FILE and compare later runs against it with
+--baseline FILE; the command exits 1 when a scenario's p95 regresses by
+more than --tolerance.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+SCENARIOS = ("songs", "track_metadata", "recommendations", "login")
+
+
+class StubEncoder:
+    name = "stub"
+
+    # Deterministic unit vectors from a hash of each text
+    def encode(self, texts):
+        rows = [
+            np.random.default_rng(int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little"))
+            .standard_normal(384) for text in texts
+        ]
+        rows = np.asarray(rows, dtype=np.float32).reshape(len(texts), 384)
+        return rows / np.maximum(np.linalg.norm(rows, axis=1, keepdims=True), 1e-12)
+
+
+def configure_environment(args, tmp):
+    from benchmarks.fake_upstreams import start_fake_upstreams
+
+    lastfm_url, google_books_url, upstreams = start_fake_upstreams(args.upstream_latency_ms / 1000)
+    os.environ.update({
+        "MONGO_URL": "mongomock://load-test",
+        "LASTFM_API_URL": lastfm_url,
+        "GOOGLE_BOOKS_API_URL": google_books_url,
+        # The real limiter would cap the Last.fm scenario at 5 requests/s
+        "LASTFM_RATE_LIMIT": str(args.lastfm_rate_limit),
+        "GENRE_ARTIFACT_PATH": os.path.join(tmp, "genre_index.npz"),
+    })
+    for key in ("TAG_CACHE_DIR", "BOOK_CATALOG_DIR"):
+        os.environ.pop(key, None)
+    return upstreams
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(port):
+    import uvicorn
+    from backend.main import app
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+async def seed(client, songs):
+    await client.post("/auth/register", json={"username": "load", "email": "load@example.com", "password": "load-test"})
+    response = await client.post("/songs/bulk", json=[
+        {"title": f"Song {i}", "artist": f"Artist {i % 50}"} for i in range(songs)
+    ])
+    response.raise_for_status()
+    song_ids = [result["song_id"] for result in response.json()["results"] if result["status"] == "added"]
+    # Let the background materialization of the new songs finish
+    await asyncio.sleep(1)
+    return song_ids
+
+
+def make_request(scenario, i, song_ids, distinct_tracks):
+    if scenario == "songs":
+        return "GET", "/songs/?limit=100", None
+    if scenario == "track_metadata":
+        n = i % distinct_tracks
+        return "GET", f"/lastfm/track_metadata/?artist=Load%20Artist%20{n % 97}&track=Load%20Track%20{n}", None
+    if scenario == "recommendations":
+        return "GET", f"/api/books/recommendations/{song_ids[i % len(song_ids)]}", None
+    return "POST", "/auth/login", {"email": "load@example.com", "password": "load-test"}
+
+
+async def run_scenario(client, scenario, concurrency, total, song_ids, distinct_tracks):
+    latencies, errors = [], 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, url, body = make_request(scenario, i, song_ids, distinct_tracks)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, json=body)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                errors += 1
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "rps": total / elapsed,
+    }
+
+
+async def drive(base_url, args):
+    import httpx
+
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        song_ids = await seed(client, args.songs)
+        results = []
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = await run_scenario(client, scenario, concurrency, args.requests, song_ids, args.distinct_tracks)
+                print(f"{scenario:16s} c={concurrency:<4d} p50={result['p50_ms']:8.2f}ms "
+                      f"p95={result['p95_ms']:8.2f}ms p99={result['p99_ms']:8.2f}ms "
+                      f"{result['rps']:8.1f} req/s errors={result['errors']}")
+                results.append(result)
+        return results
+
+
+def compare(results, baseline_path, tolerance):
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        # Ignore sub-millisecond noise on very fast endpoints
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + tolerance) and result["p95_ms"] - before["p95_ms"] > 1:
+            regressions.append(f"{result['scenario']} c={result['concurrency']}: "
+                               f"p95 {before['p95_ms']:.2f}ms -> {result['p95_ms']:.2f}ms")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test against fake upstreams")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=300, help="requests per scenario and level")
+    parser.add_argument("--songs", type=int, default=200, help="songs seeded before the run")
+    parser.add_argument("--distinct-tracks", type=int, default=1000,
+                        help="distinct Last.fm lookups; fewer means more metadata cache hits")
+    parser.add_argument("--upstream-latency-ms", type=float, default=50)
+    parser.add_argument("--lastfm-rate-limit", type=float, default=10000)
+    parser.add_argument("--real-encoder", action="store_true")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="results file from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 increase, as a fraction")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        upstreams = configure_environment(args, tmp)
+        if not args.real_encoder:
+            import backend.encoder
+            backend.encoder._encoder = StubEncoder()
+
+        port = free_port()
+        server, thread = start_server(port)
+        try:
+            results = asyncio.run(drive(f"http://127.0.0.1:{port}", args))
+        finally:
+            server.should_exit = True
+            thread.join()
+            upstreams.shutdown()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+    if args.baseline:
+        regressions = compare(results, args.baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -104,7 +104,9 @@ document.addEventListener("DOMContentLoaded", function () {
         console.log("Sending payload:", songs); // Debug log
 
         try {
-            const response = await fetch("/songs/", {
+            // The import runs as a background job; progress arrives over
+            // Server-Sent Events while the page stays responsive
+            const response = await fetch("/songs/import/", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify(songs),
@@ -114,11 +116,10 @@ document.addEventListener("DOMContentLoaded", function () {
                 throw new Error("Failed to submit songs");
             }
 
-            const result = await response.json();
-            console.log("API Response:", result); // Debug log
+            const job = await response.json();
+            console.log("Import job:", job); // Debug log
+            showProgress(`Importing ${job.total} songs...`);
 
-            showMessage("Songs added successfully!", "success");
-            
             // Clear the form
             songsContainer.innerHTML = `
                 <div class="song-input">
@@ -131,35 +132,7 @@ document.addEventListener("DOMContentLoaded", function () {
                 </div>
             `;
 
-            // Add the songs to the display list
-            const songsListContainer = document.getElementById("songs-list-container");
-            
-            // Handle the response
-            if (result.songs && Array.isArray(result.songs)) {
-                result.songs.forEach(song => {
-                    console.log("Song Object:", song); // Debug log
-                    if (!song._id) {
-                        console.error("Song ID is missing:", song);
-                        return;
-                    }
-                    const songElement = document.createElement("div");
-                    songElement.className = "song-item";
-                    songElement.innerHTML = `
-                        <div class="song-info">
-                            <span class="song-title">${song.name || ''}</span> by 
-                            <span class="song-artist">${song.artist || ''}</span>
-                        </div>
-                        <a href="/songs/view/${song._id}" class="btn recommendation-btn">
-                            Get Book Recommendations
-                        </a>
-                    `;
-                    songsListContainer.appendChild(songElement);
-                });
-            } else {
-                console.error("Invalid response format:", result);
-                showMessage("Failed to add songs. Invalid response from server.", "error");
-            }
-
+            followImport(job);
         } catch (error) {
             console.error("Error submitting songs:", error);
             console.error("Full error details:", error.message);
@@ -167,6 +140,70 @@ document.addEventListener("DOMContentLoaded", function () {
         }
     });
 
+    // Stream an import job's progress until it finishes
+    function followImport(job) {
+        const events = new EventSource(job.events_url);
+
+        events.addEventListener("progress", (event) => {
+            const progress = JSON.parse(event.data);
+            showProgress(`Imported ${progress.processed} of ${progress.total} songs` +
+                (progress.failed ? ` (${progress.failed} failed)` : "") + "...");
+        });
+
+        events.addEventListener("done", (event) => {
+            // Close before the server ends the stream, or EventSource reconnects
+            events.close();
+            const result = JSON.parse(event.data);
+            console.log("Import finished:", result); // Debug log
+
+            const failures = result.tracks.filter(t => t.status === "failed");
+            if (result.status === "failed") {
+                showMessage(`Import stopped after ${result.processed} of ${result.total} songs: ${result.error}`, "error");
+            } else if (failures.length) {
+                console.warn("Songs that failed to import:", failures);
+                showMessage(`Added ${result.added} of ${result.total} songs. ` +
+                    `Failed: ${failures.map(t => t.title || "unknown").join(", ")}`, "error");
+            } else {
+                showMessage("Songs added successfully!", "success");
+            }
+
+            result.tracks.filter(t => t.status === "added").forEach(addSongItem);
+        });
+
+        events.addEventListener("error", (event) => {
+            // Transport errors are retried by EventSource itself; an "error"
+            // event with data means the job is gone
+            if (event.data) {
+                events.close();
+                showMessage("Import job not found.", "error");
+            }
+        });
+    }
+
+    // Add an imported song to the display list
+    function addSongItem(track) {
+        const songsListContainer = document.getElementById("songs-list-container");
+        const songElement = document.createElement("div");
+        songElement.className = "song-item";
+        songElement.innerHTML = `
+            <div class="song-info">
+                <span class="song-title">${track.name || ''}</span> by 
+                <span class="song-artist">${track.artist || ''}</span>
+            </div>
+            <a href="/songs/view/${track.song_id}" class="btn recommendation-btn">
+                Get Book Recommendations
+            </a>
+        `;
+        songsListContainer.appendChild(songElement);
+    }
+
+    // A message that stays up while the import is running
+    function showProgress(message) {
+        messageBox.textContent = message;
+        messageBox.className = "message info";
+        messageBox.classList.remove("hidden");
+    }
+
     // Show message
     function showMessage(message, type) {
         messageBox.textContent = message;
@@ -0,0 +1,17 @@
+import os
+
+# Every test runs against an in-memory mongomock database; install
+# requirements-dev.txt, then run python -m pytest -q tests
+os.environ.setdefault("MONGO_URL", "mongomock://tests")
+
+import pytest
+
+from backend.db import get_db
+
+
+@pytest.fixture
+def db():
+    database = get_db()
+    yield database
+    for name in database.list_collection_names():
+        database.drop_collection(name)
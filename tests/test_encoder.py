@@ -0,0 +1,29 @@
+import pytest
+
+from backend import encoder
+
+
+def test_stamp_tells_backends_apart():
+    assert encoder.encoder_stamp("torch") == encoder.MODEL_NAME
+    assert encoder.encoder_stamp("torch-int8") == f"{encoder.MODEL_NAME}:torch-int8"
+    assert encoder.encoder_stamp("onnx").startswith(f"{encoder.MODEL_NAME}:onnx:")
+
+
+def _cached(filename):
+    from huggingface_hub import try_to_load_from_cache
+    return isinstance(try_to_load_from_cache(encoder.MODEL_REPO, filename), str)
+
+
+def test_onnx_matches_torch():
+    pytest.importorskip("onnxruntime")
+    pytest.importorskip("sentence_transformers")
+    if not encoder.ENCODER_ONNX_PATH and not _cached(encoder.ENCODER_ONNX_FILE):
+        pytest.skip(f"{encoder.ENCODER_ONNX_FILE} of {encoder.MODEL_REPO} is not downloaded")
+    if not _cached("config.json"):
+        pytest.skip(f"{encoder.MODEL_REPO} weights are not downloaded")
+
+    mean, worst = encoder.parity(
+        encoder.create_encoder("onnx"), encoder.create_encoder("torch"), encoder.parity_texts()
+    )
+    assert mean >= encoder.PARITY_THRESHOLD
+    assert worst > 0.95
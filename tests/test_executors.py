@@ -0,0 +1,25 @@
+import threading
+
+import numpy as np
+
+from backend.executors import EmbeddingBatcher
+
+
+def test_batcher_skips_cancelled_requests():
+    release = threading.Event()
+    encoded = []
+
+    def encode(texts):
+        release.wait(5)
+        encoded.append(list(texts))
+        return np.ones((len(texts), 2), dtype=np.float32)
+
+    batcher = EmbeddingBatcher(encode, max_batch=64, max_wait=0.05)
+    first = batcher.submit(["a"])
+    cancelled = batcher.submit(["b"])
+    assert cancelled.cancel()
+    release.set()
+    assert first.result(5).shape == (1, 2)
+    # The worker survives and serves later requests
+    assert batcher.submit(["c"]).result(5).shape == (1, 2)
+    assert "b" not in [text for texts in encoded for text in texts]
@@ -0,0 +1,33 @@
+import os
+
+import pytest
+
+from backend.indexes import HOT_QUERIES, ensure_indexes, verify_query_plans
+
+
+def _query_fields(query, sort):
+    fields = {key for key in query if not key.startswith("$")}
+    return fields | {key for key, _ in sort or []}
+
+
+# mongomock has no query planner, so this checks the part it can: every hot
+# query filters or sorts on the leading key of an index that was created
+def test_hot_queries_have_an_index(db):
+    ensure_indexes(db)
+    for collection_name, query, sort in HOT_QUERIES:
+        leading = {next(iter(index["key"]))[0] for index in db[collection_name].index_information().values()}
+        assert leading & _query_fields(query, sort), f"{collection_name}.find({query}, sort={sort})"
+
+
+# The real explain-plan check needs a MongoDB server, e.g.
+# TEST_MONGO_URL=mongodb://localhost:27017 MONGO_TLS=false
+@pytest.mark.skipif(not os.getenv("TEST_MONGO_URL"), reason="TEST_MONGO_URL is not set")
+def test_hot_queries_avoid_collection_scans():
+    from pymongo import MongoClient
+
+    db = MongoClient(os.environ["TEST_MONGO_URL"])["music_book_db_tests"]
+    try:
+        ensure_indexes(db)
+        assert verify_query_plans(db) == []
+    finally:
+        db.client.drop_database(db.name)
@@ -0,0 +1,29 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from backend.pagination import CursorError, encode_cursor, keyset_filter
+
+
+def test_id_cursor_selects_later_ids():
+    doc = {"_id": ObjectId()}
+    assert keyset_filter(encode_cursor(doc, "_id"), "_id") == {"_id": {"$gt": doc["_id"]}}
+
+
+def test_created_at_cursor_breaks_ties_on_id():
+    doc = {"_id": ObjectId(), "created_at": datetime(2024, 5, 1, 12, 30, 15, 250000)}
+    assert keyset_filter(encode_cursor(doc, "created_at"), "created_at") == {"$or": [
+        {"created_at": {"$gt": doc["created_at"]}},
+        {"created_at": doc["created_at"], "_id": {"$gt": doc["_id"]}},
+    ]}
+
+
+def test_no_cursor_is_the_first_page():
+    assert keyset_filter(None, "_id") == {}
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30", encode_cursor({"_id": ObjectId()}, "_id")[:-4]])
+def test_bad_cursor_is_rejected(cursor):
+    with pytest.raises(CursorError):
+        keyset_filter(cursor, "created_at")
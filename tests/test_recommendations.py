@@ -0,0 +1,16 @@
+from backend.recommendations import blend_allocation
+
+
+def test_blend_splits_by_weight_with_largest_remainder():
+    distribution = [("Fantasy", 0.6), ("Horror", 0.3), ("Romance", 0.1)]
+    assert blend_allocation(distribution, 5) == [("Fantasy", 3), ("Horror", 2)]
+
+
+def test_blend_always_fills_max_results():
+    distribution = [("Fantasy", 0.34), ("Horror", 0.33), ("Romance", 0.33)]
+    for max_results in range(1, 11):
+        assert sum(n for _, n in blend_allocation(distribution, max_results)) == max_results
+
+
+def test_blend_falls_back_to_the_top_genre():
+    assert blend_allocation([("Fantasy", 0.1), ("Horror", 0.1)], 5) == [("Fantasy", 5)]
@@ -0,0 +1,48 @@
+import time
+
+import pytest
+
+from backend.resilience import CircuitBreaker, CircuitOpenError
+
+
+def _fail(breaker):
+    with pytest.raises(RuntimeError):
+        with breaker.guard():
+            raise RuntimeError("upstream down")
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test_opens", failure_threshold=2, reset_timeout=60)
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        with breaker.guard():
+            pass
+    assert breaker.rejected == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test_resets", failure_threshold=2)
+    _fail(breaker)
+    with breaker.guard():
+        pass
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_trial_call_closes_or_reopens():
+    breaker = CircuitBreaker("test_trial", failure_threshold=1, reset_timeout=0.01)
+    _fail(breaker)
+    time.sleep(0.02)
+    _fail(breaker)
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.02)
+    with breaker.guard():
+        # Only the one trial call goes through while half-open
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        with pytest.raises(CircuitOpenError):
+            with breaker.guard():
+                pass
+    assert breaker.state == CircuitBreaker.CLOSED
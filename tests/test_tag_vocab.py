@@ -0,0 +1,32 @@
+import asyncio
+
+from backend.tag_vocab import count_songs, retag_counts
+
+
+def _counts(db):
+    return {doc["_id"]: doc["songs"] for doc in db["tags"].find()}
+
+
+def test_retag_moves_counts_of_every_entry(db):
+    db["tags"].insert_many([{"_id": i, "tag": tag, "songs": 3} for i, tag in enumerate(["rock", "indie", "jazz"], 1)])
+    asyncio.run(retag_counts([1, 2], [2, 3], 3))
+    assert _counts(db) == {1: 0, 2: 3, 3: 6}
+
+
+def test_retag_of_an_untagged_track(db):
+    db["tags"].insert_one({"_id": 1, "tag": "rock", "songs": 0})
+    asyncio.run(retag_counts(None, [1], 2))
+    assert _counts(db) == {1: 2}
+
+
+def test_count_songs_counts_each_listed_track(db):
+    db["tags"].insert_many([{"_id": 1, "tag": "rock", "songs": 0}, {"_id": 2, "tag": "jazz", "songs": 0}])
+    asyncio.run(count_songs([{"tag_ids": [1, 2]}, {"tag_ids": [1]}, {}]))
+    assert _counts(db) == {1: 2, 2: 1}
+
+
+def test_vocabulary_and_genre_scoring_share_the_tag_form():
+    from backend import genres, tag_vocab
+
+    assert tag_vocab.normalize_tag is genres.normalize_tag
+    assert genres.normalize_tag("  Hip  HOP ") == "hip hop"
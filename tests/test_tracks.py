@@ -0,0 +1,13 @@
+from backend.tracks import track_key
+
+
+def test_key_ignores_case_spacing_and_featured_artists():
+    key = track_key("Daft Punk", "Get Lucky")
+    assert track_key("  daft   PUNK ", "get lucky") == key
+    assert track_key("Daft Punk", "Get Lucky (feat. Pharrell Williams)") == key
+    assert track_key("Daft Punk", "Get Lucky ft. Pharrell Williams") == key
+
+
+def test_key_separates_artist_from_title():
+    assert track_key("a b", "c") != track_key("a", "b c")
+    assert track_key("Daft Punk", "Get Lucky") != track_key("Get Lucky", "Daft Punk")